@@ -0,0 +1,719 @@
+"""Benchmark suite and load-test harness for the analysis endpoints.
+
+Generates seeded synthetic inputs (feature matrices, text corpora, series
+batches) at a few sizes and times every analysis two ways:
+
+* ``inproc``: the registered handler function is called directly, with the
+  matrix already a float64 array, so only the analysis itself is measured.
+* ``http``: a local uvicorn serves ``main:app`` and requests go through the
+  whole stack (JSON parse, pool hand-off, serialization). The result cache is
+  bypassed.
+
+For each case it records throughput, latency percentiles and peak RSS (of
+this process for ``inproc``, of the server for ``http``) into a JSON file.
+That file can be compared with an earlier run::
+
+    python benchmark.py run --sizes small medium --out baseline.json
+    python benchmark.py run --out current.json --compare baseline.json
+    python benchmark.py compare baseline.json current.json --threshold 0.15
+
+``accuracy`` runs each numeric case on the same inputs with ``dtype=float64``
+and ``dtype=float32`` and reports how far the float32 results drift (see
+``ACCURACY_FIELDS``), with the time and input size of each::
+
+    python benchmark.py accuracy --sizes small medium --out accuracy.json
+
+Runs fully offline; only the standard library, the app's own dependencies
+and uvicorn are used. Compare runs from the same machine only.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+SEED = 1234
+
+# Input dimensions per size tier.
+SIZES = {
+    "small": {"rows": 1_000, "features": 8, "docs": 200, "series": 100, "length": 200, "values": 1_000},
+    "medium": {"rows": 20_000, "features": 16, "docs": 2_000, "series": 2_000, "length": 365, "values": 20_000},
+    "large": {"rows": 100_000, "features": 32, "docs": 10_000, "series": 10_000, "length": 730, "values": 200_000},
+}
+
+
+# --- Synthetic data -------------------------------------------------------
+
+def blobs(rows: int, features: int, centers: int = 6, seed: int = SEED) -> np.ndarray:
+    """Gaussian clusters around well separated centers."""
+    rng = np.random.default_rng(seed)
+    middles = rng.normal(scale=6.0, size=(centers, features))
+    return middles[rng.integers(centers, size=rows)] + rng.normal(size=(rows, features))
+
+
+def linear_target(X: np.ndarray, seed: int = SEED) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    return X @ rng.normal(size=X.shape[1]) + 0.5 * X[:, 0] ** 2 + rng.normal(scale=0.1, size=len(X))
+
+
+def with_missing(X: np.ndarray, fraction: float = 0.01, seed: int = SEED) -> np.ndarray:
+    rng = np.random.default_rng(seed + 2)
+    X = X.copy()
+    X[rng.random(X.shape) < fraction] = np.nan
+    return X
+
+
+def corpus(docs: int, topics: int = 8, vocabulary: int = 2_000, words: int = 60, seed: int = SEED) -> List[str]:
+    """Documents drawn from Zipf-weighted per-topic vocabularies."""
+    rng = np.random.default_rng(seed + 3)
+    terms = np.array([f"term{i:04d}" for i in range(vocabulary)])
+    weights = 1.0 / np.arange(1, vocabulary // topics + 1)
+    weights /= weights.sum()
+    texts = []
+    for topic in rng.integers(topics, size=docs):
+        own = rng.choice(len(weights), size=words, p=weights) + topic * len(weights)
+        shared = rng.integers(vocabulary, size=words // 4)
+        texts.append(" ".join(terms[np.concatenate([own, shared])]))
+    return texts
+
+
+def series(count: int, length: int, period: int = 12, seed: int = SEED) -> np.ndarray:
+    """Trend + seasonal + noise series, one per row."""
+    rng = np.random.default_rng(seed + 4)
+    t = np.arange(length)
+    trend = rng.normal(scale=0.05, size=(count, 1)) * t
+    season = rng.uniform(1, 5, size=(count, 1)) * np.sin(2 * np.pi * t / period + rng.uniform(0, np.pi, size=(count, 1)))
+    return 100 + trend + season + rng.normal(size=(count, length))
+
+
+# --- Cases ----------------------------------------------------------------
+
+class Case:
+    """One benchmarked request: a registered analysis and/or an HTTP path.
+
+    ``build(size)`` returns ``(payload, rows)``; ``rows`` is the number of
+    input records, used for the rows/second figure.
+    """
+
+    def __init__(self, name: str, path: str, build: Callable[[dict], Tuple[dict, int]], analysis: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self.build = build
+        self.analysis = analysis
+
+
+def _matrix(field: str = "data", target: Optional[str] = None, missing: bool = False, **params: Any):
+    def build(size: dict) -> Tuple[dict, int]:
+        X = blobs(size["rows"], size["features"])
+        payload = {field: with_missing(X) if missing else X, **params}
+        if target:
+            payload[target] = linear_target(X)
+        return payload, size["rows"]
+    return build
+
+
+def _texts(**params: Any):
+    return lambda size: ({"texts": corpus(size["docs"]), **params}, size["docs"])
+
+
+def _series_batch(**params: Any):
+    return lambda size: ({"data": series(size["series"], size["length"]), **params}, size["series"])
+
+
+def _single_series(size: dict) -> Tuple[dict, int]:
+    return {"data": series(1, size["length"] * 10)[0], "forecast_steps": 30, "seasonal_period": 12}, size["length"] * 10
+
+
+def _quantum(size: dict) -> Tuple[dict, int]:
+    return {"num_values": size["values"], "max_value": 1000}, size["values"]
+
+
+CASES = [
+    Case("clustering.kmeans", "/api/clustering/analyze", _matrix(algorithm="kmeans", n_clusters=6), "clustering"),
+    Case("clustering.dbscan", "/api/clustering/analyze", _matrix(algorithm="dbscan", eps=0.8), "clustering"),
+    Case("clustering.hierarchical", "/api/clustering/analyze", _matrix(algorithm="hierarchical", n_clusters=6), "clustering"),
+    Case("anomaly", "/api/anomaly/detect", _matrix(contamination=0.05), "anomaly"),
+    Case("regression.linear", "/api/regression/analyze", _matrix("X", "y", algorithm="linear"), "regression"),
+    Case("regression.polynomial", "/api/regression/analyze", _matrix("X", "y", algorithm="polynomial"), "regression"),
+    Case("regression.ridge", "/api/regression/analyze", _matrix("X", "y", algorithm="ridge"), "regression"),
+    Case(
+        "regression.scalable", "/api/regression/scalable",
+        _matrix("X", "y", algorithm="ridge", alphas=[0.01, 0.1, 1.0, 10.0]), "regression_scalable",
+    ),
+    Case("correlation.pearson", "/api/correlation/analyze", _matrix(method="pearson"), "correlation"),
+    Case("correlation.spearman", "/api/correlation/analyze", _matrix(method="spearman"), "correlation"),
+    Case("timeseries", "/api/timeseries/analyze", _single_series, "timeseries"),
+    Case("timeseries.batch", "/api/timeseries/batch", _series_batch(seasonal_period=12), "timeseries_batch"),
+    Case("lda", "/api/lda/analyze", _texts(n_topics=8, vectorizer="count"), "lda"),
+    Case("quantum", "/api/quantum/generate", _quantum, "quantum"),
+    Case("data.clean", "/api/data/clean", _matrix(missing=True, handle_missing="median", remove_outliers=True), "data_clean"),
+    Case("data.transform", "/api/data/transform", _matrix(method="standardize"), "data_transform"),
+    Case("pipeline", "/api/pipeline/run", _matrix(
+        missing=True,
+        steps=[{"op": "impute", "method": "mean"}, {"op": "outliers"}, {"op": "scale"}],
+        model={"analysis": "clustering", "params": {"n_clusters": 6}},
+    )),
+    Case("batch", "/api/batch", _matrix(
+        target="y",
+        specs=[
+            {"analysis": "clustering", "params": {"n_clusters": 6}},
+            {"analysis": "anomaly"},
+            {"analysis": "correlation"},
+            {"analysis": "regression", "params": {"algorithm": "ridge"}},
+        ],
+    )),
+]
+
+
+# --- Measurement ----------------------------------------------------------
+
+def _reset_peak_rss(pid: int) -> bool:
+    """Reset the kernel's RSS high-water mark of ``pid`` (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss(pid: int) -> Optional[int]:
+    """Peak resident set size of ``pid`` in bytes (``VmHWM``)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid == os.getpid():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+def settle(pool_stats: Callable[[], dict], timeout: float = 120.0) -> None:
+    """Wait for the QRNG refill thread to top the entropy pool back up.
+
+    Once the quantum case has drawn from it, the pool refills on a background
+    thread that would otherwise compete with the cases timed after it.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = pool_stats()
+        if not stats["bytes_served"] or stats["available_bytes"] >= stats["capacity_bytes"]:
+            return
+        time.sleep(0.2)
+
+
+def summarize(latencies: List[float], wall: float, rows: int) -> dict:
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / wall, 4) if wall > 0 else None,
+        "rows_per_second": round(rows * len(latencies) / wall, 1) if wall > 0 else None,
+        "latency_ms": {
+            "mean": round(float(ms.mean()), 3),
+            "min": round(float(ms.min()), 3),
+            "p50": round(float(np.percentile(ms, 50)), 3),
+            "p90": round(float(np.percentile(ms, 90)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "max": round(float(ms.max()), 3),
+        },
+    }
+
+
+def _jsonable(payload: dict) -> dict:
+    return {k: v.tolist() if isinstance(v, np.ndarray) else v for k, v in payload.items()}
+
+
+def _inproc_request(case: Case, payload: dict):
+    """The registered analysis of ``case`` and its request, with the arrays passed as-is."""
+    from modules import jobs, loader
+
+    loader.load()  # imports the analysis modules, which register their analyses
+    entry = jobs.get_analysis(case.analysis)
+    arrays = {k: v for k, v in payload.items() if isinstance(v, np.ndarray)}
+    return entry, entry.request_model.model_validate({**payload, **{k: [] for k in arrays}}).model_copy(update=arrays)
+
+
+def run_inproc(case: Case, payload: dict, rows: int, repeat: int, warmup: int, min_time: float) -> dict:
+    """Time the registered handler called directly in this process.
+
+    Runs at least ``repeat`` times and for at least ``min_time`` seconds, so
+    sub-millisecond cases get enough samples for stable percentiles.
+    """
+    entry, request = _inproc_request(case, payload)
+
+    def call() -> None:
+        result = entry.fn(request)
+        if not result.get("success"):
+            raise RuntimeError(f"{case.name}: {result.get('error')}")
+
+    for _ in range(warmup):
+        call()
+    tracked = _reset_peak_rss(os.getpid())
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < repeat or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - t0)
+    summary = summarize(latencies, time.perf_counter() - started, rows)
+    summary["peak_rss_bytes"] = _peak_rss(os.getpid())
+    summary["rss_scope"] = "case" if tracked else "process"
+    return summary
+
+
+class Server:
+    """``main:app`` under uvicorn in a child process, on a free local port."""
+
+    def __init__(self, workers: int = 1, env: Optional[Dict[str, str]] = None):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._scratch = tempfile.TemporaryDirectory(prefix="necromancer-bench-")
+        self.env = {
+            **os.environ,
+            # Keep the benchmark's uploads and models out of the real stores.
+            "DATASET_DIR": os.path.join(self._scratch.name, "datasets"),
+            "MODEL_DIR": os.path.join(self._scratch.name, "models"),
+            **(env or {}),
+        }
+        self.workers = workers
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "Server":
+        command = [
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+            "--log-level", "warning", "--workers", str(self.workers),
+        ]
+        self.process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=self.env)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {self.process.returncode}")
+            try:
+                urllib.request.urlopen(f"{self.url}/health", timeout=1).read()
+                return self
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("uvicorn did not start within 60s")
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self._scratch.cleanup()
+
+    def pids(self) -> List[int]:
+        """The server process and, with ``--workers > 1``, its worker children."""
+        pids = [self.process.pid]
+        try:
+            with open(f"/proc/{self.process.pid}/task/{self.process.pid}/children") as f:
+                pids += [int(pid) for pid in f.read().split()]
+        except OSError:
+            pass
+        return pids
+
+
+def _get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def run_http(
+    server: Server, case: Case, payload: dict, rows: int, repeat: int, warmup: int, concurrency: int, min_time: float
+) -> dict:
+    """Send rounds of ``repeat`` requests from ``concurrency`` client threads until ``min_time`` has passed."""
+    body = json.dumps(_jsonable(payload)).encode()
+    headers = {"Content-Type": "application/json", "X-Cache-Bypass": "1"}
+    errors: List[str] = []
+
+    def send() -> float:
+        t0 = time.perf_counter()
+        request = urllib.request.Request(server.url + case.path, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=3600) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            errors.append(f"HTTP {e.code}: {e.read()[:200]!r}")
+        return time.perf_counter() - t0
+
+    for _ in range(warmup):
+        send()
+    if errors:
+        raise RuntimeError(f"{case.name}: {errors[0]}")
+    tracked = all([_reset_peak_rss(pid) for pid in server.pids()])
+    started = time.perf_counter()
+    latencies: List[float] = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while not latencies or time.perf_counter() - started < min_time:
+            latencies += pool.map(lambda _: send(), range(repeat))
+    summary = summarize(latencies, time.perf_counter() - started, rows)
+    peaks = [_peak_rss(pid) for pid in server.pids()]
+    summary["peak_rss_bytes"] = max([p for p in peaks if p is not None], default=None)
+    summary["rss_scope"] = "case" if tracked else "process"
+    summary["request_bytes"] = len(body)
+    summary["errors"] = len(errors)
+    summary["concurrency"] = concurrency
+    return summary
+
+
+# --- Reports --------------------------------------------------------------
+
+def environment() -> dict:
+    versions = {}
+    for name in ("numpy", "scipy", "sklearn", "pandas", "fastapi", "pydantic", "uvicorn", "qiskit"):
+        try:
+            versions[name] = __import__(name).__version__
+        except Exception:
+            versions[name] = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "git_commit": commit,
+        "packages": versions,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_ms: float = 1.0) -> Tuple[List[dict], List[str]]:
+    """Match cases by key; a case regresses when p50 latency grows or throughput drops by > ``threshold``.
+
+    Changes of less than ``min_ms`` in p50 are treated as timer noise.
+    """
+    rows = []
+    for key, now in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None:
+            continue
+        p50 = now["latency_ms"]["p50"] / before["latency_ms"]["p50"] if before["latency_ms"]["p50"] else None
+        rps = now["throughput_rps"] / before["throughput_rps"] if before["throughput_rps"] else None
+        rss = (
+            now["peak_rss_bytes"] / before["peak_rss_bytes"]
+            if now.get("peak_rss_bytes") and before.get("peak_rss_bytes") else None
+        )
+        slower = now["latency_ms"]["p50"] - before["latency_ms"]["p50"] >= min_ms
+        regressed = slower and (
+            (p50 is not None and p50 > 1 + threshold) or (rps is not None and rps < 1 / (1 + threshold))
+        )
+        rows.append({"case": key, "p50_ratio": p50, "throughput_ratio": rps, "rss_ratio": rss, "regressed": regressed})
+    notes = []
+    if baseline.get("environment", {}).get("platform") != current.get("environment", {}).get("platform"):
+        notes.append("baseline was recorded on a different platform; ratios are not comparable")
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        notes.append(f"not in this run: {', '.join(missing)}")
+    return rows, notes
+
+
+def print_results(results: Dict[str, dict]) -> None:
+    print(f"{'case':<44} {'req/s':>9} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'peak RSS MB':>12}")
+    for key, r in results.items():
+        rss = f"{r['peak_rss_bytes'] / 2 ** 20:.1f}" if r.get("peak_rss_bytes") else "-"
+        lat = r["latency_ms"]
+        print(f"{key:<44} {r['throughput_rps']:>9.3f} {lat['p50']:>10.2f} {lat['p90']:>10.2f} {lat['p99']:>10.2f} {rss:>12}")
+
+
+def print_comparison(rows: List[dict], notes: List[str], threshold: float) -> None:
+    def ratio(value: Optional[float]) -> str:
+        return f"{value:.3f}x" if value is not None else "-"
+
+    print(f"{'case':<44} {'p50':>9} {'req/s':>9} {'peak RSS':>9}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        print(
+            f"{row['case']:<44} {ratio(row['p50_ratio']):>9} {ratio(row['throughput_ratio']):>9} "
+            f"{ratio(row['rss_ratio']):>9}{flag}"
+        )
+    for note in notes:
+        print(f"note: {note}")
+    print(f"{sum(r['regressed'] for r in rows)} of {len(rows)} cases regressed by more than {threshold:.0%}")
+
+
+# --- Precision ------------------------------------------------------------
+
+# Result fields compared between dtype=float64 and dtype=float32, and how:
+#   rel   - max |f32 - f64| / max |f64| over the field (scale-free)
+#   abs   - max |f32 - f64|
+#   match - fraction of entries equal up to float32 rounding (flags, selected grid values)
+#   ari   - adjusted Rand index of the two labelings (1.0: same partition)
+#   pairs - overlap of the reported (feature1, feature2) pairs
+_REGRESSION_FIELDS = [("fitted_values", "rel"), ("coefficients", "rel"), ("r2_score", "abs")]
+_CORRELATION_FIELDS = [("correlation_matrix", "abs"), ("top_correlations", "pairs")]
+ACCURACY_FIELDS = {
+    "clustering.kmeans": [("labels", "ari"), ("inertia", "rel")],
+    "clustering.dbscan": [("labels", "ari")],
+    "clustering.hierarchical": [("labels", "ari")],
+    "anomaly": [("anomalies.score", "rel"), ("anomalies.is_anomaly", "match")],
+    "regression.linear": _REGRESSION_FIELDS,
+    "regression.polynomial": _REGRESSION_FIELDS,
+    "regression.ridge": _REGRESSION_FIELDS,
+    "regression.scalable": [("coefficients", "rel"), ("r2_score", "abs")],
+    "correlation.pearson": _CORRELATION_FIELDS,
+    "correlation.spearman": _CORRELATION_FIELDS,
+    "timeseries": [("trend", "rel"), ("moving_average", "rel"), ("forecast", "rel")],
+    "timeseries.batch": [("forecast", "rel"), ("confidence_upper", "rel"), ("alpha", "match"), ("gamma", "match")],
+    "data.clean": [("cleaned_data", "rel"), ("cleaned_shape", "abs")],
+    "data.transform": [("transformed_data", "abs")],
+}
+
+
+def _field(data: dict, name: str) -> Any:
+    """``data[name]``; ``"a.b"`` reads column ``b`` of the ``Records`` in ``data["a"]``."""
+    head, _, column = name.partition(".")
+    value = data[head]
+    return value.columns[column] if column else value
+
+
+def _difference(reference: Any, value: Any, metric: str) -> Optional[float]:
+    """How far ``value`` (float32 run) is from ``reference`` (float64 run); ``None`` if shapes differ."""
+    if metric == "pairs":
+        expected = {(row["feature1"], row["feature2"]) for row in reference}
+        found = {(row["feature1"], row["feature2"]) for row in value}
+        return len(expected & found) / max(len(expected), 1)
+    a, b = np.atleast_1d(np.asarray(reference, dtype=float)), np.atleast_1d(np.asarray(value, dtype=float))
+    if a.shape != b.shape:
+        return None
+    if metric == "ari":
+        from sklearn.metrics import adjusted_rand_score
+
+        return float(adjusted_rand_score(a, b))
+    if metric == "match":
+        return float(np.mean(np.isclose(a, b, rtol=1e-6, atol=0.0, equal_nan=True))) if a.size else 1.0
+    error = np.abs(a - b)
+    error[np.isnan(a) & np.isnan(b)] = 0.0
+    worst = float(np.max(error)) if error.size else 0.0
+    if metric == "abs":
+        return worst
+    scale = float(np.nanmax(np.abs(a))) if a.size else 0.0
+    return worst / scale if scale > 0 else worst
+
+
+def _run_once(case: Case, payload: dict) -> Tuple[dict, float]:
+    """One direct handler call: the result ``data`` and its seconds."""
+    entry, request = _inproc_request(case, payload)
+    started = time.perf_counter()
+    result = entry.fn(request)
+    seconds = time.perf_counter() - started
+    if not result.get("success"):
+        raise RuntimeError(f"{case.name}: {result.get('error')}")
+    return result["data"], seconds
+
+
+def compare_precision(case: Case, payload: dict) -> dict:
+    """Run ``case`` once per dtype on the same payload and measure the float32 drift."""
+    _run_once(case, payload)  # warm-up: first-call imports would otherwise land on float64
+    runs = {}
+    for dtype in ("float64", "float32"):
+        data, seconds = _run_once(case, {**payload, "dtype": dtype})
+        # The input arrays at the working precision (the handler's own temporaries scale with it).
+        nbytes = sum(v.size * np.dtype(dtype).itemsize for v in payload.values() if isinstance(v, np.ndarray))
+        runs[dtype] = {"data": data, "seconds": round(seconds, 6), "input_bytes": nbytes}
+    errors = {}
+    for name, metric in ACCURACY_FIELDS[case.name]:
+        reference, value = (_field(runs[dtype]["data"], name) for dtype in ("float64", "float32"))
+        errors[name] = {"metric": metric, "value": _difference(reference, value, metric)}
+    return {
+        **{dtype: {key: run[key] for key in ("seconds", "input_bytes")} for dtype, run in runs.items()},
+        "errors": errors,
+    }
+
+
+def print_accuracy(results: Dict[str, dict]) -> None:
+    mb = 2 ** 20
+    print(f"{'case':<34} {'field':<22} {'metric':<6} {'value':>10} {'f64 ms':>9} {'f32 ms':>9} {'f64 MB':>8} {'f32 MB':>8}")
+    for key, row in results.items():
+        for position, (name, error) in enumerate(row["errors"].items()):
+            value = "shape!=" if error["value"] is None else f"{error['value']:.3g}"
+            timing = ""
+            if position == 0:
+                f64, f32 = row["float64"], row["float32"]
+                timing = (f" {f64['seconds'] * 1000:>9.1f} {f32['seconds'] * 1000:>9.1f}"
+                          f" {f64['input_bytes'] / mb:>8.1f} {f32['input_bytes'] / mb:>8.1f}")
+            print(f"{key if position == 0 else '':<34} {name:<22} {error['metric']:<6} {value:>10}{timing}")
+
+
+def command_accuracy(args: argparse.Namespace) -> int:
+    cases = [case for case in _select(args.cases) if case.name in ACCURACY_FIELDS]
+    results: Dict[str, dict] = {}
+    scratch = tempfile.TemporaryDirectory(prefix="necromancer-accuracy-")
+    os.environ.setdefault("MODEL_DIR", scratch.name)
+    try:
+        for size_name in args.sizes:
+            for case in cases:
+                payload, rows = case.build(SIZES[size_name])
+                key = f"{case.name}/{size_name}"
+                print(f"comparing {key}", file=sys.stderr, flush=True)
+                try:
+                    results[key] = {"case": case.name, "size": size_name, "rows": rows, **compare_precision(case, payload)}
+                except Exception as e:
+                    print(f"  failed: {e}", file=sys.stderr)
+    finally:
+        scratch.cleanup()
+
+    report = {
+        "format": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+        "config": {"sizes": {name: SIZES[name] for name in args.sizes}, "seed": SEED},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print_accuracy(results)
+    print(f"wrote {args.out}")
+    return 0
+
+
+# --- CLI ------------------------------------------------------------------
+
+def _select(patterns: Optional[List[str]]) -> List[Case]:
+    if not patterns:
+        return CASES
+    chosen = [c for c in CASES if any(c.name == p or c.name.startswith(p + ".") for p in patterns)]
+    if not chosen:
+        raise SystemExit(f"No case matches {patterns}; available: {', '.join(c.name for c in CASES)}")
+    return chosen
+
+
+def command_run(args: argparse.Namespace) -> int:
+    cases = _select(args.cases)
+    results: Dict[str, dict] = {}
+    scratch = tempfile.TemporaryDirectory(prefix="necromancer-bench-")
+    # In-process runs import ``main``; keep their models out of the real store.
+    os.environ.setdefault("MODEL_DIR", scratch.name)
+    server = Server(workers=args.workers) if "http" in args.modes else None
+    if server:
+        server.__enter__()
+    try:
+        for size_name in args.sizes:
+            size = SIZES[size_name]
+            for case in cases:
+                payload, rows = case.build(size)
+                for mode in args.modes:
+                    if mode == "inproc" and case.analysis is None:
+                        continue  # composite endpoints only run over HTTP
+                    key = f"{case.name}/{size_name}/{mode}"
+                    print(f"running {key}", file=sys.stderr, flush=True)
+                    try:
+                        if mode == "inproc":
+                            result = run_inproc(case, payload, rows, args.repeat, args.warmup, args.min_time)
+                        else:
+                            result = run_http(
+                                server, case, payload, rows, args.repeat, args.warmup, args.concurrency, args.min_time
+                            )
+                    except Exception as e:
+                        print(f"  failed: {e}", file=sys.stderr)
+                        continue
+                    results[key] = {"case": case.name, "size": size_name, "mode": mode, "rows": rows, **result}
+                    if mode == "inproc":
+                        from modules import quantum
+
+                        settle(quantum.pool.stats)
+                    else:
+                        settle(lambda: _get_json(server.url + "/api/quantum/pool")["data"])
+    finally:
+        if server:
+            server.__exit__()
+        scratch.cleanup()
+
+    report = {
+        "format": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+        "config": {
+            "sizes": {name: SIZES[name] for name in args.sizes}, "modes": args.modes, "repeat": args.repeat,
+            "min_time": args.min_time, "warmup": args.warmup, "concurrency": args.concurrency,
+            "workers": args.workers, "seed": SEED,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print_results(results)
+    print(f"wrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            rows, notes = compare(json.load(f), report, args.threshold, args.min_ms)
+        print_comparison(rows, notes, args.threshold)
+        return 1 if any(r["regressed"] for r in rows) else 0
+    return 0
+
+
+def command_compare(args: argparse.Namespace) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows, notes = compare(baseline, current, args.threshold, args.min_ms)
+    print_comparison(rows, notes, args.threshold)
+    return 1 if any(r["regressed"] for r in rows) else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks and write a JSON report")
+    run.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small"])
+    run.add_argument("--modes", nargs="+", choices=["inproc", "http"], default=["inproc", "http"])
+    run.add_argument("--cases", nargs="+", help="case names or prefixes, e.g. clustering regression.linear")
+    run.add_argument("--repeat", type=int, default=5, help="timed requests per case (at least)")
+    run.add_argument("--min-time", type=float, default=1.0, help="seconds to keep timing each case (at least)")
+    run.add_argument("--warmup", type=int, default=1, help="untimed requests per case")
+    run.add_argument("--concurrency", type=int, default=1, help="client threads for http mode")
+    run.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    run.add_argument("--out", default="benchmark-results.json")
+    run.add_argument("--compare", help="baseline report to compare against")
+    run.add_argument("--threshold", type=float, default=0.20, help="relative change counted as a regression")
+    run.add_argument("--min-ms", type=float, default=1.0, help="p50 changes below this are noise")
+    run.add_argument("--list", action="store_true", help="list the cases and exit")
+
+    diff = commands.add_parser("compare", help="compare two JSON reports")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+    diff.add_argument("--threshold", type=float, default=0.20)
+    diff.add_argument("--min-ms", type=float, default=1.0)
+
+    accuracy = commands.add_parser("accuracy", help="compare dtype=float32 results with float64 on the benchmark inputs")
+    accuracy.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small"])
+    accuracy.add_argument("--cases", nargs="+", help="case names or prefixes, e.g. clustering regression.linear")
+    accuracy.add_argument("--out", default="accuracy-results.json")
+
+    args = parser.parse_args(argv)
+    if args.command == "run" and args.list:
+        for case in CASES:
+            print(f"{case.name:<28} {case.path:<28} {'inproc+http' if case.analysis else 'http'}")
+        return 0
+    commands_ = {"run": command_run, "compare": command_compare, "accuracy": command_accuracy}
+    return commands_[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
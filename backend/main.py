@@ -1,8 +1,115 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from modules import quantum, lda, anomaly, clustering, regression, timeseries, correlation, dataprocessing
+from fastapi.responses import JSONResponse
+from modules import batch, cache, datasets, executor, jobs, loader, metrics, pipeline, registry, sessions, transport
 
-app = FastAPI(title="Quantum Necromancer Data Science API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the configured modules on startup; stop the pools and flush pending models on shutdown."""
+    loader.warm_up(
+        loader.parse_names(os.getenv("WARMUP_MODULES", "")),
+        background=os.getenv("WARMUP_BLOCKING", "").lower() not in ("1", "true", "yes"),
+    )
+    loader.mark_ready()
+    yield
+    executor.shutdown()
+    registry.models.close()  # flush model files still queued for writing
+
+app = FastAPI(title="Quantum Necromancer Data Science API", lifespan=lifespan)
+
+# Analysis modules. DISABLED_MODULES (e.g. "quantum,lda") leaves modules out
+# entirely: no routes, no jobs/batch registration, no qiskit/sklearn imports.
+# Heavy dependencies load on first use; WARMUP_MODULES ("all" or a list)
+# loads them at startup, in the background unless WARMUP_BLOCKING=1.
+analyses = loader.load(disabled=loader.parse_names(os.getenv("DISABLED_MODULES", "")))
+
+# Execution layer: CPU-bound fits run on a bounded thread/process pool.
+# ENDPOINT_LIMITS overrides per endpoint, e.g. "lda=1:4,clustering=4:16"
+# (concurrency:queue_depth).
+executor.configure(
+    kind=os.getenv("EXECUTOR_KIND", "thread"),
+    workers=int(os.getenv("EXECUTOR_WORKERS", "0")) or None,
+    concurrency=int(os.getenv("ENDPOINT_CONCURRENCY", "2")),
+    queue_depth=int(os.getenv("ENDPOINT_QUEUE_DEPTH", "8")),
+    limits=executor.parse_limits(os.getenv("ENDPOINT_LIMITS", "")),
+)
+
+# Background jobs: finished jobs live for JOB_TTL_SECONDS; results larger than
+# JOB_SPILL_THRESHOLD_BYTES go to JOB_SPILL_DIR when it is set.
+jobs.configure(
+    ttl=float(os.getenv("JOB_TTL_SECONDS", "3600")),
+    max_jobs=int(os.getenv("JOB_MAX_JOBS", "1000")),
+    spill_dir=os.getenv("JOB_SPILL_DIR") or None,
+    spill_threshold=int(os.getenv("JOB_SPILL_THRESHOLD_BYTES", str(1 << 20))),
+)
+
+# Result cache for deterministic analyses, bounded by serialized size.
+cache.configure(
+    max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 << 20))),
+    ttl=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "600")),
+)
+
+# Uploaded datasets, stored as memory-mapped files and analyzed by id.
+# NUMERIC_DTYPE=float32 makes float32 the working precision of requests that
+# do not set "dtype" themselves.
+datasets.configure(
+    os.getenv("DATASET_DIR", os.path.join(os.path.dirname(__file__), "datastore")),
+    dtype=os.getenv("NUMERIC_DTYPE", "float64"),
+)
+
+# Fitted models of persist=true fits: LRU in memory, written in the background
+# to MODEL_DIR (empty = memory only), which keeps at most MODEL_DISK_MAX_MODELS
+# files, each dropped after MODEL_TTL_SECONDS without use (0 = no limit).
+registry.configure(
+    os.getenv("MODEL_DIR", os.path.join(os.path.dirname(__file__), "modelstore")) or None,
+    max_models=int(os.getenv("MODEL_CACHE_SIZE", "64")),
+    max_files=int(os.getenv("MODEL_DISK_MAX_MODELS", "256")),
+    ttl=float(os.getenv("MODEL_TTL_SECONDS", str(7 * 24 * 3600))) or None,
+)
+
+# Memoized pipeline step outputs (arrays), bounded by size and lifetime.
+pipeline.configure(
+    max_bytes=int(os.getenv("PIPELINE_CACHE_MAX_BYTES", str(512 << 20))),
+    ttl=float(os.getenv("PIPELINE_CACHE_TTL_SECONDS", "600")),
+)
+
+# Quantum RNG entropy pool: bytes kept ready, shots per simulator run, circuit width.
+if "quantum" in analyses:
+    analyses["quantum"].configure(
+        pool_bytes=int(os.getenv("QRNG_POOL_BYTES", str(1 << 20))),
+        shots=int(os.getenv("QRNG_BATCH_SHOTS", str(1 << 16))),
+        qubits=int(os.getenv("QRNG_QUBITS", "8")),
+    )
+
+# Streaming (partial_fit / sliding-window) sessions, held in this process.
+sessions.configure(
+    ttl=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "256")),
+)
+
+# Slow-request profiles: requests over PROFILE_SLOW_REQUEST_SECONDS write
+# sampled stacks to PROFILE_DIR (unset = profiler off).
+metrics.configure(
+    slow_seconds=float(os.getenv("PROFILE_SLOW_REQUEST_SECONDS", "0")) or None,
+    profile_dir=os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(__file__), "profiles")),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000,
+)
+
+executor_gauge = metrics.Gauge("executor_requests", "Work per endpoint limiter by state.", ("endpoint", "state"))
+cache_gauge = metrics.Gauge("result_cache", "Result cache counters.", ("stat",))
+
+@metrics.on_scrape
+def _collect_pool_and_cache():
+    for name, stats in executor.stats()["endpoints"].items():
+        for state in ("running", "waiting", "rejected"):
+            executor_gauge.set(stats[state], endpoint=name, state=state)
+    stats = cache.results.stats()
+    for stat in ("entries", "bytes", "hits", "misses", "evictions"):
+        cache_gauge.set(stats[stat], stat=stat)
+
+app.add_middleware(metrics.MetricsMiddleware, routes=app.routes)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,6 +119,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(executor.QueueFullError)
+async def queue_full_handler(request: Request, exc: executor.QueueFullError):
+    return JSONResponse(
+        status_code=429,
+        content={"success": False, "data": None, "error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+@app.exception_handler(transport.TransportError)
+async def transport_error_handler(request: Request, exc: transport.TransportError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"success": False, "data": None, "error": str(exc)},
+    )
+
 @app.get("/health")
 async def health_check():
     return {"success": True, "data": {"status": "alive"}, "error": None}
@@ -19,31 +141,52 @@ async def health_check():
 @app.get("/api/capabilities")
 async def get_capabilities():
     """Return all available analysis capabilities."""
+    capabilities = [
+        ("quantum", "Quantum Random Generation", "/api/quantum/generate"),
+        ("lda", "Topic Modeling (LDA)", "/api/lda/analyze"),
+        ("anomaly", "Anomaly Detection", "/api/anomaly/detect"),
+        ("clustering", "Clustering Analysis", "/api/clustering/analyze"),
+        ("regression", "Regression Analysis", "/api/regression/analyze"),
+        ("regression", "Large-Scale Regression", "/api/regression/scalable"),
+        ("timeseries", "Time Series Analysis", "/api/timeseries/analyze"),
+        ("timeseries", "Multi-Series Time Series", "/api/timeseries/batch"),
+        ("correlation", "Correlation Analysis", "/api/correlation/analyze"),
+        ("dataprocessing", "Data Processing", "/api/data/*"),
+        (None, "Background Jobs", "/api/jobs/*"),
+        (None, "Stored Datasets", "/api/datasets/*"),
+        (None, "Model Registry", "/api/models/*"),
+        (None, "Streaming Sessions", "/api/sessions/*"),
+        (None, "Batch Analyses", "/api/batch"),
+        (None, "Preprocessing Pipeline", "/api/pipeline/run"),
+        (None, "Loaded Modules", "/api/modules"),
+    ]
     return {
         "success": True,
         "data": {
             "modules": [
-                {"name": "Quantum Random Generation", "endpoint": "/api/quantum/generate"},
-                {"name": "Topic Modeling (LDA)", "endpoint": "/api/lda/analyze"},
-                {"name": "Anomaly Detection", "endpoint": "/api/anomaly/detect"},
-                {"name": "Clustering Analysis", "endpoint": "/api/clustering/analyze"},
-                {"name": "Regression Analysis", "endpoint": "/api/regression/analyze"},
-                {"name": "Time Series Analysis", "endpoint": "/api/timeseries/analyze"},
-                {"name": "Correlation Analysis", "endpoint": "/api/correlation/analyze"},
-                {"name": "Data Processing", "endpoint": "/api/data/*"}
+                {"name": name, "endpoint": endpoint}
+                for module, name, endpoint in capabilities
+                if module is None or module in analyses
             ]
         },
         "error": None
     }
 
-# Original modules
-app.include_router(quantum.router, prefix="/api")
-app.include_router(lda.router, prefix="/api")
-app.include_router(anomaly.router, prefix="/api")
-
-# New enhanced modules
-app.include_router(clustering.router, prefix="/api")
-app.include_router(regression.router, prefix="/api")
-app.include_router(timeseries.router, prefix="/api")
-app.include_router(correlation.router, prefix="/api")
-app.include_router(dataprocessing.router, prefix="/api")
+@app.get("/api/executor/status")
+async def get_executor_status():
+    """Return worker pool configuration and per-endpoint queue usage."""
+    return {"success": True, "data": executor.stats(), "error": None}
+
+# Analysis modules that are not disabled
+for module in analyses.values():
+    app.include_router(module.router, prefix="/api")
+
+app.include_router(jobs.router, prefix="/api")
+app.include_router(cache.router, prefix="/api")
+app.include_router(datasets.router, prefix="/api")
+app.include_router(registry.router, prefix="/api")
+app.include_router(sessions.router, prefix="/api")
+app.include_router(batch.router, prefix="/api")
+app.include_router(pipeline.router, prefix="/api")
+app.include_router(loader.router, prefix="/api")
+app.include_router(metrics.router)
@@ -1,44 +1,310 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from sklearn.ensemble import IsolationForest
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List
+from typing import TYPE_CHECKING, List, Literal, Optional
+from modules import metrics, sessions
+from modules.datasets import DatasetRef, resolve_matrix
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.executor import run_in_thread
+from modules.jobs import register_analysis, report_progress
+from modules.registry import get_model, register_model, run_prediction
+from modules.transport import Records, ResultFormat, array_body, array_openapi, result_format
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import IsolationForest
 
 router = APIRouter()
 
-class AnomalyRequest(BaseModel):
-    data: List[List[float]]
+VERSION = "1.0"
+WARM_IMPORTS = ("sklearn.ensemble",)
+
+class AnomalyRequest(DatasetRef):
+    data: List[List[float]] = None
     contamination: float = 0.1
+    # "fast" fits on at most fit_rows sampled rows and returns only the selected anomalies
+    mode: Literal["exact", "fast"] = "exact"
+    fit_rows: int = 100_000  # For mode="fast"
+    n_estimators: int = 100
+    # "auto": every row as records ("exact") or the flagged rows as index/score arrays ("fast")
+    output: Literal["auto", "all", "flagged", "top_k", "threshold"] = "auto"
+    top_k: int = 100
+    threshold: Optional[float] = None  # For output="threshold": keep score < threshold (lower is more anomalous)
+    contributions: bool = False  # per-feature contribution of each returned anomaly
+    chunk_rows: int = 65536  # rows per scoring task
+    persist: bool = False  # keep the fitted forest for /anomaly/score and return its model_id
+    n_jobs: Optional[int] = None  # threads fitting trees and scoring chunks (-1: all cores; "fast" default)
 
-@router.post("/anomaly/detect")
-async def detect_anomalies(request: AnomalyRequest) -> dict:
+@router.post("/anomaly/detect", openapi_extra=array_openapi(AnomalyRequest))
+async def detect_anomalies(
+    request: AnomalyRequest = Depends(array_body(AnomalyRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
     """Detect anomalies in numerical data using Isolation Forest."""
+    result = await run_cached("anomaly", _detect_anomalies, request, VERSION, cache)
+    return fmt.render(result, arrays=["anomalies", "indices", "scores", "contributions"])
+
+def _detect_anomalies(request: AnomalyRequest) -> dict:
+    from sklearn.ensemble import IsolationForest
+
     try:
-        X = np.array(request.data)
-        
+        X = resolve_matrix(request.data, request)
+        fast = request.mode == "fast"
+        output = request.output if request.output != "auto" else ("flagged" if fast else "all")
+        if output == "threshold" and request.threshold is None:
+            raise ValueError("output='threshold' requires a threshold")
+        if request.chunk_rows < 1 or request.fit_rows < 1:
+            raise ValueError("chunk_rows and fit_rows must be positive")
+        workers = (os.cpu_count() or 1) if request.n_jobs == -1 or (fast and request.n_jobs is None) \
+            else max(request.n_jobs or 1, 1)
+
+        # The offset (score cut-off for contamination) is estimated on the fit rows,
+        # so fitting on a sample also bounds the scoring pass inside fit().
+        fit_index = _sample_index(len(X), request.fit_rows) if fast else None
+        X_fit = X[fit_index] if fit_index is not None else X
         iso_forest = IsolationForest(
+            n_estimators=request.n_estimators,
             contamination=request.contamination,
+            n_jobs=workers if workers > 1 else None,
             random_state=42
         )
-        predictions = iso_forest.fit_predict(X)
-        scores = iso_forest.score_samples(X)
-        
-        anomalies = [
-            {
-                "index": i,
-                "score": float(scores[i]),
-                "is_anomaly": bool(predictions[i] == -1)
-            }
-            for i in range(len(predictions))
-        ]
-        
+        with metrics.span("fit"):
+            iso_forest.fit(X_fit)
+        # One scoring pass; predict() would score every row again.
+        with metrics.span("score"):
+            scores = _score_chunks(iso_forest, X, request.chunk_rows, workers)
+        model_id = register_model(
+            "anomaly", iso_forest, request, VERSION,
+            contamination=request.contamination, n_features=int(X.shape[1])
+        )
+        is_anomaly = scores < iso_forest.offset_
+        data = {
+            "total_anomalies": int(np.sum(is_anomaly)),
+            "model_id": model_id,
+            "n_rows": len(X),
+            "fit_rows": len(X_fit),
+            "offset": float(iso_forest.offset_),
+        }
+
+        if output == "all":
+            data["anomalies"] = Records(index=np.arange(len(scores)), score=scores, is_anomaly=is_anomaly)
+            return {"success": True, "data": data, "error": None}
+
+        if output == "top_k":
+            k = min(max(request.top_k, 0), len(scores))
+            selected = np.argpartition(scores, k - 1)[:k] if 0 < k < len(scores) else np.arange(k)
+        else:
+            selected = np.flatnonzero(is_anomaly if output == "flagged" else scores < request.threshold)
+        selected = selected[np.argsort(scores[selected], kind="stable")]  # most anomalous first
+        data.update(output=output, indices=selected, scores=scores[selected])
+        if request.contributions:
+            # Rows are read in position order (cheap on a memmap), then put back in ranking order.
+            order = np.argsort(selected)
+            contributions = np.empty((len(selected), X.shape[1]), dtype=X.dtype)
+            with metrics.span("contributions"):
+                contributions[order] = _path_contributions(iso_forest, X[selected[order]])
+            data["contributions"] = contributions
+        return {"success": True, "data": data, "error": None}
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+def _sample_index(n: int, size: int) -> Optional[np.ndarray]:
+    """Sorted uniform sample of ``size`` row positions, or ``None`` for all rows."""
+    if size >= n:
+        return None
+    return np.sort(np.random.default_rng(42).choice(n, size=size, replace=False))
+
+def _score_chunks(forest: "IsolationForest", X: np.ndarray, chunk_rows: int, workers: int) -> np.ndarray:
+    """``forest.score_samples(X)`` over row chunks, ``workers`` chunks at a time on threads.
+
+    Tree traversal runs in Cython without the GIL, so chunks score in
+    parallel; chunking also bounds the float32 copy sklearn makes of its
+    input, which matters for memory-mapped datasets.
+    """
+    scores = np.empty(len(X))
+    starts = range(0, len(X), chunk_rows)
+
+    def score(start: int) -> None:
+        scores[start:start + chunk_rows] = forest.score_samples(X[start:start + chunk_rows])
+
+    if workers > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(starts))) as pool:
+            for done, _ in enumerate(pool.map(score, starts), 1):
+                report_progress(done / len(starts))
+    else:
+        for done, start in enumerate(starts, 1):
+            score(start)
+            report_progress(done / len(starts))
+    return scores
+
+def _path_contributions(forest: "IsolationForest", X: np.ndarray) -> np.ndarray:
+    """Share of each feature in isolating each row, over all trees.
+
+    Every tree gives a row one unit of credit, split evenly over the splits
+    on the row's path to its leaf and assigned to the features those splits
+    test. Rows sum to 1. A feature that keeps appearing on the short paths
+    of an anomaly is the one that sets it apart.
+    """
+    contributions = np.zeros(X.shape, dtype=float)
+    rows = np.arange(len(X))
+    for tree, features in zip(forest.estimators_, forest.estimators_features_):
+        path = tree.decision_path(np.asarray(X[:, features], dtype=np.float32))
+        node_feature = tree.tree_.feature[path.indices]
+        row = np.repeat(rows, np.diff(path.indptr))
+        split = node_feature >= 0  # leaves have feature -2
+        depth = np.maximum(np.bincount(row[split], minlength=len(X)), 1)
+        np.add.at(contributions, (row[split], features[node_feature[split]]), 1.0 / depth[row[split]])
+    total = contributions.sum(axis=1, keepdims=True)
+    return contributions / np.where(total > 0, total, 1.0)
+
+class AnomalyScoreRequest(DatasetRef):
+    model_id: str
+    data: List[List[float]] = None
+
+@router.post("/anomaly/score", openapi_extra=array_openapi(AnomalyScoreRequest))
+async def score_anomalies(
+    request: AnomalyScoreRequest = Depends(array_body(AnomalyScoreRequest, "data")),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Score new points with a forest returned by /anomaly/detect, without refitting."""
+    rows = len(request.data) if request.data is not None else None
+    result = await run_prediction("anomaly", _score_anomalies, request, rows)
+    return fmt.render(result, arrays=["anomalies"])
+
+def _score_anomalies(request: AnomalyScoreRequest) -> dict:
+    try:
+        iso_forest, _ = get_model(request.model_id, "anomaly")
+        scores = iso_forest.score_samples(resolve_matrix(request.data, request))
+        # Same rule as IsolationForest.predict, without scoring twice.
+        is_anomaly = scores < iso_forest.offset_
         return {
             "success": True,
             "data": {
+                "anomalies": Records(index=np.arange(len(scores)), score=scores, is_anomaly=is_anomaly),
+                "total_anomalies": int(np.sum(is_anomaly)),
+                "model_id": request.model_id
+            },
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+class SlidingWindow:
+    """Fixed-size ring buffer of the most recent rows."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buffer = None
+        self.next = 0
+        self.filled = 0
+
+    def extend(self, X: np.ndarray) -> None:
+        if self.buffer is None:
+            self.buffer = np.empty((self.size, X.shape[1]), dtype=X.dtype)
+        elif X.shape[1] != self.buffer.shape[1]:
+            raise ValueError(f"Expected {self.buffer.shape[1]} features, got {X.shape[1]}")
+        if len(X) >= self.size:
+            self.buffer[:] = X[-self.size:]
+            self.next, self.filled = 0, self.size
+            return
+        positions = (self.next + np.arange(len(X))) % self.size
+        self.buffer[positions] = X
+        self.next = (self.next + len(X)) % self.size
+        self.filled = min(self.filled + len(X), self.size)
+
+    def values(self) -> np.ndarray:
+        return self.buffer[:self.filled]
+
+class AnomalySessionRequest(BaseModel):
+    contamination: float = 0.1
+    window_size: int = 10000
+    refit_every: int = 1  # batches between refits of the forest
+    min_samples: int = 256  # rows needed before the first fit
+    n_estimators: int = 100
+
+class AnomalyBatchRequest(DatasetRef):
+    data: List[List[float]] = None
+
+@router.post("/anomaly/sessions")
+async def create_anomaly_session(request: AnomalySessionRequest):
+    """Start a sliding-window Isolation Forest session for a stream of batches."""
+    if request.window_size < 1 or request.refit_every < 1:
+        return sessions.error_response(sessions.SessionError("window_size and refit_every must be positive"))
+    state = {"window": SlidingWindow(request.window_size), "forest": None, "since_refit": 0}
+    try:
+        session = sessions.store.create("anomaly", state, request.model_dump())
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    return {"success": True, "data": session.summary(), "error": None}
+
+@router.post("/anomaly/sessions/{session_id}", openapi_extra=array_openapi(AnomalyBatchRequest))
+async def update_anomaly_session(
+    session_id: str,
+    request: AnomalyBatchRequest = Depends(array_body(AnomalyBatchRequest, "data")),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Add a batch to the session window and score it against the current forest."""
+    try:
+        session = sessions.store.get(session_id, "anomaly")
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    result = await run_in_thread("anomaly", _update_anomaly_session, session, request)
+    return fmt.render(result, arrays=["anomalies"])
+
+def _update_anomaly_session(session: sessions.Session, request: AnomalyBatchRequest) -> dict:
+    from sklearn.ensemble import IsolationForest
+
+    try:
+        X = resolve_matrix(request.data, request)
+        config = session.config
+        with session.lock:
+            state = session.state
+            window = state["window"]
+            window.extend(X)
+            state["since_refit"] += 1
+            refitted = False
+            due = state["forest"] is None or state["since_refit"] >= config["refit_every"]
+            if due and window.filled >= config["min_samples"]:
+                # Each tree subsamples at most 256 rows, so a refit costs the same at any window size.
+                forest = IsolationForest(
+                    n_estimators=config["n_estimators"],
+                    contamination=config["contamination"],
+                    random_state=42
+                )
+                state["forest"] = forest.fit(window.values())
+                state["since_refit"] = 0
+                refitted = True
+            start = session.samples
+            session.touch(len(X))
+            batches, samples, window_rows = session.batches, session.samples, window.filled
+            forest = state["forest"]
+
+        # The forest is never mutated after fitting, so scoring can run outside the lock.
+        anomalies = None
+        total = 0
+        if forest is not None:
+            scores = forest.score_samples(X)
+            is_anomaly = scores < forest.offset_
+            anomalies = Records(index=start + np.arange(len(scores)), score=scores, is_anomaly=is_anomaly)
+            total = int(np.sum(is_anomaly))
+
+        return {
+            "success": True,
+            "data": {
+                "session_id": session.id,
                 "anomalies": anomalies,
-                "total_anomalies": int(sum(predictions == -1))
+                "total_anomalies": total,
+                "warming_up": forest is None,
+                "refitted": refitted,
+                "window_rows": window_rows,
+                "batches": batches,
+                "samples_seen": samples
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+register_analysis("anomaly", AnomalyRequest, _detect_anomalies, matrix="data", version=VERSION)
@@ -0,0 +1,187 @@
+"""Run many analyses over one dataset in a single request.
+
+``POST /api/batch`` takes one input matrix (inline, binary or a stored
+``dataset_id``) and a list of analysis specs, e.g. a k-means sweep over
+``n_clusters`` next to a few regression algorithms. The body is parsed once,
+standardization and polynomial features are computed once in a shared
+``PreparedMatrix``, the specs run in parallel, and each result is streamed
+back as one NDJSON line as soon as it finishes.
+
+Specs take the same path as their single endpoints: the result cache (so a
+batch reuses, and fills, the results of ``/clustering/analyze`` and friends,
+and honours ``X-Cache-Bypass``) and then the analysis pool. The shared
+``PreparedMatrix`` only reaches specs on a thread pool; process-pool workers
+compute their own views. Each spec counts against its own analysis's
+endpoint limit, so a batch cannot run more k-means fits at once than
+``/clustering/analyze`` would; a spec rejected there comes back as an error
+line.
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from modules import datasets, executor, jobs
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.datasets import DatasetRef, resolve_matrix
+from modules.prepared import PreparedMatrix
+from modules.transport import NDJSON, array_body, array_openapi, encode_json
+
+router = APIRouter()
+
+MAX_SPECS = 256
+
+
+class AnalysisSpec(BaseModel):
+    analysis: str  # a registered analysis, e.g. "clustering" or "regression"
+    params: Dict[str, Any] = {}
+    id: Optional[str] = None  # echoed back to match results to specs
+
+
+class BatchRequest(DatasetRef):
+    data: List[List[float]] = None
+    y: List[float] = None  # regression target for inline data
+    target: Optional[str] = None  # dataset column holding y
+    specs: List[AnalysisSpec] = []
+    parallelism: Optional[int] = None  # specs running at once (default: executor workers)
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "data": None, "error": message})
+
+
+def resolve_inputs(request: BatchRequest):
+    """The shared feature matrix and optional target, resolved once."""
+    if request.dataset_id and request.target:
+        columns = request.columns
+        if columns is None:
+            columns = [c for c in datasets.store.meta(request.dataset_id)["numeric_columns"] if c != request.target]
+        return resolve_matrix(None, request, columns), resolve_matrix(None, request, [request.target])[:, 0]
+    y = np.asarray(request.y, dtype=datasets.working_dtype(request)) if request.y is not None else None
+    return resolve_matrix(request.data, request), y
+
+
+def build_spec(spec: AnalysisSpec, X: np.ndarray, y: Optional[np.ndarray], loc: tuple = ("specs", 0)):
+    """Validate one spec into ``(analysis, request)`` with the shared arrays filled in.
+
+    ``loc`` is the spec's position in the body, used in error messages.
+    """
+    where = loc[0] + "".join(f"[{part}]" for part in loc[1:])
+    analysis = jobs.get_analysis(spec.analysis)
+    if analysis is None or analysis.matrix is None:
+        supported = [name for name in jobs.analysis_names() if jobs.get_analysis(name).matrix]
+        raise ValueError(f"{where}: unsupported analysis '{spec.analysis}', expected one of {supported}")
+    arrays = {analysis.matrix: X}
+    if "y" in analysis.request_model.model_fields:
+        if y is None:
+            raise ValueError(f"{where}: '{spec.analysis}' needs y or a dataset target")
+        arrays["y"] = y
+    params = {key: value for key, value in spec.params.items() if key not in ("dataset_id", "columns", "target")}
+    # Specs work in the shared matrix's precision unless they ask for another.
+    params.setdefault("dtype", X.dtype.name)
+    try:
+        request = analysis.request_model.model_validate({**params, **{field: [] for field in arrays}})
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *loc, "params", *error["loc"])}
+                                      for error in e.errors()])
+    return analysis, request.model_copy(update=arrays)
+
+
+def run_spec(analysis: jobs.Analysis, request: BaseModel, prepared: PreparedMatrix) -> dict:
+    if analysis.prepared:
+        return analysis.fn(request, prepared=prepared)
+    return analysis.fn(request)
+
+
+async def _stream(specs, built, prepared: PreparedMatrix, parallelism: int, policy: CachePolicy):
+    gate = asyncio.Semaphore(parallelism)
+    shared = executor.stats()["kind"] == "thread"  # a process pool cannot share the prepared views
+    # Specs of one endpoint beyond its concurrency wait here rather than in (and
+    # overflowing) that endpoint's shared queue.
+    endpoint_gates = {
+        analysis.endpoint: asyncio.Semaphore(executor.get_limiter(analysis.endpoint).concurrency)
+        for analysis, _ in built
+    }
+
+    async def run(index: int):
+        analysis, request = built[index]
+        async with endpoint_gates[analysis.endpoint], gate:
+            started = time.perf_counter()
+            kwargs = {"prepared": prepared} if analysis.prepared and shared else {}
+            try:
+                if analysis.version is None:
+                    result = await executor.run_in_pool(analysis.endpoint, analysis.fn, request, **kwargs)
+                else:
+                    result = await run_cached(analysis.endpoint, analysis.fn, request, analysis.version, policy,
+                                              **kwargs)
+            except Exception as e:
+                result = {"success": False, "data": None, "error": str(e)}
+            seconds = round(time.perf_counter() - started, 4)
+        return {"index": index, "id": specs[index].id, "analysis": specs[index].analysis,
+                "seconds": seconds, **result}
+
+    tasks = [asyncio.create_task(run(index)) for index in range(len(specs))]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield encode_json(await finished) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _BatchResponse(StreamingResponse):
+    """NDJSON stream that takes its ``batch`` slot only when it is actually sent.
+
+    Admission and release both happen in ``__call__``, so a response whose
+    client went away before it started never holds a place in the queue.
+    """
+
+    def __init__(self, content, limiter: executor.EndpointLimiter):
+        super().__init__(content, media_type=NDJSON)
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            self.limiter.admit()
+        except executor.QueueFullError as e:
+            response = JSONResponse(status_code=429, content={"success": False, "data": None, "error": str(e)},
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        async with self.limiter.slot():  # gives the admitted place back however the stream ends
+            await super().__call__(scope, receive, send)
+
+
+@router.post("/batch", openapi_extra=array_openapi(BatchRequest))
+async def run_batch(
+    request: BatchRequest = Depends(array_body(BatchRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+):
+    """Run a list of analyses over one dataset, streaming each result as NDJSON.
+
+    Every line carries the spec's ``index`` and ``id`` plus the usual
+    ``success``/``data``/``error`` of that analysis; lines arrive in
+    completion order, not spec order.
+    """
+    if not request.specs:
+        return _error(422, "specs must list at least one analysis")
+    if len(request.specs) > MAX_SPECS:
+        return _error(422, f"At most {MAX_SPECS} specs per batch")
+    try:
+        X, y = resolve_inputs(request)
+        built = [build_spec(spec, X, y, ("specs", index)) for index, spec in enumerate(request.specs)]
+    except datasets.DatasetNotFound as e:
+        return _error(404, str(e))
+    except ValueError as e:
+        return _error(422, str(e))
+
+    parallelism = request.parallelism or executor.stats()["workers"] or 4
+    return _BatchResponse(
+        _stream(request.specs, built, PreparedMatrix(X), max(parallelism, 1), CachePolicy(cache.bypass)),
+        executor.get_limiter("batch"),
+    )
@@ -0,0 +1,240 @@
+"""Content-addressed cache for analysis results.
+
+Every analysis is deterministic (``random_state=42`` throughout), so a result
+can be reused whenever the same request body reaches the same module version.
+Entries are keyed on a SHA-256 of the canonicalized request, evicted LRU once
+the cache outgrows its byte budget, and expire after a TTL. Clients skip the
+cache with ``X-Cache-Bypass: 1`` or ``Cache-Control: no-cache``.
+
+Results are sized by ``estimate_size`` on the worker that computed them, not
+pickled on the event loop. The cache keeps its own copy of each result with
+read-only arrays, and every hit gets a fresh copy of the containers, so a
+handler that edits its result never changes the cached entry.
+"""
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+import numpy as np
+from fastapi import APIRouter, Header, Response
+from pydantic import BaseModel
+
+from modules.executor import run_in_pool, run_in_thread
+from modules.prepared import frozen
+from modules.transport import Records
+
+router = APIRouter()
+
+
+class ResultCache:
+    """Thread-safe LRU cache bounded by total serialized size, with a TTL.
+
+    ``sizeof`` measures an entry (default: its pickled length); caches of
+    arrays pass ``lambda value: value.nbytes`` to avoid serializing them.
+    """
+
+    def __init__(self, max_bytes: int = 256 << 20, ttl: float = 600.0, sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: str, value: Any, size: Optional[int] = None) -> None:
+        """Store ``value``; ``size`` overrides the ``sizeof`` measurement when already known."""
+        if size is None and self.sizeof is not None:
+            size = self.sizeof(value)
+        elif size is None:
+            size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+
+results = ResultCache()
+
+
+def configure(max_bytes: int = 256 << 20, ttl: float = 600.0) -> None:
+    global results
+    results = ResultCache(max_bytes=max_bytes, ttl=ttl)
+
+
+def make_key(name: str, version: str, request: BaseModel) -> str:
+    """Hash of the analysis name, its module version and the canonical request body.
+
+    Modules bump their ``VERSION`` whenever a change alters results, which
+    invalidates every entry cached under the old version.
+    """
+    digest = hashlib.sha256(f"{name}@{version}\n".encode())
+    arrays = {}
+    for field in type(request).model_fields:
+        value = getattr(request, field)
+        if isinstance(value, list) and value:
+            # Numeric JSON lists hash like the same values sent as an array
+            # (binary bodies, /api/batch specs), so both share cache entries.
+            try:
+                numeric = np.asarray(value)
+            except ValueError:  # ragged
+                numeric = None
+            if numeric is not None and numeric.dtype.kind == "f":
+                value = numeric
+        if isinstance(value, np.ndarray):
+            arrays[field] = value
+    # Binary payloads arrive as arrays: hash their raw bytes instead of JSON.
+    for field, value in sorted(arrays.items()):
+        digest.update(f"{field}:{value.dtype.str}:{value.shape}\n".encode())
+        digest.update(np.ascontiguousarray(value).data)
+    params = request.model_dump(mode="json", exclude=set(arrays))
+    digest.update(json.dumps(params, sort_keys=True, separators=(",", ":")).encode())
+    return digest.hexdigest()
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory held by a result: array buffers plus a flat cost per Python object."""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Records):
+        return sum(column.nbytes for column in value.columns.values())
+    if isinstance(value, dict):
+        return 64 + sum(len(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(8 + estimate_size(item) for item in value)
+    if isinstance(value, (str, bytes)):
+        return 49 + len(value)
+    return 24
+
+
+def _measured(fn: Callable[..., dict], request: BaseModel, **kwargs: Any) -> Tuple[dict, int]:
+    """Run ``fn`` and size a successful result while still on the worker."""
+    result = fn(request, **kwargs)
+    return result, estimate_size(result) if result.get("success") else 0
+
+
+def _detached(value: Any) -> Any:
+    """Copy of a result's containers sharing its arrays, which are made read-only."""
+    if isinstance(value, np.ndarray):
+        return frozen(value)
+    if isinstance(value, Records):
+        return Records(**{name: frozen(column) for name, column in value.columns.items()})
+    if isinstance(value, dict):
+        return {key: _detached(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_detached(item) if isinstance(item, (dict, list, np.ndarray, Records)) else item for item in value]
+    return value
+
+
+class CachePolicy:
+    """Per-request cache settings resolved from the request headers."""
+
+    def __init__(self, bypass: bool, response: Optional[Response] = None):
+        self.bypass = bypass
+        self.response = response
+
+    def mark(self, status: str) -> None:
+        if self.response is not None:
+            self.response.headers["X-Cache"] = status
+
+
+def cache_policy(
+    response: Response,
+    x_cache_bypass: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None),
+) -> CachePolicy:
+    """FastAPI dependency: honour ``X-Cache-Bypass`` and ``Cache-Control: no-cache``."""
+    bypass = (x_cache_bypass or "").lower() in ("1", "true", "yes") or "no-cache" in (cache_control or "")
+    return CachePolicy(bypass, response)
+
+
+async def run_cached(
+    endpoint: str,
+    fn: Callable[..., dict],
+    request: BaseModel,
+    version: str,
+    policy: Optional[CachePolicy] = None,
+    **kwargs: Any,
+) -> dict:
+    """``run_in_pool`` with successful results served from / stored in the cache.
+
+    ``kwargs`` reach ``fn`` but not the key, e.g. a shared ``prepared`` matrix.
+    """
+    policy = policy or CachePolicy(bypass=False)
+    if getattr(request, "persist", False):
+        # The model must be registered in this process on every fit: a cached
+        # model_id may name an evicted model, and a pool process would keep
+        # the model in its own memory.
+        result = await run_in_thread(endpoint, fn, request, **kwargs)
+        policy.mark("BYPASS")
+        return result
+    key = make_key(f"{fn.__module__}.{fn.__qualname__}", version, request)
+    if not policy.bypass:
+        cached = results.get(key)
+        if cached is not None:
+            policy.mark("HIT")
+            return _detached(cached)
+    result, size = await run_in_pool(endpoint, _measured, fn, request, **kwargs)
+    if result.get("success"):
+        results.put(key, _detached(result), size)
+    policy.mark("BYPASS" if policy.bypass else "MISS")
+    return result
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Return result-cache size and hit/miss counters."""
+    return {"success": True, "data": results.stats(), "error": None}
+
+
+@router.delete("/cache")
+async def clear_cache():
+    """Drop every cached result."""
+    results.clear()
+    return {"success": True, "data": results.stats(), "error": None}
@@ -0,0 +1,258 @@
+"""Out-of-core cleaning and scaling: column statistics in one pass, then chunk-by-chunk transforms.
+
+``/data/clean`` and ``/data/transform`` read their input ``chunk_rows`` rows
+at a time, from a dataset memmap or from slices of an inline matrix, so a
+table larger than RAM only ever has one chunk copied out:
+
+1. one streaming pass collects per-column count, mean and variance (Welford
+   within a chunk, Chan's update across chunks), min, max and missing counts,
+   plus a row reservoir for median imputation;
+2. a second pass imputes, filters outliers or scales each chunk and hands it
+   to a sink, either a preallocated array or a new stored dataset.
+
+The statistics outlier filtering needs (mean and std after imputation) are
+derived from the first pass instead of rescanning the imputed data. Output
+chunks are in the request's ``dtype``; the statistics always accumulate in
+float64.
+"""
+from typing import Callable, Iterable, Optional, Tuple
+
+import numpy as np
+
+CHUNK_ROWS = 65536
+
+# Rows kept for approximate quantiles; medians are exact up to this many rows.
+QUANTILE_SAMPLE_ROWS = 1 << 16
+
+Chunks = Callable[[], Iterable[np.ndarray]]
+
+
+class ColumnStats:
+    """Streaming per-column count, mean, variance, min and max; NaNs are counted and skipped."""
+
+    def __init__(self, n_columns: int):
+        self.rows = 0
+        self.count = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+        self.min = np.full(n_columns, np.inf)
+        self.max = np.full(n_columns, -np.inf)
+        self.missing = np.zeros(n_columns, dtype=np.int64)
+
+    def update(self, chunk: np.ndarray) -> None:
+        self.rows += len(chunk)
+        if len(chunk) == 0:
+            return
+        nan = np.isnan(chunk)
+        missing = nan.sum(axis=0)
+        count = len(chunk) - missing
+        values = np.where(nan, 0.0, chunk) if missing.any() else chunk
+        mean = values.sum(axis=0, dtype=np.float64) / np.maximum(count, 1)
+        centered = values - mean
+        if missing.any():
+            centered[nan] = 0.0
+        self.merge(count, mean, np.einsum("ij,ij->j", centered, centered))
+        self.missing += missing
+        # fmin/fmax ignore NaN; an all-NaN column stays at +/-inf until it has a value.
+        self.min = np.fmin(self.min, np.fmin.reduce(chunk, axis=0))
+        self.max = np.fmax(self.max, np.fmax.reduce(chunk, axis=0))
+
+    def merge(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray) -> None:
+        """Fold in a group of ``count`` values with the given mean and sum of squared deviations."""
+        total = self.count + count
+        safe = np.where(total > 0, total, 1.0)
+        delta = mean - self.mean
+        self.mean = np.where(count > 0, self.mean + delta * count / safe, self.mean)
+        self.m2 = np.where(count > 0, self.m2 + m2 + delta * delta * self.count * count / safe, self.m2)
+        self.count = total
+
+    def with_fill(self, fill: np.ndarray) -> "ColumnStats":
+        """Statistics after every missing value of column ``j`` is set to ``fill[j]``."""
+        filled = ColumnStats(len(self.count))
+        filled.rows = self.rows
+        for name in ("count", "mean", "m2"):
+            setattr(filled, name, getattr(self, name).copy())
+        fill = np.broadcast_to(np.asarray(fill, dtype=float), self.count.shape)
+        known = ~np.isnan(fill)
+        filled.merge(np.where(known, self.missing, 0), np.where(known, fill, 0.0), np.zeros_like(self.m2))
+        filled.min = np.where(known & (self.missing > 0), np.fmin(self.min, fill), self.min)
+        filled.max = np.where(known & (self.missing > 0), np.fmax(self.max, fill), self.max)
+        filled.missing = np.where(known, 0, self.missing)
+        return filled
+
+    def summary(self, propagate_nan: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """``(mean, std, min, max)``; NaN for empty columns, or for any column with NaNs when ``propagate_nan``."""
+        empty = self.count == 0
+        if propagate_nan:
+            empty = empty | (self.missing > 0)
+        std = np.sqrt(self.m2 / np.where(self.count > 0, self.count, 1.0))
+        return tuple(np.where(empty, np.nan, value) for value in (self.mean, std, self.min, self.max))
+
+
+class RowReservoir:
+    """Uniform sample of up to ``size`` rows (Algorithm R), for approximate quantiles.
+
+    Holds every row until ``size`` rows have been seen, so quantiles of
+    smaller inputs are exact. After that, each quantile is the sample
+    quantile of a uniform row sample. Its rank error is about
+    ``0.5 / sqrt(size)``, roughly 0.2% for 64k rows. Seeded, so the result
+    for a given input never changes. The buffer grows (by doubling) with the
+    rows seen, so small inputs never allocate ``size`` rows.
+    """
+
+    def __init__(self, n_columns: int, size: int = QUANTILE_SAMPLE_ROWS, seed: int = 42):
+        self.size = size
+        self.rows = np.empty((0, n_columns))
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def exact(self) -> bool:
+        return self.seen <= self.size
+
+    def update(self, chunk: np.ndarray) -> None:
+        free = min(max(self.size - self.seen, 0), len(chunk))
+        if self.seen + free > len(self.rows):
+            self._grow(self.seen + free)
+        self.rows[self.seen:self.seen + free] = chunk[:free]
+        if free < len(chunk):
+            # Row i (0-based, overall) replaces a random slot with probability size / (i + 1).
+            positions = np.arange(self.seen + free, self.seen + len(chunk))
+            slots = (self._rng.random(len(positions)) * (positions + 1)).astype(np.int64)
+            taken = np.flatnonzero(slots < self.size)
+            if len(taken):
+                # Later rows win a contested slot, as in the sequential algorithm.
+                last = len(taken) - 1 - np.unique(slots[taken][::-1], return_index=True)[1]
+                self.rows[slots[taken][last]] = chunk[free + taken[last]]
+        self.seen += len(chunk)
+
+    def _grow(self, needed: int) -> None:
+        rows = np.empty((min(max(needed, 2 * len(self.rows)), self.size), self.rows.shape[1]))
+        rows[:self.seen] = self.rows[:self.seen]
+        self.rows = rows
+
+    def quantile(self, q: float) -> np.ndarray:
+        sample = self.rows[:min(self.seen, self.size)]
+        if q == 0.5:
+            return np.nanmedian(sample, axis=0)
+        return np.nanquantile(sample, q, axis=0)
+
+
+class ArraySink:
+    """Collects output chunks into one preallocated array; ``result()`` is a view of the filled rows."""
+
+    def __init__(self, rows: int, columns: int, dtype: np.dtype = np.float64):
+        self.values = np.empty((rows, columns), dtype=dtype)
+        self.filled = 0
+
+    def write(self, chunk: np.ndarray) -> None:
+        self.values[self.filled:self.filled + len(chunk)] = chunk
+        self.filled += len(chunk)
+
+    def result(self) -> np.ndarray:
+        return self.values[:self.filled]
+
+
+def scan(chunks: Chunks, n_columns: int, complete_rows: bool = False, quantiles: bool = False):
+    """One pass: ``(stats, complete-row stats or None, reservoir or None)``."""
+    stats = ColumnStats(n_columns)
+    complete = ColumnStats(n_columns) if complete_rows else None
+    reservoir = RowReservoir(n_columns) if quantiles else None
+    for chunk in chunks():
+        stats.update(chunk)
+        if complete is not None:
+            complete.update(chunk[~np.isnan(chunk).any(axis=1)])
+        if reservoir is not None:
+            reservoir.update(chunk)
+    return stats, complete, reservoir
+
+
+def clean(
+    chunks: Chunks,
+    n_columns: int,
+    handle_missing: str,
+    remove_outliers: bool,
+    threshold: float,
+    write: Callable[[np.ndarray], None],
+    dtype: np.dtype = np.float64,
+) -> dict:
+    """Impute and/or drop outlier rows chunk by chunk, passing each cleaned chunk to ``write``.
+
+    Outliers are judged against the column mean and std of the imputed data
+    (of the complete rows for ``drop``), as if the whole table had been
+    imputed first. Constant columns flag no outliers.
+    """
+    drop = handle_missing == "drop"
+    stats, complete, reservoir = scan(
+        chunks, n_columns, complete_rows=drop and remove_outliers, quantiles=handle_missing == "median"
+    )
+    fill: Optional[np.ndarray] = None
+    if handle_missing == "mean":
+        fill = stats.summary()[0]
+    elif handle_missing == "median":
+        fill = reservoir.quantile(0.5)
+    elif handle_missing == "zero":
+        fill = np.zeros(n_columns)
+
+    if remove_outliers:
+        mean, std, _, _ = (complete if drop else stats.with_fill(fill)).summary()
+        tested = np.flatnonzero(std > 0)
+
+    kept = 0
+    for chunk in chunks():
+        if handle_missing == "zero":
+            # Also clips +/-inf, as before.
+            values = np.nan_to_num(np.array(chunk, dtype=dtype), nan=0.0, copy=False)
+        else:
+            values = np.array(chunk, dtype=dtype)
+            nan = np.isnan(values)
+            if drop:
+                values = values[~nan.any(axis=1)]
+            elif nan.any():
+                np.copyto(values, np.broadcast_to(fill, values.shape), where=nan)
+        if remove_outliers and len(values):
+            keep = np.ones(len(values), dtype=bool)
+            for j in tested:
+                keep &= np.abs(values[:, j] - mean[j]) < threshold * std[j]
+            if not keep.all():
+                values = values[keep]
+        kept += len(values)
+        write(values)
+
+    return {
+        "original_rows": stats.rows,
+        "rows": kept,
+        "fill_values": None if fill is None else fill.tolist(),
+        "approximate_median": handle_missing == "median" and not reservoir.exact,
+    }
+
+
+def transform(
+    chunks: Chunks, n_columns: int, method: str, write: Callable[[np.ndarray], None], dtype: np.dtype = np.float64
+) -> dict:
+    """Scale chunk by chunk; returns the original column mean/std/min/max (NaN where a column has NaNs).
+
+    ``normalize`` is row-wise and needs no statistics, so it collects them in
+    the same single pass.
+    """
+    if method == "normalize":
+        stats = ColumnStats(n_columns)
+        for chunk in chunks():
+            stats.update(chunk)
+            values = np.array(chunk, dtype=dtype)
+            values /= np.linalg.norm(values, axis=1, keepdims=True) + 1e-10
+            write(values)
+    else:
+        stats = scan(chunks, n_columns)[0]
+        mean, std, low, high = stats.summary(propagate_nan=True)
+        for chunk in chunks():
+            values = np.array(chunk, dtype=dtype)
+            if method == "standardize":
+                values -= mean
+                values /= std + 1e-10
+            else:
+                values -= low
+                values /= high - low + 1e-10
+            write(values)
+    mean, std, low, high = stats.summary(propagate_nan=True)
+    return {"rows": stats.rows, "mean": mean.tolist(), "std": std.tolist(), "min": low.tolist(), "max": high.tolist()}
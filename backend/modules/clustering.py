@@ -1,69 +1,408 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from sklearn.cluster import KMeans, DBSCAN, AgglomerativeClustering
-from sklearn.preprocessing import StandardScaler
+import math
 import numpy as np
-from typing import List, Literal
+from typing import TYPE_CHECKING, List, Literal, Optional
+from modules import metrics, sessions
+from modules.datasets import DatasetRef, owned, resolve_matrix
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.executor import run_in_thread
+from modules.jobs import register_analysis
+from modules.prepared import PreparedMatrix
+from modules.transport import ResultFormat, array_body, array_openapi, result_format
+
+if TYPE_CHECKING:
+    from scipy import sparse
+    from sklearn.cluster import DBSCAN
+    from sklearn.preprocessing import StandardScaler
 
 router = APIRouter()
 
-class ClusteringRequest(BaseModel):
-    data: List[List[float]]
+VERSION = "1.1"
+WARM_IMPORTS = (
+    "sklearn.cluster",
+    "sklearn.neighbors",
+    "sklearn.preprocessing",
+    "scipy.sparse.csgraph",
+    "scipy.spatial.distance",
+)
+
+# Above these sizes "auto" switches to the scalable variant of each algorithm.
+MINIBATCH_MIN_ROWS = 100_000
+EXACT_HIERARCHICAL_MAX_ROWS = 10_000
+BIRCH_MIN_ROWS = 100_000
+# DBSCAN and connectivity-constrained agglomerative fit on a sample of this
+# many rows and assign the rest, unless ``max_fit_rows`` says otherwise.
+SAMPLE_FIT_ROWS = 200_000
+# Auto DBSCAN samples further so its neighbourhood lists stay below this size.
+DBSCAN_NEIGHBOR_BYTES = 1 << 30
+# Coarse single-core throughput used to turn operation counts into seconds.
+# Estimates are for comparing strategies, not promises.
+_OPS_PER_SECOND = 2e8
+
+class ClusteringRequest(DatasetRef):
+    data: List[List[float]] = None
     algorithm: Literal["kmeans", "dbscan", "hierarchical"] = "kmeans"
     n_clusters: int = 3
     eps: float = 0.5  # For DBSCAN
     min_samples: int = 5  # For DBSCAN
+    # Large-data mode: "auto" picks scalable variants by size, "off" always runs the exact algorithm
+    large_data: Literal["auto", "on", "off"] = "auto"
+    hierarchical_method: Literal["auto", "connectivity", "birch"] = "auto"
+    n_neighbors: int = 10  # For the connectivity graph
+    neighbors_algorithm: Literal["auto", "ball_tree", "kd_tree", "brute"] = "auto"  # For DBSCAN
+    leaf_size: int = 30
+    n_jobs: Optional[int] = None
+    max_fit_rows: Optional[int] = None  # Fit on a sample this size, then assign the rest
 
-@router.post("/clustering/analyze")
-async def perform_clustering(request: ClusteringRequest) -> dict:
+@router.post("/clustering/analyze", openapi_extra=array_openapi(ClusteringRequest))
+async def perform_clustering(
+    request: ClusteringRequest = Depends(array_body(ClusteringRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
     """Perform clustering analysis using various algorithms."""
+    result = await run_cached("clustering", _perform_clustering, request, VERSION, cache)
+    return fmt.render(result, arrays=["labels"])
+
+@router.post("/clustering/estimate", openapi_extra=array_openapi(ClusteringRequest))
+async def estimate_clustering(
+    request: ClusteringRequest = Depends(array_body(ClusteringRequest, "data")),
+) -> dict:
+    """Report the strategy, memory and time a clustering request would use, without fitting."""
+    try:
+        X = resolve_matrix(request.data, request)
+        return {"success": True, "data": _plan(request, X, costs=True), "error": None}
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+def _plan(request: ClusteringRequest, X: np.ndarray, costs: bool = False) -> dict:
+    """Choose the strategy for ``X`` and estimate its cost.
+
+    DBSCAN's cost depends on a neighbourhood probe, which fits run only when it
+    sizes their sample; without ``costs`` its estimates are then ``None``.
+    """
+    n, p = X.shape
+    large = request.large_data == "on" or (request.large_data == "auto" and n > EXACT_HIERARCHICAL_MAX_ROWS)
+    k = request.n_clusters
+    fit_rows = n
+    index = None
+    log_n = math.log2(max(n, 2))
+    data_bytes = 2 * n * p * X.itemsize  # input plus its scaled copy
+
+    if request.algorithm == "kmeans":
+        if request.large_data == "on" or (request.large_data == "auto" and n > MINIBATCH_MIN_ROWS):
+            strategy = "minibatch_kmeans"
+            ops = 3 * n * k * p * 10
+        else:
+            strategy = "kmeans"
+            ops = 10 * 30 * n * k * p  # n_init x typical iterations
+        memory = data_bytes + n * 8
+    elif request.algorithm == "hierarchical":
+        method = request.hierarchical_method
+        if not large:
+            strategy = "agglomerative"
+            memory = data_bytes + n * n * 8
+            ops = n * n * p
+        else:
+            if method == "auto":
+                method = "birch" if n > BIRCH_MIN_ROWS else "connectivity"
+            if method == "birch":
+                strategy = "birch"
+                memory = data_bytes + n * 8
+                ops = n * p * log_n * 50
+            else:
+                strategy = "connectivity_agglomerative"
+                fit_rows = _fit_rows(request, n)
+                m = request.n_neighbors
+                memory = data_bytes + fit_rows * m * 24
+                # Graph-constrained merges run per-neighbour in interpreted loops.
+                ops = 60 * fit_rows * math.log2(max(fit_rows, 2)) * (p + 1) * m
+    else:
+        # DBSCAN materialises every eps-neighbourhood, so its memory follows the density.
+        neighbors = _neighbors_per_row(X, request.eps) if costs or (large and not request.max_fit_rows) else None
+        if large or (request.max_fit_rows and request.large_data != "off"):
+            fit_rows = _fit_rows(request, n)
+            if not request.max_fit_rows:
+                # Largest sample whose neighbourhoods fit in the budget (they shrink with the sample).
+                fit_rows = min(fit_rows, max(int(math.sqrt(DBSCAN_NEIGHBOR_BYTES * n / (8 * neighbors))), 1000))
+        index = request.neighbors_algorithm
+        if index == "auto":
+            index = "kd_tree" if p <= 15 else "ball_tree"
+        strategy = "dbscan"
+        if neighbors is None:
+            ops = memory = None
+        else:
+            fit_neighbors = neighbors * fit_rows / n
+            if index == "brute":
+                ops = fit_rows * fit_rows * p
+            else:
+                ops = fit_rows * (math.log2(max(fit_rows, 2)) * p + fit_neighbors)
+            memory = data_bytes + fit_rows * fit_neighbors * 8
+            if fit_rows < n:
+                ops += (n - fit_rows) * math.log2(max(fit_rows, 2)) * p
+
+    workers = request.n_jobs if request.n_jobs and request.n_jobs > 0 else 1
+    parallel = request.algorithm == "dbscan" or strategy == "connectivity_agglomerative"
+    return {
+        "strategy": strategy,
+        "rows": n,
+        "features": p,
+        "fit_rows": fit_rows,
+        "sampled": fit_rows < n,
+        "neighbors_algorithm": index,
+        "estimated_memory_bytes": None if memory is None else int(memory),
+        "estimated_seconds": None if ops is None else round(ops / _OPS_PER_SECOND / (workers if parallel else 1), 3),
+    }
+
+def _fit_rows(request: ClusteringRequest, n: int) -> int:
+    limit = request.max_fit_rows if request.max_fit_rows else SAMPLE_FIT_ROWS
+    return min(n, limit)
+
+def _neighbors_per_row(X: np.ndarray, eps: float, probe_rows: int = 5000, queries: int = 500) -> float:
+    """Estimate the mean eps-neighbourhood size (in scaled space) from a small probe sample."""
+    from sklearn.neighbors import NearestNeighbors
+
+    n = len(X)
+    rng = np.random.default_rng(42)
+    probe = np.asarray(X[np.sort(rng.choice(n, size=min(n, probe_rows), replace=False))], dtype=float)
+    std = probe.std(axis=0)
+    probe = (probe - probe.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    index = NearestNeighbors(radius=eps).fit(probe)
+    found = index.radius_neighbors(probe[rng.choice(len(probe), size=min(len(probe), queries), replace=False)],
+                                   return_distance=False)
+    return max(float(np.mean([len(row) for row in found])) * n / len(probe), 1.0)
+
+def _perform_clustering(request: ClusteringRequest, prepared: Optional[PreparedMatrix] = None) -> dict:
+    from sklearn.cluster import KMeans, DBSCAN, AgglomerativeClustering, Birch, MiniBatchKMeans
+    from sklearn.neighbors import kneighbors_graph
+    from sklearn.preprocessing import StandardScaler
+
     try:
-        X = np.array(request.data)
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
-        
-        if request.algorithm == "kmeans":
-            model = KMeans(n_clusters=request.n_clusters, random_state=42, n_init=10)
-            labels = model.fit_predict(X_scaled)
+        X = resolve_matrix(request.data, request)
+        plan = _plan(request, X)
+        strategy = plan["strategy"]
+        if prepared is not None:
+            X_scaled, scaler = prepared.scaled()
+        else:
+            # A buffer parsed for this request is scaled in place; X then holds
+            # scaled values and the cluster stats are mapped back through the scaler.
+            scaler = StandardScaler(copy=not owned(X, request.data))
+            X_scaled = scaler.fit_transform(X)
+        centers = None
+        inertia = None
+
+        with metrics.span("fit"):
+            if strategy == "kmeans":
+                model = KMeans(n_clusters=request.n_clusters, random_state=42, n_init=10)
+                labels = model.fit_predict(X_scaled)
+            elif strategy == "minibatch_kmeans":
+                model = MiniBatchKMeans(n_clusters=request.n_clusters, random_state=42, n_init=3, batch_size=4096)
+                labels = model.fit_predict(X_scaled)
+            elif strategy == "agglomerative":
+                labels = AgglomerativeClustering(n_clusters=request.n_clusters).fit_predict(X_scaled)
+            elif strategy == "birch":
+                # The CF-tree summarises the data in one pass; only its leaves are clustered globally.
+                model = Birch(n_clusters=AgglomerativeClustering(n_clusters=request.n_clusters))
+                labels = model.fit_predict(X_scaled)
+            else:
+                sample = _sample_index(len(X_scaled), plan["fit_rows"])
+                X_fit = X_scaled[sample] if sample is not None else X_scaled
+                if strategy == "connectivity_agglomerative":
+                    connectivity = _connect_components(X_fit, kneighbors_graph(
+                        X_fit, n_neighbors=min(request.n_neighbors, len(X_fit) - 1),
+                        include_self=False, n_jobs=request.n_jobs
+                    ))
+                    fit_labels = AgglomerativeClustering(
+                        n_clusters=request.n_clusters, connectivity=connectivity
+                    ).fit_predict(X_fit)
+                    labels = fit_labels if sample is None else _assign_nearest_centroid(X_scaled, X_fit, fit_labels)
+                else:
+                    # A sample sees proportionally fewer neighbours within eps.
+                    fraction = len(X_fit) / len(X_scaled)
+                    model = DBSCAN(
+                        eps=request.eps,
+                        min_samples=max(2, round(request.min_samples * fraction)) if sample is not None else request.min_samples,
+                        algorithm=plan["neighbors_algorithm"],
+                        leaf_size=request.leaf_size,
+                        n_jobs=request.n_jobs
+                    )
+                    fit_labels = model.fit_predict(X_fit)
+                    labels = fit_labels if sample is None else _assign_nearest_core(X_scaled, model, request, plan)
+
+        if strategy in ("kmeans", "minibatch_kmeans"):
             centers = scaler.inverse_transform(model.cluster_centers_).tolist()
             inertia = float(model.inertia_)
-            
-        elif request.algorithm == "dbscan":
-            model = DBSCAN(eps=request.eps, min_samples=request.min_samples)
-            labels = model.fit_predict(X_scaled)
-            centers = None
-            inertia = None
-            
-        elif request.algorithm == "hierarchical":
-            model = AgglomerativeClustering(n_clusters=request.n_clusters)
-            labels = model.fit_predict(X_scaled)
-            centers = None
-            inertia = None
-        
-        # Calculate cluster statistics
-        unique_labels = np.unique(labels)
-        cluster_stats = []
-        for label in unique_labels:
-            mask = labels == label
-            cluster_data = X[mask]
-            cluster_stats.append({
-                "cluster_id": int(label),
-                "size": int(np.sum(mask)),
-                "mean": cluster_data.mean(axis=0).tolist(),
-                "std": cluster_data.std(axis=0).tolist()
-            })
-        
+
         return {
             "success": True,
             "data": {
-                "labels": labels.tolist(),
-                "n_clusters": len(unique_labels),
+                "labels": labels,
+                "n_clusters": len(np.unique(labels)),
                 "centers": centers,
                 "inertia": inertia,
-                "cluster_stats": cluster_stats,
-                "algorithm": request.algorithm
+                "cluster_stats": _cluster_stats(X, labels, scaler if X_scaled is X else None),
+                "algorithm": request.algorithm,
+                "plan": plan
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+def _sample_index(n: int, size: int) -> Optional[np.ndarray]:
+    if size >= n:
+        return None
+    return np.sort(np.random.default_rng(42).choice(n, size=size, replace=False))
+
+def _connect_components(X: np.ndarray, graph: "sparse.csr_matrix") -> "sparse.csr_matrix":
+    """Bridge the components of a kNN graph along a spanning tree of one point per component.
+
+    AgglomerativeClustering would otherwise join components itself by
+    computing every pairwise distance between them, which is quadratic.
+    """
+    from scipy import sparse
+    from scipy.sparse.csgraph import connected_components, minimum_spanning_tree
+    from scipy.spatial.distance import pdist, squareform
+
+    n_components, component = connected_components(graph, directed=False)
+    if n_components == 1:
+        return graph
+    sizes = np.bincount(component)
+    centroids = np.stack([np.bincount(component, weights=X[:, j]) for j in range(X.shape[1])], axis=1)
+    centroids /= sizes[:, None]
+    # The member of each component closest to its centroid stands in for it.
+    distances = np.sum((X - centroids[component]) ** 2, axis=1)
+    order = np.lexsort((distances, component))
+    representatives = order[np.r_[0, np.cumsum(sizes)[:-1]]]
+    tree = minimum_spanning_tree(squareform(pdist(X[representatives])) + 1e-12).tocoo()
+    bridges = sparse.csr_matrix(
+        (np.ones(tree.nnz), (representatives[tree.row], representatives[tree.col])), shape=graph.shape
+    )
+    return (graph + bridges + bridges.T).tocsr()
+
+def _assign_nearest_centroid(X: np.ndarray, X_fit: np.ndarray, fit_labels: np.ndarray) -> np.ndarray:
+    """Label every row with the cluster whose sample centroid is closest."""
+    from sklearn.neighbors import NearestNeighbors
+
+    ids, inverse = np.unique(fit_labels, return_inverse=True)
+    counts = np.bincount(inverse)
+    centroids = np.stack([np.bincount(inverse, weights=X_fit[:, j]) for j in range(X_fit.shape[1])], axis=1)
+    centroids /= counts[:, None]
+    nearest = NearestNeighbors(n_neighbors=1).fit(centroids)
+    return ids[nearest.kneighbors(X, return_distance=False)[:, 0]]
+
+def _assign_nearest_core(X: np.ndarray, model: "DBSCAN", request: ClusteringRequest, plan: dict) -> np.ndarray:
+    """Give each row the label of its nearest core sample within ``eps``, else noise (-1)."""
+    from sklearn.neighbors import NearestNeighbors
+
+    if len(model.core_sample_indices_) == 0:
+        return np.full(len(X), -1)
+    cores = NearestNeighbors(
+        n_neighbors=1, algorithm=plan["neighbors_algorithm"], leaf_size=request.leaf_size, n_jobs=request.n_jobs
+    ).fit(model.components_)
+    distances, nearest = cores.kneighbors(X)
+    labels = model.labels_[model.core_sample_indices_][nearest[:, 0]]
+    return np.where(distances[:, 0] <= request.eps, labels, -1)
+
+def _cluster_stats(X: np.ndarray, labels: np.ndarray, scaler: Optional["StandardScaler"] = None) -> List[dict]:
+    """Per-cluster size, mean and std, column by column instead of one mask per cluster.
+
+    With ``scaler``, ``X`` holds standardized values and the stats are
+    returned in the original units.
+    """
+    ids, inverse = np.unique(labels, return_inverse=True)
+    sizes = np.bincount(inverse)
+    means = np.empty((len(ids), X.shape[1]))
+    stds = np.empty_like(means)
+    for j in range(X.shape[1]):
+        column = np.asarray(X[:, j], dtype=float)
+        means[:, j] = np.bincount(inverse, weights=column) / sizes
+        deviation = column - means[inverse, j]
+        stds[:, j] = np.sqrt(np.bincount(inverse, weights=deviation * deviation) / sizes)
+    if scaler is not None:
+        means = scaler.inverse_transform(means)
+        stds *= scaler.scale_
+    return [
+        {"cluster_id": int(label), "size": int(size), "mean": mean.tolist(), "std": std.tolist()}
+        for label, size, mean, std in zip(ids, sizes, means, stds)
+    ]
+
+class ClusteringSessionRequest(BaseModel):
+    n_clusters: int = 3
+
+class ClusteringBatchRequest(DatasetRef):
+    data: List[List[float]] = None
+
+@router.post("/clustering/sessions")
+async def create_clustering_session(request: ClusteringSessionRequest):
+    """Start an online k-means session that is updated one batch at a time."""
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.preprocessing import StandardScaler
+
+    state = {
+        "scaler": StandardScaler(),
+        "model": MiniBatchKMeans(n_clusters=request.n_clusters, random_state=42, n_init=3),
+    }
+    try:
+        session = sessions.store.create("clustering", state, request.model_dump())
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    return {"success": True, "data": session.summary(), "error": None}
+
+@router.post("/clustering/sessions/{session_id}", openapi_extra=array_openapi(ClusteringBatchRequest))
+async def update_clustering_session(
+    session_id: str,
+    request: ClusteringBatchRequest = Depends(array_body(ClusteringBatchRequest, "data")),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Fold a batch into the session's centers and label it."""
+    try:
+        session = sessions.store.get(session_id, "clustering")
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    result = await run_in_thread("clustering", _update_clustering_session, session, request)
+    return fmt.render(result, arrays=["labels"])
+
+def _update_clustering_session(session: sessions.Session, request: ClusteringBatchRequest) -> dict:
+    try:
+        X = resolve_matrix(request.data, request)
+        with session.lock:
+            scaler = session.state["scaler"]
+            model = session.state["model"]
+            if hasattr(model, "cluster_centers_"):
+                # The centers keep the precision of the first batch.
+                X = X.astype(model.cluster_centers_.dtype, copy=False)
+            if not hasattr(model, "cluster_centers_"):
+                if len(X) < model.n_clusters:
+                    raise ValueError(f"The first batch needs at least n_clusters={model.n_clusters} rows")
+                # The scaling is fixed by the first batch: refitting it later would move the
+                # coordinates under centers already learned in the old ones.
+                scaler.fit(X)
+            X_scaled = scaler.transform(X)
+            model.partial_fit(X_scaled)
+            labels = model.predict(X_scaled)
+            batch_inertia = float(-model.score(X_scaled))
+            centers = scaler.inverse_transform(model.cluster_centers_).tolist()
+            session.touch(len(X))
+            batches, samples = session.batches, session.samples
+
+        return {
+            "success": True,
+            "data": {
+                "session_id": session.id,
+                "labels": labels,
+                "centers": centers,
+                "batch_inertia": batch_inertia,
+                "batch_cluster_sizes": np.bincount(labels, minlength=model.n_clusters).tolist(),
+                "batches": batches,
+                "samples_seen": samples
+            },
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+register_analysis(
+    "clustering", ClusteringRequest, _perform_clustering, matrix="data", prepared=True, version=VERSION
+)
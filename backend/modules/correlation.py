@@ -1,60 +1,196 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import List, Literal
-from scipy.stats import pearsonr, spearmanr
+from typing import Iterator, List, Literal, Optional, Tuple
+from modules import datasets
+from modules.datasets import DatasetRef, resolve_matrix
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.jobs import register_analysis
+from modules.transport import Records, ResultFormat, array_body, array_openapi, result_format
 
 router = APIRouter()
 
-class CorrelationRequest(BaseModel):
-    data: List[List[float]]
+VERSION = "1.1"
+WARM_IMPORTS = ("pandas",)
+
+# Feature counts up to this return every pair by default ("auto").
+ALL_PAIRS_MAX_FEATURES = 100
+
+class CorrelationRequest(DatasetRef):
+    data: List[List[float]] = None
     method: Literal["pearson", "spearman"] = "pearson"
     feature_names: List[str] = None
+    # "auto" lists every pair for narrow tables and only the top_k for wide ones
+    pairs: Literal["auto", "all", "top_k", "threshold"] = "auto"
+    top_k: int = 10
+    threshold: float = 0.5  # For pairs="threshold": keep |r| >= threshold
+    return_matrix: bool = True
+    nan_policy: Literal["propagate", "pairwise"] = "propagate"
+    block_size: int = 1024  # Columns per tile
+    n_jobs: Optional[int] = None  # Threads computing tiles (-1: all cores)
 
-@router.post("/correlation/analyze")
-async def analyze_correlation(request: CorrelationRequest) -> dict:
+@router.post("/correlation/analyze", openapi_extra=array_openapi(CorrelationRequest))
+async def analyze_correlation(
+    request: CorrelationRequest = Depends(array_body(CorrelationRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
     """Calculate correlation matrix and pairwise correlations."""
+    result = await run_cached("correlation", _analyze_correlation, request, VERSION, cache)
+    return fmt.render(result, arrays=["correlation_matrix"], exclude=["all_correlations"])
+
+def _analyze_correlation(request: CorrelationRequest) -> dict:
     try:
-        data = np.array(request.data)
+        data = resolve_matrix(request.data, request)
         n_features = data.shape[1]
         
         # Generate feature names if not provided
-        if not request.feature_names:
-            feature_names = [f"Feature_{i}" for i in range(n_features)]
-        else:
+        if request.feature_names:
             feature_names = request.feature_names
-        
-        # Calculate correlation matrix
-        if request.method == "pearson":
-            corr_matrix = np.corrcoef(data.T)
-        else:  # spearman
-            from scipy.stats import spearmanr
-            corr_matrix, _ = spearmanr(data, axis=0)
-        
-        # Find strongest correlations
-        correlations = []
-        for i in range(n_features):
-            for j in range(i + 1, n_features):
-                correlations.append({
-                    "feature1": feature_names[i],
-                    "feature2": feature_names[j],
-                    "correlation": float(corr_matrix[i, j]),
-                    "abs_correlation": float(abs(corr_matrix[i, j]))
-                })
-        
-        # Sort by absolute correlation
-        correlations.sort(key=lambda x: x["abs_correlation"], reverse=True)
+        elif request.dataset_id:
+            feature_names = request.columns or datasets.store.meta(request.dataset_id)["numeric_columns"]
+        else:
+            feature_names = [f"Feature_{i}" for i in range(n_features)]
+        names = np.asarray(feature_names, dtype=object)
+
+        pairs = request.pairs
+        if pairs == "auto":
+            pairs = "all" if n_features <= ALL_PAIRS_MAX_FEATURES else "top_k"
+        # The full pair list needs the full matrix anyway.
+        keep_matrix = request.return_matrix or pairs == "all"
+        corr_matrix = np.empty((n_features, n_features), dtype=request.dtype) if keep_matrix else None
+        top = []  # min-heap of (|r|, -i, -j, r) holding the top_k pairs
+        selected = []
+
+        for rows, cols, tile in _correlation_tiles(data, request):
+            if corr_matrix is not None:
+                corr_matrix[np.ix_(rows, cols)] = tile
+                corr_matrix[np.ix_(cols, rows)] = tile.T
+            strength = np.abs(tile)
+            # Only pairs i < j count; NaN (constant columns) never ranks.
+            strength[~(rows[:, None] < cols[None, :]) | np.isnan(strength)] = -1.0
+            flat = strength.ravel()
+            k = min(request.top_k, flat.size)
+            if k > 0:
+                for position in np.argpartition(flat, flat.size - k)[flat.size - k:]:
+                    if flat[position] < 0:
+                        continue
+                    i, j = divmod(int(position), len(cols))
+                    entry = (float(flat[position]), -int(rows[i]), -int(cols[j]), float(tile[i, j]))
+                    if len(top) < request.top_k:
+                        heapq.heappush(top, entry)
+                    elif entry > top[0]:
+                        heapq.heapreplace(top, entry)
+            if pairs == "threshold":
+                i, j = np.nonzero(strength >= request.threshold)
+                selected.append((rows[i], cols[j], tile[i, j]))
+
+        top_correlations = [
+            {
+                "feature1": feature_names[-i],
+                "feature2": feature_names[-j],
+                "correlation": value,
+                "abs_correlation": strength
+            }
+            for strength, i, j, value in sorted(top, key=lambda e: (-e[0], -e[1], -e[2]))
+        ]
+
+        result = {
+            "correlation_matrix": corr_matrix if request.return_matrix else None,
+            "feature_names": feature_names,
+            "top_correlations": top_correlations,
+            "method": request.method,
+            "pairs": pairs
+        }
+        if pairs == "all":
+            i, j = np.triu_indices(n_features, k=1)
+            result["all_correlations"] = _pair_records(names, i, j, corr_matrix[i, j])
+        elif pairs == "threshold":
+            i, j, values = (np.concatenate(parts) for parts in zip(*selected)) if selected else ([], [], [])
+            result["correlations"] = _pair_records(names, np.asarray(i, dtype=int), np.asarray(j, dtype=int),
+                                                   np.asarray(values, dtype=request.dtype))
         
         return {
             "success": True,
-            "data": {
-                "correlation_matrix": corr_matrix.tolist(),
-                "feature_names": feature_names,
-                "top_correlations": correlations[:10],
-                "all_correlations": correlations,
-                "method": request.method
-            },
+            "data": result,
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+def _pair_records(names: np.ndarray, i: np.ndarray, j: np.ndarray, values: np.ndarray) -> Records:
+    """Pairs sorted by absolute correlation, strongest first (NaN last)."""
+    strength = np.abs(values)
+    order = np.argsort(-np.nan_to_num(strength, nan=-1.0), kind="stable")
+    return Records(
+        feature1=names[i[order]],
+        feature2=names[j[order]],
+        correlation=values[order],
+        abs_correlation=strength[order]
+    )
+
+def _correlation_tiles(data: np.ndarray, request: CorrelationRequest) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Yield ``(row_ids, col_ids, tile)`` for every column block pair on or above the diagonal.
+
+    Columns are standardized once so each tile is a single matrix product;
+    tiles are computed ``n_jobs`` at a time on threads (BLAS releases the GIL)
+    and consumed in order, so only a few are alive at once.
+    """
+    dtype = np.dtype(request.dtype)
+    values = np.asarray(data, dtype=dtype)
+    if request.method == "spearman":
+        # Average ranks per column; NaNs stay NaN so pairwise mode can skip them.
+        # (Pairwise mode thus ranks each column over all its present values
+        # rather than re-ranking every pair's shared rows.)
+        import pandas as pd
+
+        values = pd.DataFrame(values).rank(method="average").to_numpy(dtype=dtype)
+
+    if request.nan_policy == "pairwise":
+        mask = ~np.isnan(values)
+        centered = np.where(mask, values - np.nanmean(values, axis=0), 0).astype(dtype)
+        mask = mask.astype(dtype)
+        squared = centered * centered
+
+        def tile(a: slice, b: slice) -> np.ndarray:
+            # Moments over the rows where both columns are present.
+            n = mask[:, a].T @ mask[:, b]
+            sx = centered[:, a].T @ mask[:, b]
+            sy = mask[:, a].T @ centered[:, b]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cov = centered[:, a].T @ centered[:, b] - sx * sy / n
+                vx = squared[:, a].T @ mask[:, b] - sx * sx / n
+                vy = mask[:, a].T @ squared[:, b] - sy * sy / n
+                r = cov / np.sqrt(vx * vy)
+            r[n < 2] = np.nan
+            return np.clip(r, -1.0, 1.0)
+    else:
+        # Centred and scaled in one buffer: the only full-size copy of the input.
+        scaled = values - values.mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scaled /= np.sqrt(np.einsum("ij,ij->j", scaled, scaled))
+
+        def tile(a: slice, b: slice) -> np.ndarray:
+            return np.clip(scaled[:, a].T @ scaled[:, b], -1.0, 1.0)
+
+    p = values.shape[1]
+    step = max(request.block_size, 1)
+    blocks = [(a, b) for a in range(0, p, step) for b in range(a, p, step)]
+
+    def compute(block: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        a, b = block
+        rows = np.arange(a, min(a + step, p))
+        cols = np.arange(b, min(b + step, p))
+        return rows, cols, tile(slice(a, a + step), slice(b, b + step))
+
+    workers = (os.cpu_count() or 1) if request.n_jobs == -1 else max(request.n_jobs or 1, 1)
+    if workers == 1:
+        yield from map(compute, blocks)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(blocks), workers):
+            yield from pool.map(compute, blocks[start:start + workers])
+
+register_analysis("correlation", CorrelationRequest, _analyze_correlation, matrix="data", version=VERSION)
@@ -1,34 +1,64 @@
-from fastapi import APIRouter, UploadFile, File
-from pydantic import BaseModel
-import pandas as pd
+from fastapi import APIRouter, Depends, UploadFile, File
 import numpy as np
-from typing import List, Literal
+from typing import TYPE_CHECKING, Callable, Dict, List, Literal, Optional, Tuple
 import io
-import json
+import hashlib
+from modules import chunked, datasets, metrics
+from modules.datasets import DatasetRef, resolve_matrix, working_dtype
+from modules.cache import CachePolicy, cache_policy, make_key, run_cached
+from modules.executor import run_in_pool, run_in_thread
+from modules.jobs import register_analysis
+from modules.transport import ResultFormat, array_body, array_openapi, result_format
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 router = APIRouter()
 
-class DataCleaningRequest(BaseModel):
-    data: List[List[float]]
+VERSION = "1.1"
+WARM_IMPORTS = ("pandas",)
+
+# Rows parsed per chunk by the streaming upload.
+STREAM_CHUNK_ROWS = 100_000
+
+class DataCleaningRequest(DatasetRef):
+    data: List[List[float]] = None
     handle_missing: Literal["drop", "mean", "median", "zero"] = "mean"
     remove_outliers: bool = False
     outlier_threshold: float = 3.0  # Standard deviations
+    chunk_rows: int = chunked.CHUNK_ROWS
+    output: Literal["inline", "dataset"] = "inline"  # dataset: store the result, return its dataset_id
 
-class DataTransformRequest(BaseModel):
-    data: List[List[float]]
+class DataTransformRequest(DatasetRef):
+    data: List[List[float]] = None
     method: Literal["normalize", "standardize", "minmax"] = "standardize"
+    chunk_rows: int = chunked.CHUNK_ROWS
+    output: Literal["inline", "dataset"] = "inline"
 
 @router.post("/data/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload and parse CSV, JSON, or Excel files."""
+async def upload_file(file: UploadFile = File(...), include_data: bool = False):
+    """Upload and parse CSV, JSON, or Excel files.
+
+    The parsed table is stored server-side; pass the returned ``dataset_id``
+    to the analysis endpoints instead of re-posting the rows. Set
+    ``include_data=true`` to also get every row back as ``full_data``.
+    Without it, CSV files are ingested chunk by chunk like
+    ``/data/upload/stream`` instead of being read into memory whole.
+    """
+    if not include_data and file.filename.endswith('.csv'):
+        return await run_in_thread("data", _ingest_stream, file.file, file.filename, STREAM_CHUNK_ROWS)
+    content = await file.read()
+    return await run_in_pool("data", _parse_upload, file.filename, content, include_data)
+
+def _parse_upload(filename: str, content: bytes, include_data: bool = False) -> dict:
+    import pandas as pd
+
     try:
-        content = await file.read()
-        
-        if file.filename.endswith('.csv'):
+        if filename.endswith('.csv'):
             df = pd.read_csv(io.BytesIO(content))
-        elif file.filename.endswith('.json'):
+        elif filename.endswith('.json'):
             df = pd.read_json(io.BytesIO(content))
-        elif file.filename.endswith(('.xlsx', '.xls')):
+        elif filename.endswith(('.xlsx', '.xls')):
             df = pd.read_excel(io.BytesIO(content))
         else:
             return {"success": False, "data": None, "error": "Unsupported file format"}
@@ -43,94 +73,231 @@ async def upload_file(file: UploadFile = File(...)):
         }
         
         # Sample data
-        sample = df.head(10).to_dict(orient='records')
+        sample = _records(df.head(10))
+        
+        dataset_id = hashlib.sha256(content).hexdigest()[:32]
+        datasets.store.save_frame(dataset_id, df, filename=filename, statistics=stats)
         
         return {
             "success": True,
             "data": {
+                "dataset_id": dataset_id,
                 "statistics": stats,
                 "sample": sample,
-                "full_data": df.to_dict(orient='records')
+                "full_data": _records(df) if include_data else None
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
 
-@router.post("/data/clean")
-async def clean_data(request: DataCleaningRequest) -> dict:
-    """Clean data by handling missing values and outliers."""
+@router.post("/data/upload/stream")
+async def upload_file_stream(file: UploadFile = File(...), chunksize: int = STREAM_CHUNK_ROWS):
+    """Ingest a large CSV or JSONL upload chunk by chunk into the dataset store.
+
+    The file is parsed ``chunksize`` rows at a time and each chunk is appended
+    to the stored dataset as it is read, with the ``statistics`` block built
+    in the same pass, so memory stays bounded by one chunk.
+    """
+    return await run_in_thread("data", _ingest_stream, file.file, file.filename, chunksize)
+
+def _records(df: "pd.DataFrame") -> List[dict]:
+    """Rows as dicts with missing values as None, which JSON can encode."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+class _HashingReader(io.RawIOBase):
+    """Raw reader that hashes everything read through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.raw.read(len(buffer))
+        buffer[:len(data)] = data
+        self.digest.update(data)
+        return len(data)
+
+class _UploadStats:
+    """Accumulates the upload ``statistics`` block one chunk at a time."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: List[str] = []
+        self.dtypes: Dict[str, str] = {}
+        self.missing: Dict[str, int] = {}
+
+    def update(self, chunk: "pd.DataFrame") -> None:
+        self.rows += len(chunk)
+        for column, dtype in chunk.dtypes.astype(str).items():
+            column = str(column)
+            if column not in self.dtypes:
+                self.columns.append(column)
+                self.dtypes[column] = dtype
+            elif self.dtypes[column] != dtype:
+                self.dtypes[column] = _merge_dtype(self.dtypes[column], dtype)
+        for column, count in chunk.isnull().sum().items():
+            self.missing[str(column)] = self.missing.get(str(column), 0) + int(count)
+
+    def result(self, numeric_columns: List[str]) -> dict:
+        return {
+            "shape": [self.rows, len(self.columns)],
+            "columns": self.columns,
+            "dtypes": self.dtypes,
+            "missing_values": self.missing,
+            "numeric_columns": numeric_columns
+        }
+
+def _merge_dtype(a: str, b: str) -> str:
     try:
-        data = np.array(request.data, dtype=float)
-        
-        # Handle missing values (NaN)
-        if request.handle_missing == "drop":
-            data = data[~np.isnan(data).any(axis=1)]
-        elif request.handle_missing == "mean":
-            col_mean = np.nanmean(data, axis=0)
-            inds = np.where(np.isnan(data))
-            data[inds] = np.take(col_mean, inds[1])
-        elif request.handle_missing == "median":
-            col_median = np.nanmedian(data, axis=0)
-            inds = np.where(np.isnan(data))
-            data[inds] = np.take(col_median, inds[1])
-        elif request.handle_missing == "zero":
-            data = np.nan_to_num(data, nan=0.0)
+        merged = np.result_type(np.dtype(a), np.dtype(b))
+    except TypeError:
+        return "object"
+    return str(merged) if merged.kind in "biuf" else "object"
+
+def _ingest_stream(fileobj, filename: str, chunksize: int) -> dict:
+    import pandas as pd
+
+    writer = None
+    try:
+        reader = _HashingReader(fileobj)
+        buffered = io.BufferedReader(reader, buffer_size=1 << 20)
+        if filename.endswith('.csv'):
+            chunks = pd.read_csv(buffered, chunksize=chunksize)
+        elif filename.endswith(('.jsonl', '.ndjson')):
+            chunks = pd.read_json(io.TextIOWrapper(buffered, encoding='utf-8'), lines=True, chunksize=chunksize)
+        else:
+            return {"success": False, "data": None, "error": "Streaming upload supports CSV and JSONL files"}
         
-        # Remove outliers using z-score
-        if request.remove_outliers:
-            z_scores = np.abs((data - np.mean(data, axis=0)) / np.std(data, axis=0))
-            data = data[(z_scores < request.outlier_threshold).all(axis=1)]
+        writer = datasets.store.writer()
+        stats = _UploadStats()
+        sample = []
+        for chunk in chunks:
+            if not sample:
+                sample = _records(chunk.head(10))
+            stats.update(chunk)
+            writer.append(chunk)
+        while buffered.read(1 << 20):  # hash any trailing bytes the parser skipped
+            pass
         
+        dataset_id = reader.digest.hexdigest()[:32]
+        statistics = stats.result(writer.numeric_columns)
+        writer.commit(dataset_id, filename=filename, statistics=statistics)
+        return {
+            "success": True,
+            "data": {"dataset_id": dataset_id, "statistics": statistics, "sample": sample},
+            "error": None
+        }
+    except Exception as e:
+        if writer is not None:
+            writer.abort()
+        return {"success": False, "data": None, "error": str(e)}
+
+@router.post("/data/clean", openapi_extra=array_openapi(DataCleaningRequest))
+async def clean_data(
+    request: DataCleaningRequest = Depends(array_body(DataCleaningRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Clean data by handling missing values and outliers."""
+    result = await run_cached("data", _clean_data, request, VERSION, cache)
+    return fmt.render(result, arrays=["cleaned_data"])
+
+def _clean_data(request: DataCleaningRequest) -> dict:
+    try:
+        def run(chunks, n_columns, write):
+            return chunked.clean(
+                chunks, n_columns, request.handle_missing, request.remove_outliers, request.outlier_threshold, write,
+                working_dtype(request)
+            )
+
+        info, cleaned, dataset_id = _run_chunked("data.clean", request, run)
         return {
             "success": True,
             "data": {
-                "cleaned_data": data.tolist(),
-                "original_shape": request.data.__len__(),
-                "cleaned_shape": len(data),
-                "rows_removed": request.data.__len__() - len(data)
+                "cleaned_data": cleaned,
+                "original_shape": info["original_rows"],
+                "cleaned_shape": info["rows"],
+                "rows_removed": info["original_rows"] - info["rows"],
+                "fill_values": info["fill_values"],
+                "approximate_median": info["approximate_median"],
+                "dataset_id": dataset_id
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
 
-@router.post("/data/transform")
-async def transform_data(request: DataTransformRequest) -> dict:
+@router.post("/data/transform", openapi_extra=array_openapi(DataTransformRequest))
+async def transform_data(
+    request: DataTransformRequest = Depends(array_body(DataTransformRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
     """Transform data using various scaling methods."""
+    result = await run_cached("data", _transform_data, request, VERSION, cache)
+    return fmt.render(result, arrays=["transformed_data"])
+
+def _transform_data(request: DataTransformRequest) -> dict:
     try:
-        data = np.array(request.data)
-        
-        if request.method == "normalize":
-            # L2 normalization
-            norms = np.linalg.norm(data, axis=1, keepdims=True)
-            transformed = data / (norms + 1e-10)
-            
-        elif request.method == "standardize":
-            # Z-score standardization
-            mean = np.mean(data, axis=0)
-            std = np.std(data, axis=0)
-            transformed = (data - mean) / (std + 1e-10)
-            
-        elif request.method == "minmax":
-            # Min-max scaling to [0, 1]
-            min_val = np.min(data, axis=0)
-            max_val = np.max(data, axis=0)
-            transformed = (data - min_val) / (max_val - min_val + 1e-10)
-        
+        def run(chunks, n_columns, write):
+            return chunked.transform(chunks, n_columns, request.method, write, working_dtype(request))
+
+        info, transformed, dataset_id = _run_chunked("data.transform", request, run)
         return {
             "success": True,
             "data": {
-                "transformed_data": transformed.tolist(),
+                "transformed_data": transformed,
                 "method": request.method,
-                "original_stats": {
-                    "mean": np.mean(data, axis=0).tolist(),
-                    "std": np.std(data, axis=0).tolist(),
-                    "min": np.min(data, axis=0).tolist(),
-                    "max": np.max(data, axis=0).tolist()
-                }
+                "original_stats": {key: info[key] for key in ("mean", "std", "min", "max")},
+                "dataset_id": dataset_id
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+def _run_chunked(name: str, request, run: Callable) -> Tuple[dict, Optional[np.ndarray], Optional[str]]:
+    """Call ``run(chunks, n_columns, write)`` over the request's input, ``chunk_rows`` rows at a time.
+
+    Returns ``(info, values, dataset_id)``. Inline output collects the
+    chunks into one array. ``output="dataset"`` appends them to a new
+    stored dataset, so memory stays bounded by a chunk. Its id hashes the
+    request, so repeating the request reuses the stored result.
+    """
+    if request.chunk_rows < 1:
+        raise ValueError("chunk_rows must be positive")
+    if request.dataset_id:
+        meta = datasets.store.meta(request.dataset_id)
+        columns = list(request.columns) if request.columns is not None else meta["numeric_columns"]
+        rows = meta["rows"]
+        metrics.record_input((rows, len(columns)))
+        chunks = lambda: datasets.store.chunks(request.dataset_id, columns, request.chunk_rows)
+    else:
+        X = resolve_matrix(request.data, request)
+        rows, columns = len(X), [f"x{j}" for j in range(X.shape[1])]
+        chunks = lambda: (X[start:start + request.chunk_rows] for start in range(0, rows, request.chunk_rows))
+
+    if request.output == "inline":
+        sink = chunked.ArraySink(rows, len(columns), working_dtype(request))
+        return run(chunks, len(columns), sink.write), sink.result(), None
+
+    dataset_id = make_key(name, VERSION, request)[:32]
+    if datasets.store.exists(dataset_id):
+        return datasets.store.meta(dataset_id)["result"], None, dataset_id
+    writer = datasets.store.writer()
+    try:
+        info = run(chunks, len(columns), lambda values: writer.append_matrix(values, columns))
+        writer.commit(dataset_id, derived_from=request.dataset_id, operation=name, result=info)
+    except Exception:
+        writer.abort()
+        raise
+    return info, None, dataset_id
+
+register_analysis("data_clean", DataCleaningRequest, _clean_data, endpoint="data", matrix="data", version=VERSION)
+register_analysis(
+    "data_transform", DataTransformRequest, _transform_data, endpoint="data", matrix="data", version=VERSION
+)
@@ -0,0 +1,342 @@
+"""Server-side dataset store: upload once, analyze by reference.
+
+Uploaded tables are written under ``DATASET_DIR/<dataset_id>/`` as
+
+* ``numeric.f8`` - the numeric columns as one column-major (Fortran-order)
+  little-endian float64 matrix, opened later with ``np.memmap`` so analyses
+  share the page cache instead of each holding a parsed copy, and a column
+  selection reads only those columns' bytes;
+* ``text.jsonl`` - the remaining (text/categorical) columns, one JSON list
+  per row;
+* ``meta.json`` - column names, row count and upload statistics.
+
+The dataset id is a hash of the uploaded bytes, so an id always names the
+same content and cached results keyed on it stay valid.
+
+Analysis requests inherit ``DatasetRef`` and may send ``dataset_id`` (plus a
+column selection) instead of inline ``data``. Its ``dtype`` picks the working
+precision of the resolved matrix: ``float64`` or, to halve memory and
+bandwidth, ``float32``. When it is unset the server default applies
+(``NUMERIC_DTYPE``).
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Literal, Optional
+
+import numpy as np
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, field_validator
+
+from modules import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+router = APIRouter()
+
+DTYPES = ("float64", "float32")
+
+# Working precision for requests that leave ``dtype`` unset; see ``configure``.
+default_dtype = "float64"
+
+# Rows converted at a time when a dataset is read in another precision.
+_CONVERT_ROWS = 65536
+
+
+class DatasetRef(BaseModel):
+    """Request fields for analysing a stored dataset instead of inline data, and the working precision."""
+
+    dataset_id: Optional[str] = None
+    columns: Optional[List[str]] = None
+    dtype: Optional[Literal["float64", "float32"]] = Field(None, validate_default=True)
+
+    @field_validator("dtype")
+    @classmethod
+    def _server_dtype(cls, value: Optional[str]) -> str:
+        # Resolved at parse time so cache keys and job parameters record the precision used.
+        return value or default_dtype
+
+
+class DatasetNotFound(KeyError):
+    def __str__(self) -> str:
+        return f"Dataset '{self.args[0]}' not found"
+
+
+class DatasetStore:
+    """Directory of memory-mapped datasets."""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, dataset_id: str, name: str = "") -> str:
+        if not dataset_id.isalnum():
+            raise DatasetNotFound(dataset_id)
+        return os.path.join(self.root, dataset_id, name) if name else os.path.join(self.root, dataset_id)
+
+    def exists(self, dataset_id: str) -> bool:
+        return os.path.exists(self.path(dataset_id, "meta.json"))
+
+    def writer(self) -> "DatasetWriter":
+        return DatasetWriter(self)
+
+    def save_frame(self, dataset_id: str, df: "pd.DataFrame", **extra: Any) -> dict:
+        """Persist ``df`` under ``dataset_id`` and return its metadata."""
+        if self.exists(dataset_id):
+            return self.meta(dataset_id)
+        writer = self.writer()
+        try:
+            writer.append(df)
+            return writer.commit(dataset_id, **extra)
+        except Exception:
+            writer.abort()
+            raise
+
+    def meta(self, dataset_id: str) -> dict:
+        try:
+            with open(self.path(dataset_id, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise DatasetNotFound(dataset_id)
+
+    def list(self) -> List[dict]:
+        names = sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []
+        return [self.meta(name) for name in names if name.isalnum() and self.exists(name)]
+
+    def delete(self, dataset_id: str) -> None:
+        if not self.exists(dataset_id):
+            raise DatasetNotFound(dataset_id)
+        shutil.rmtree(self.path(dataset_id))
+
+    def matrix(self, dataset_id: str, columns: Optional[Iterable[str]] = None, dtype: Optional[str] = None) -> np.ndarray:
+        """Numeric columns as a read-only memmap; a column subset or another ``dtype`` is copied out.
+
+        A conversion (e.g. to ``float32``) is filled a block of rows at a
+        time, so it never holds a float64 copy of the selection as well.
+        """
+        meta = self.meta(dataset_id)
+        names = meta["numeric_columns"]
+        shape = (meta["rows"], len(names))
+        if 0 in shape:
+            values = np.empty(shape)
+        else:
+            # Datasets stored before the columnar layout are row-major.
+            order = "F" if meta.get("layout") == "columns" else "C"
+            values = np.memmap(self.path(dataset_id, "numeric.f8"), dtype="<f8", mode="r", shape=shape, order=order)
+        index = None
+        if columns is not None and list(columns) != names:
+            index = [_column_index(names, name, dataset_id) for name in columns]
+        if dtype is None or np.dtype(dtype) == values.dtype:
+            return values if index is None else values[:, index]
+        out = np.empty((shape[0], shape[1] if index is None else len(index)), dtype=dtype)
+        for start in range(0, len(out), _CONVERT_ROWS):
+            block = values[start:start + _CONVERT_ROWS]
+            out[start:start + _CONVERT_ROWS] = block if index is None else block[:, index]
+        return out
+
+    def chunks(self, dataset_id: str, columns: Optional[Iterable[str]] = None, rows: int = 65536) -> Iterator[np.ndarray]:
+        """The selected columns ``rows`` rows at a time, so only one chunk is ever copied out."""
+        values = self.matrix(dataset_id)
+        names = self.meta(dataset_id)["numeric_columns"]
+        index = None
+        if columns is not None and list(columns) != names:
+            index = [_column_index(names, name, dataset_id) for name in columns]
+        for start in range(0, len(values), max(rows, 1)):
+            chunk = values[start:start + max(rows, 1)]
+            yield chunk if index is None else chunk[:, index]
+
+    def text(self, dataset_id: str, column: str) -> List[Any]:
+        meta = self.meta(dataset_id)
+        index = _column_index(meta["text_columns"], column, dataset_id)
+        with open(self.path(dataset_id, "text.jsonl")) as f:
+            return [json.loads(line)[index] for line in f]
+
+
+class DatasetWriter:
+    """Appends DataFrame chunks to a new dataset, committed under its id at the end.
+
+    The column layout is fixed by the first chunk; later chunks are aligned to
+    it and their numeric columns coerced, so the whole table never has to be
+    in memory at once. Rows are appended to a scratch file as they arrive and
+    rewritten column-major on commit, once the row count is known.
+    """
+
+    def __init__(self, store: DatasetStore):
+        self.store = store
+        self.tmp = os.path.join(store.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(self.tmp)
+        self.rows = 0
+        self.columns: Optional[List[str]] = None
+        self.numeric_columns: List[str] = []
+        self.text_columns: List[str] = []
+        self._numeric = open(os.path.join(self.tmp, "rows.f8"), "wb")
+        self._text = None
+
+    def append(self, chunk: "pd.DataFrame") -> None:
+        import pandas as pd
+
+        chunk = chunk.rename(columns=str)
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.numeric_columns = list(chunk.select_dtypes(include=[np.number]).columns)
+            self.text_columns = [c for c in self.columns if c not in self.numeric_columns]
+            if self.text_columns:
+                self._text = open(os.path.join(self.tmp, "text.jsonl"), "w")
+        chunk = chunk.reindex(columns=self.columns)
+        numeric = chunk[self.numeric_columns].apply(pd.to_numeric, errors="coerce")
+        self._numeric.write(np.ascontiguousarray(numeric.to_numpy(dtype="<f8")).tobytes())
+        if self._text is not None:
+            text = chunk[self.text_columns].astype(object)
+            for row in text.where(text.notna(), None).itertuples(index=False):
+                self._text.write(json.dumps(list(row), default=str) + "\n")
+        self.rows += len(chunk)
+
+    def append_matrix(self, values: np.ndarray, columns: List[str]) -> None:
+        """Append an all-numeric chunk as-is, without going through pandas."""
+        if self.columns is None:
+            self.columns = list(columns)
+            self.numeric_columns = list(columns)
+        elif list(columns) != self.numeric_columns or self.text_columns:
+            raise ValueError("Matrix chunks must have the dataset's numeric columns and no text columns")
+        self._numeric.write(np.ascontiguousarray(values, dtype="<f8").tobytes())
+        self.rows += len(values)
+
+    def commit(self, dataset_id: str, **extra: Any) -> dict:
+        self._close()
+        self._write_columns()
+        meta = {
+            "dataset_id": dataset_id,
+            "layout": "columns",
+            "rows": self.rows,
+            "columns": self.columns or [],
+            "numeric_columns": self.numeric_columns,
+            "text_columns": self.text_columns,
+            "created_at": time.time(),
+            **extra,
+        }
+        with open(os.path.join(self.tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, default=str)
+        try:
+            os.rename(self.tmp, self.store.path(dataset_id))
+        except OSError:  # stored concurrently by another worker
+            self.abort()
+            return self.store.meta(dataset_id)
+        return meta
+
+    def _write_columns(self) -> None:
+        """Rewrite the appended rows column-major into ``numeric.f8``, a block of rows at a time."""
+        source = os.path.join(self.tmp, "rows.f8")
+        shape = (self.rows, len(self.numeric_columns))
+        if 0 not in shape:
+            rows = np.memmap(source, dtype="<f8", mode="r", shape=shape)
+            out = np.memmap(os.path.join(self.tmp, "numeric.f8"), dtype="<f8", mode="w+", shape=shape, order="F")
+            for start in range(0, shape[0], _CONVERT_ROWS):
+                out[start:start + _CONVERT_ROWS] = rows[start:start + _CONVERT_ROWS]
+            out.flush()
+            del rows, out
+        os.remove(source)
+
+    def abort(self) -> None:
+        self._close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _close(self) -> None:
+        self._numeric.close()
+        if self._text is not None:
+            self._text.close()
+
+
+def _column_index(names: List[str], name: str, dataset_id: str) -> int:
+    try:
+        return names.index(name)
+    except ValueError:
+        raise ValueError(f"Column '{name}' not found in dataset '{dataset_id}' (available: {names})")
+
+
+store = DatasetStore(os.path.join(os.path.dirname(os.path.dirname(__file__)), "datastore"))
+
+
+def configure(root: str, dtype: str = "float64") -> None:
+    """Set the dataset directory and the default working precision (``float64`` or ``float32``)."""
+    global store, default_dtype
+    if dtype not in DTYPES:
+        raise ValueError(f"Unknown dtype '{dtype}', expected one of {list(DTYPES)}")
+    store = DatasetStore(root)
+    default_dtype = dtype
+
+
+def working_dtype(ref: DatasetRef) -> np.dtype:
+    """The precision ``ref`` asks for, or the server default."""
+    return np.dtype(getattr(ref, "dtype", None) or default_dtype)
+
+
+def owned(values: np.ndarray, data: Any) -> bool:
+    """Whether ``values`` is a private buffer resolved from ``data``, safe to modify in place.
+
+    True for arrays parsed from JSON rows or converted to another dtype;
+    false for the caller's own array, a decoded binary body or a memmap.
+    """
+    return values is not data and values.flags.writeable and values.flags.c_contiguous and values.base is None
+
+
+def resolve_matrix(data: Any, ref: DatasetRef, columns: Optional[List[str]] = None) -> np.ndarray:
+    """Inline ``data`` as an array of the working dtype, or the referenced dataset's columns."""
+    dtype = working_dtype(ref)
+    with metrics.span("load"):
+        if ref.dataset_id:
+            values = store.matrix(ref.dataset_id, columns if columns is not None else ref.columns, dtype)
+        elif data is None:
+            raise ValueError("Provide either inline data or a dataset_id")
+        else:
+            values = np.asarray(data, dtype=dtype)
+    metrics.record_input(values.shape)
+    return values
+
+
+def resolve_column(data: Any, ref: DatasetRef, column: Optional[str]) -> np.ndarray:
+    """A single numeric series, inline or from one dataset column."""
+    with metrics.span("load"):
+        if ref.dataset_id:
+            names = [column] if column else ref.columns
+            if not names or len(names) != 1:
+                raise ValueError("Select exactly one column of the dataset")
+            values = store.matrix(ref.dataset_id, names, working_dtype(ref))[:, 0]
+        elif data is None:
+            raise ValueError("Provide either inline data or a dataset_id")
+        else:
+            values = np.asarray(data, dtype=working_dtype(ref))
+    metrics.record_input(values.shape)
+    return values
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "data": None, "error": message})
+
+
+@router.get("/datasets")
+async def list_datasets():
+    """List stored datasets."""
+    return {"success": True, "data": {"datasets": store.list()}, "error": None}
+
+
+@router.get("/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """Return the metadata and statistics of a stored dataset."""
+    try:
+        return {"success": True, "data": store.meta(dataset_id), "error": None}
+    except DatasetNotFound as e:
+        return _error(404, str(e))
+
+
+@router.delete("/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """Remove a stored dataset."""
+    try:
+        store.delete(dataset_id)
+    except DatasetNotFound as e:
+        return _error(404, str(e))
+    return {"success": True, "data": {"dataset_id": dataset_id}, "error": None}
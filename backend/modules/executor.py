@@ -0,0 +1,221 @@
+"""Bounded worker pool for the CPU-bound analysis fits.
+
+Handlers hand their blocking sklearn/Qiskit work to ``run_in_pool`` so the
+event loop stays free for ``/health`` and every other request. Each endpoint
+gets its own concurrency limit plus a bounded wait queue; once both are full
+new work is rejected with ``QueueFullError`` (served as HTTP 429 by main.py).
+"""
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Literal, Optional, Tuple
+
+from modules import metrics
+
+PoolKind = Literal["thread", "process"]
+
+
+class QueueFullError(Exception):
+    """Raised when an endpoint has no free worker slot and no queue room left."""
+
+    def __init__(self, endpoint: str, retry_after: int = 1):
+        super().__init__(f"Too many pending '{endpoint}' requests, retry later")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class EndpointLimiter:
+    """Concurrency limit and queue-depth backpressure for one endpoint."""
+
+    def __init__(self, name: str, concurrency: int, queue_depth: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_depth = max(0, queue_depth)
+        self.pending = 0  # running + waiting
+        self.running = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def admit(self) -> None:
+        """Reserve a slot for one unit of work or raise ``QueueFullError``."""
+        if self.pending >= self.concurrency + self.queue_depth:
+            self.rejected += 1
+            raise QueueFullError(self.name)
+        self.pending += 1
+
+    def release(self) -> None:
+        """Give back an admitted slot that will never run."""
+        self.pending -= 1
+
+    async def _acquire(self) -> None:
+        waited = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self.release()
+            raise
+        metrics.record("queue", time.perf_counter() - waited)
+        self.running += 1
+
+    def _done(self, future: Optional[asyncio.Future] = None) -> None:
+        if future is not None and not future.cancelled():
+            future.exception()  # mark retrieved: nobody awaits work whose caller went away
+        self.running -= 1
+        self._semaphore.release()
+        self.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait for a free slot and hold it for the block. Requires ``admit``.
+
+        Only for work awaited inside the block; work handed to a worker
+        thread goes through ``call`` so the slot outlives a cancellation.
+        """
+        await self._acquire()
+        try:
+            yield
+        finally:
+            self._done()
+
+    async def call(self, start: Callable[[], Awaitable[Any]]) -> Any:
+        """Wait for a slot, then await ``start()``. Requires ``admit``.
+
+        If the caller is cancelled the work keeps its slot until it actually
+        finishes: a pool thread cannot be interrupted, so releasing early
+        would let more fits run than the limit allows.
+        """
+        await self._acquire()
+        try:
+            work = asyncio.ensure_future(start())
+        except BaseException:
+            self._done()
+            raise
+        work.add_done_callback(self._done)
+        with metrics.span("compute"):
+            return await asyncio.shield(work)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run ``fn`` on the shared pool once a slot frees up. Requires ``admit``."""
+        return await self.call(partial(submit, fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "waiting": self.pending - self.running,
+            "rejected": self.rejected,
+        }
+
+
+_config: Dict[str, Any] = {
+    "kind": "thread",
+    "workers": os.cpu_count() or 4,
+    "concurrency": 2,
+    "queue_depth": 8,
+    "limits": {},
+}
+_executor: Optional[Executor] = None
+_limiters: Dict[str, EndpointLimiter] = {}
+
+
+def configure(
+    kind: PoolKind = "thread",
+    workers: Optional[int] = None,
+    concurrency: int = 2,
+    queue_depth: int = 8,
+    limits: Optional[Dict[str, Tuple[int, Optional[int]]]] = None,
+) -> None:
+    """Set pool type/size and the default and per-endpoint (concurrency, queue_depth)."""
+    if kind not in ("thread", "process"):
+        raise ValueError(f"Unknown executor kind: {kind}")
+    shutdown()
+    _config.update(
+        kind=kind,
+        workers=workers or os.cpu_count() or 4,
+        concurrency=concurrency,
+        queue_depth=queue_depth,
+        limits=dict(limits or {}),
+    )
+    _limiters.clear()
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[int, Optional[int]]]:
+    """Parse ``"lda=1:4,clustering=4"`` into ``{endpoint: (concurrency, queue_depth)}``.
+
+    A missing queue depth falls back to the configured default.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        concurrency, _, depth = value.partition(":")
+        limits[name.strip()] = (int(concurrency), int(depth) if depth else None)
+    return limits
+
+
+def get_executor() -> Executor:
+    """Return the shared pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        if _config["kind"] == "process":
+            _executor = ProcessPoolExecutor(max_workers=_config["workers"])
+        else:
+            _executor = ThreadPoolExecutor(max_workers=_config["workers"], thread_name_prefix="analysis")
+    return _executor
+
+
+def get_limiter(endpoint: str) -> EndpointLimiter:
+    limiter = _limiters.get(endpoint)
+    if limiter is None:
+        concurrency, depth = _config["limits"].get(endpoint, (_config["concurrency"], None))
+        if depth is None:
+            depth = _config["queue_depth"]
+        limiter = _limiters[endpoint] = EndpointLimiter(endpoint, concurrency, depth)
+    return limiter
+
+
+async def submit(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run ``fn`` on the shared pool without any endpoint limit."""
+    loop = asyncio.get_running_loop()
+    call = partial(fn, *args, **kwargs)
+    if _config["kind"] != "process":
+        # Carry the request's trace into the worker thread so spans there count.
+        call = partial(contextvars.copy_context().run, call)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+async def run_in_pool(endpoint: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking ``fn`` on the worker pool under ``endpoint``'s limits."""
+    limiter = get_limiter(endpoint)
+    limiter.admit()
+    return await limiter.run(fn, *args, **kwargs)
+
+
+async def run_in_thread(endpoint: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Like ``run_in_pool`` but always on a thread of this process.
+
+    For work that needs in-process state or unpicklable arguments (open
+    files, live sessions) even when the shared pool is a process pool.
+    """
+    limiter = get_limiter(endpoint)
+    limiter.admit()
+    return await limiter.call(partial(asyncio.to_thread, fn, *args, **kwargs))
+
+
+def stats() -> dict:
+    return {
+        "kind": _config["kind"],
+        "workers": _config["workers"],
+        "endpoints": {name: limiter.stats() for name, limiter in _limiters.items()},
+    }
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,320 @@
+"""Background jobs for long-running analyses.
+
+Any router can expose its analysis here with ``register_analysis``; clients
+then ``POST /api/jobs/{analysis}`` with the usual request body, get a job id
+back straight away and poll for status and the result instead of holding a
+connection open for the whole fit. Finished jobs are kept in memory for a
+TTL, and large results can be spilled to disk.
+
+Long analyses call ``report_progress`` from their main loop (chunks scored,
+rows accumulated, series blocks solved); outside a job it does nothing.
+"""
+import asyncio
+import os
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import partial
+from typing import Callable, Dict, Optional, Type
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+
+from modules import executor
+from modules.transport import ResultFormat, result_format
+
+router = APIRouter()
+
+
+class Analysis:
+    """A registered analysis: its request model, blocking function and pool endpoint.
+
+    ``matrix`` names the request field holding the numeric input matrix, for
+    analyses that ``/api/batch`` can feed from a shared dataset; with
+    ``prepared`` the function also accepts a ``prepared=PreparedMatrix``
+    keyword and reuses its standardized/polynomial views. ``version`` is the
+    module's result-cache version, for deterministic analyses.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        request_model: Type[BaseModel],
+        fn: Callable[..., dict],
+        endpoint: str,
+        matrix: Optional[str] = None,
+        prepared: bool = False,
+        version: Optional[str] = None,
+    ):
+        self.name = name
+        self.request_model = request_model
+        self.fn = fn
+        self.endpoint = endpoint
+        self.matrix = matrix
+        self.prepared = prepared
+        self.version = version
+
+
+_analyses: Dict[str, Analysis] = {}
+
+
+def register_analysis(
+    name: str,
+    request_model: Type[BaseModel],
+    fn: Callable[..., dict],
+    endpoint: Optional[str] = None,
+    matrix: Optional[str] = None,
+    prepared: bool = False,
+    version: Optional[str] = None,
+) -> None:
+    """Make ``fn(request) -> {success, data, error}`` submittable as a job."""
+    _analyses[name] = Analysis(name, request_model, fn, endpoint or name, matrix=matrix, prepared=prepared,
+                               version=version)
+
+
+def get_analysis(name: str) -> Optional[Analysis]:
+    return _analyses.get(name)
+
+
+def analysis_names() -> list:
+    return sorted(_analyses)
+
+
+# Progress callback of the job whose analysis runs in this context.
+_progress: ContextVar[Optional[Callable[[float], None]]] = ContextVar("job_progress", default=None)
+
+
+def report_progress(fraction: float) -> None:
+    """Record that the running analysis is ``fraction`` (0..1) done.
+
+    The job's context is copied into the pool thread, so this reaches the
+    job for thread pools; in a process pool it is a no-op and the job only
+    moves from 0 to 1. Call it from the thread running the analysis, not
+    from threads it starts itself.
+    """
+    update = _progress.get()
+    if update is not None:
+        update(fraction)
+
+
+class Job:
+    """State of one submitted analysis."""
+
+    def __init__(self, analysis: str):
+        self.id = uuid.uuid4().hex
+        self.analysis = analysis
+        self.status = "queued"  # queued | running | completed | failed | cancelled
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.spill_path: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def advance(self, fraction: float) -> None:
+        if not self.done:
+            self.progress = max(self.progress, min(float(fraction), 1.0))
+
+    def summary(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "analysis": self.analysis,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round(end - (self.started_at or self.created_at), 3),
+            "result_spilled": self.spill_path is not None,
+        }
+
+
+class JobStore:
+    """In-process job table with TTL eviction and optional on-disk result spill."""
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_jobs: int = 1000,
+        spill_dir: Optional[str] = None,
+        spill_threshold: int = 1 << 20,
+    ):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.spill_dir = spill_dir
+        self.spill_threshold = spill_threshold
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def add(self, job: Job) -> None:
+        self.evict()
+        self._jobs[job.id] = job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self.evict()
+        return self._jobs.get(job_id)
+
+    def all(self) -> list:
+        self.evict()
+        return list(self._jobs.values())
+
+    def store_result(self, job: Job, result: dict) -> None:
+        """Keep ``result`` in memory, or on disk when it exceeds the spill threshold."""
+        if self.spill_dir:
+            blob = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(blob) > self.spill_threshold:
+                job.spill_path = os.path.join(self.spill_dir, f"{job.id}.pkl")
+                with open(job.spill_path, "wb") as f:
+                    f.write(blob)
+                return
+        job.result = result
+
+    def load_result(self, job: Job) -> Optional[dict]:
+        if job.spill_path:
+            with open(job.spill_path, "rb") as f:
+                return pickle.load(f)
+        return job.result
+
+    def remove(self, job_id: str) -> None:
+        job = self._jobs.pop(job_id, None)
+        if job and job.spill_path and os.path.exists(job.spill_path):
+            os.remove(job.spill_path)
+
+    def evict(self) -> None:
+        """Drop finished jobs past their TTL, then the oldest finished ones over ``max_jobs``."""
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.done and now - job.finished_at > self.ttl:
+                self.remove(job.id)
+        finished = [job.id for job in self._jobs.values() if job.done]
+        for job_id in finished[: max(0, len(self._jobs) - self.max_jobs)]:
+            self.remove(job_id)
+
+
+store = JobStore()
+
+
+def configure(
+    ttl: float = 3600.0,
+    max_jobs: int = 1000,
+    spill_dir: Optional[str] = None,
+    spill_threshold: int = 1 << 20,
+) -> None:
+    """Replace the job store; running jobs in the old store are left to finish."""
+    global store
+    store = JobStore(ttl=ttl, max_jobs=max_jobs, spill_dir=spill_dir, spill_threshold=spill_threshold)
+
+
+def _finish(job: Job, status: str, error: Optional[str] = None) -> None:
+    job.status = status
+    job.error = error
+    job.progress = 1.0
+    job.finished_at = time.time()
+
+
+async def _run_job(job: Job, limiter: executor.EndpointLimiter, analysis: Analysis, request: BaseModel) -> None:
+    _progress.set(job.advance)
+
+    def start():
+        job.status = "running"
+        job.started_at = time.time()
+        return executor.submit(analysis.fn, request)
+
+    try:
+        result = await limiter.call(start)
+        store.store_result(job, result)
+        _finish(job, "completed" if result.get("success") else "failed", result.get("error"))
+    except asyncio.CancelledError:
+        _finish(job, "cancelled")
+    except Exception as e:
+        _finish(job, "failed", str(e))
+
+
+def _on_task_done(job: Job, limiter: executor.EndpointLimiter, task: asyncio.Task) -> None:
+    # A task cancelled before its first step never enters the slot, so its
+    # admitted place in the queue has to be handed back here.
+    if task.cancelled():
+        limiter.release()
+        _finish(job, "cancelled")
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "data": None, "error": message})
+
+
+@router.post("/jobs/{analysis}")
+async def submit_job(analysis: str, http_request: Request):
+    """Queue an analysis in the background and return its job id."""
+    entry = _analyses.get(analysis)
+    if entry is None:
+        return _error(404, f"Unknown analysis '{analysis}', expected one of {sorted(_analyses)}")
+    try:
+        request = entry.request_model.model_validate(await http_request.json())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    limiter = executor.get_limiter(entry.endpoint)
+    limiter.admit()
+    job = Job(analysis)
+    store.add(job)
+    job.task = asyncio.create_task(_run_job(job, limiter, entry, request))
+    job.task.add_done_callback(partial(_on_task_done, job, limiter))
+    return {"success": True, "data": job.summary(), "error": None}
+
+
+@router.get("/jobs")
+async def list_jobs():
+    """List known jobs, newest last."""
+    return {"success": True, "data": {"jobs": [job.summary() for job in store.all()]}, "error": None}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the status and progress of a job."""
+    job = store.get(job_id)
+    if job is None:
+        return _error(404, f"Job '{job_id}' not found or expired")
+    return {"success": True, "data": job.summary(), "error": None}
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, fmt: ResultFormat = Depends(result_format)):
+    """Return the analysis response of a finished job (JSON or NDJSON; ``fields`` applies)."""
+    job = store.get(job_id)
+    if job is None:
+        return _error(404, f"Job '{job_id}' not found or expired")
+    if not job.done:
+        return _error(409, f"Job '{job_id}' is still {job.status}")
+    if job.status == "cancelled":
+        return _error(409, f"Job '{job_id}' was cancelled")
+    return fmt.json(store.load_result(job))
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job.
+
+    A queued job never starts. A fit that is already running cannot be
+    interrupted inside the worker; it keeps its endpoint slot until it
+    finishes, and its result is discarded.
+    """
+    job = store.get(job_id)
+    if job is None:
+        return _error(404, f"Job '{job_id}' not found or expired")
+    if not job.done and job.task is not None:
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+    return {"success": True, "data": job.summary(), "error": None}
@@ -1,41 +1,191 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import LatentDirichletAllocation
-from typing import List
+import numpy as np
+from typing import TYPE_CHECKING, List, Literal, Optional, Union
+from modules import datasets, sessions
+from modules.datasets import DatasetRef
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.executor import run_in_thread
+from modules.jobs import register_analysis
+from modules.transport import ResultFormat, result_format
+
+if TYPE_CHECKING:
+    from sklearn.decomposition import LatentDirichletAllocation
 
 router = APIRouter()
 
-class LDARequest(BaseModel):
-    texts: List[str]
+VERSION = "1.0"
+WARM_IMPORTS = ("sklearn.feature_extraction.text", "sklearn.decomposition")
+
+class LDARequest(DatasetRef):
+    texts: List[str] = None
+    text_column: Optional[str] = None  # dataset column holding the documents
     n_topics: int = 5
+    # LDA models term counts; "tfidf" stays the default for existing clients
+    vectorizer: Literal["tfidf", "count"] = "tfidf"
+    n_jobs: Optional[int] = None
 
 @router.post("/lda/analyze")
-async def analyze_topics(request: LDARequest) -> dict:
+async def analyze_topics(request: LDARequest, cache: CachePolicy = Depends(cache_policy)) -> dict:
     """Extract topics from text data using LDA."""
+    return await run_cached("lda", _analyze_topics, request, VERSION, cache)
+
+def _analyze_topics(request: LDARequest) -> dict:
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+    from sklearn.decomposition import LatentDirichletAllocation
+
     try:
-        vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
-        tfidf = vectorizer.fit_transform(request.texts)
+        if request.vectorizer == "count":
+            vectorizer = CountVectorizer(max_features=100, stop_words='english')
+        else:
+            vectorizer = TfidfVectorizer(max_features=100, stop_words='english')
+        tfidf = vectorizer.fit_transform(_resolve_texts(request))
         
-        lda = LatentDirichletAllocation(n_components=request.n_topics, random_state=42)
+        lda = LatentDirichletAllocation(n_components=request.n_topics, random_state=42, n_jobs=request.n_jobs)
         lda.fit(tfidf)
         
-        feature_names = vectorizer.get_feature_names_out()
-        topics = []
-        
-        for topic_idx, topic in enumerate(lda.components_):
-            top_indices = topic.argsort()[-10:][::-1]
-            keywords = [feature_names[i] for i in top_indices]
-            topics.append({
-                "topic_id": topic_idx,
-                "keywords": keywords,
-                "weights": topic[top_indices].tolist()
-            })
-        
         return {
             "success": True,
-            "data": {"topics": topics, "n_topics": request.n_topics},
+            "data": {"topics": _topics(lda, vectorizer.get_feature_names_out()), "n_topics": request.n_topics},
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+def _topics(lda: "LatentDirichletAllocation", feature_names: np.ndarray, top_words: int = 10) -> List[dict]:
+    topics = []
+    for topic_idx, topic in enumerate(lda.components_):
+        top_indices = topic.argsort()[-top_words:][::-1]
+        topics.append({
+            "topic_id": topic_idx,
+            "keywords": [feature_names[i] for i in top_indices],
+            "weights": topic[top_indices].tolist()
+        })
+    return topics
+
+def _resolve_texts(request: Union[LDARequest, "LDABatchRequest"]) -> List[str]:
+    if request.dataset_id:
+        if not request.text_column:
+            raise ValueError("Topic modeling on a dataset needs a text_column")
+        return [str(text) for text in datasets.store.text(request.dataset_id, request.text_column) if text]
+    if request.texts is None:
+        raise ValueError("Provide either texts or a dataset_id")
+    return request.texts
+
+class LDASessionRequest(BaseModel):
+    n_topics: int = 5
+    max_features: int = 10000
+    vocabulary: Optional[List[str]] = None  # fixed vocabulary; by default taken from the first batch
+    batch_size: int = 128  # documents per online update
+    learning_decay: float = 0.7
+    learning_offset: float = 10.0
+    total_samples: int = 1_000_000  # expected corpus size, scales each update
+    n_jobs: Optional[int] = None
+    top_words: int = 10
+
+class LDABatchRequest(DatasetRef):
+    texts: List[str] = None
+    text_column: Optional[str] = None
+
+@router.post("/lda/sessions")
+async def create_lda_session(request: LDASessionRequest):
+    """Start an online LDA session with a persistent vocabulary."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.decomposition import LatentDirichletAllocation
+
+    vectorizer = CountVectorizer(
+        max_features=None if request.vocabulary else request.max_features,
+        stop_words='english',
+        vocabulary=request.vocabulary
+    )
+    lda = LatentDirichletAllocation(
+        n_components=request.n_topics,
+        learning_method="online",
+        batch_size=request.batch_size,
+        learning_decay=request.learning_decay,
+        learning_offset=request.learning_offset,
+        total_samples=request.total_samples,
+        n_jobs=request.n_jobs,
+        random_state=42
+    )
+    try:
+        session = sessions.store.create("lda", {"vectorizer": vectorizer, "lda": lda}, request.model_dump(exclude={"vocabulary"}))
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    return {"success": True, "data": session.summary(), "error": None}
+
+@router.post("/lda/sessions/{session_id}")
+async def update_lda_session(session_id: str, request: LDABatchRequest) -> dict:
+    """Fold a batch of documents into the session's topics with ``partial_fit``."""
+    try:
+        session = sessions.store.get(session_id, "lda")
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    return await run_in_thread("lda", _update_lda_session, session, request)
+
+@router.post("/lda/sessions/{session_id}/infer")
+async def infer_lda_session(
+    session_id: str, request: LDABatchRequest, fmt: ResultFormat = Depends(result_format)
+) -> dict:
+    """Topic mixtures of new documents under the current model, without updating it."""
+    try:
+        session = sessions.store.get(session_id, "lda")
+    except sessions.SessionError as e:
+        return sessions.error_response(e)
+    result = await run_in_thread("lda", _infer_lda_session, session, request)
+    return fmt.render(result, arrays=["doc_topics", "dominant_topic"])
+
+def _update_lda_session(session: sessions.Session, request: LDABatchRequest) -> dict:
+    try:
+        texts = _resolve_texts(request)
+        with session.lock:
+            vectorizer = session.state["vectorizer"]
+            lda = session.state["lda"]
+            if not hasattr(vectorizer, "vocabulary_"):
+                # The first batch fixes the vocabulary; later words outside it are ignored.
+                vectorizer.fit(texts)
+            counts = vectorizer.transform(texts)
+            lda.partial_fit(counts)
+            topics = _topics(lda, vectorizer.get_feature_names_out(), session.config["top_words"])
+            session.touch(len(texts))
+            batches, samples = session.batches, session.samples
+
+        return {
+            "success": True,
+            "data": {
+                "session_id": session.id,
+                "topics": topics,
+                "n_topics": lda.n_components,
+                "vocabulary_size": len(vectorizer.vocabulary_),
+                "batch_tokens": int(counts.sum()),
+                "batches": batches,
+                "samples_seen": samples
+            },
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+def _infer_lda_session(session: sessions.Session, request: LDABatchRequest) -> dict:
+    try:
+        texts = _resolve_texts(request)
+        with session.lock:
+            vectorizer = session.state["vectorizer"]
+            lda = session.state["lda"]
+            if not hasattr(lda, "components_"):
+                raise ValueError("Post at least one batch to the session before inferring")
+            doc_topics = lda.transform(vectorizer.transform(texts))
+
+        return {
+            "success": True,
+            "data": {
+                "session_id": session.id,
+                "doc_topics": doc_topics,
+                "dominant_topic": doc_topics.argmax(axis=1)
+            },
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+register_analysis("lda", LDARequest, _analyze_topics, version=VERSION)
@@ -0,0 +1,245 @@
+"""Analysis modules: cheap to import, heavy dependencies loaded on first use.
+
+Each analysis module (``quantum``, ``lda``, ``clustering``, ...) imports
+qiskit, sklearn, scipy or pandas inside the functions that need them and
+lists those imports in ``WARM_IMPORTS``. The API process, and each uvicorn
+or pool worker, only pays for a dependency once an endpoint needs it.
+
+``load`` imports the enabled modules. A module left out with
+``DISABLED_MODULES`` gets no routes, no job or batch registration and none
+of its dependencies. ``warm_up`` runs the deferred imports and the module's
+own ``warm_up()`` hook, if it has one (e.g. building the QRNG circuit),
+before the first request. It runs in the background or before the server
+reports ready.
+
+``GET /api/modules`` reports what is loaded and what it cost.
+``python -m modules.loader`` measures cold import costs in fresh
+interpreters.
+"""
+import argparse
+import importlib
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import APIRouter
+
+router = APIRouter()
+
+ANALYSIS_MODULES = ("quantum", "lda", "anomaly", "clustering", "regression", "timeseries", "correlation", "dataprocessing")
+
+# Reported as loaded or not by GET /api/modules.
+HEAVY_DEPENDENCIES = ("qiskit", "qiskit_aer", "sklearn", "scipy", "pandas")
+
+_modules: Dict[str, dict] = {}
+_disabled: List[str] = []
+_ready: Dict[str, Optional[float]] = {"startup_seconds": None}
+_lock = threading.Lock()
+
+
+def _status_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def rss() -> Optional[int]:
+    """Current resident set size in bytes (Linux)."""
+    return _status_kb("VmRSS")
+
+
+def peak_rss() -> int:
+    """Peak resident set size in bytes."""
+    return _status_kb("VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _process_age() -> Optional[float]:
+    """Seconds since this process started (Linux), else ``None``."""
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - started / os.sysconf("SC_CLK_TCK"), 3)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def parse_names(value: Optional[str]) -> List[str]:
+    """Module names from a comma-separated setting; ``all`` means every analysis module."""
+    names = [name.strip() for name in (value or "").split(",") if name.strip()]
+    if "all" in names:
+        return list(ANALYSIS_MODULES)
+    unknown = sorted(set(names) - set(ANALYSIS_MODULES))
+    if unknown:
+        raise ValueError(f"Unknown modules {unknown}, expected some of {list(ANALYSIS_MODULES)}")
+    return names
+
+
+def load(disabled: Iterable[str] = ()) -> Dict[str, ModuleType]:
+    """Import the analysis modules not in ``disabled``, in ``ANALYSIS_MODULES`` order."""
+    disabled = set(disabled)
+    _disabled[:] = [name for name in ANALYSIS_MODULES if name in disabled]
+    for name in ANALYSIS_MODULES:
+        if name in disabled or name in _modules:
+            continue
+        before = rss()
+        started = time.perf_counter()
+        module = importlib.import_module(f"modules.{name}")
+        _modules[name] = {
+            "module": module,
+            "import_seconds": round(time.perf_counter() - started, 4),
+            "import_rss_bytes": rss() - before if before is not None else None,
+            "warm_up": "cold",
+            "warm_up_seconds": None,
+            "error": None,
+        }
+    return {name: entry["module"] for name, entry in _modules.items()}
+
+
+def warm_up(names: Iterable[str], background: bool = True) -> Optional[threading.Thread]:
+    """Run the deferred imports and ``warm_up()`` hooks of loaded modules among ``names``."""
+    names = [name for name in names if name in _modules]
+    if not background:
+        for name in names:
+            _warm(name)
+        return None
+    thread = threading.Thread(target=lambda: [_warm(name) for name in names], name="module-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def _warm(name: str) -> None:
+    entry = _modules[name]
+    with _lock:
+        if entry["warm_up"] in ("warming", "warm"):
+            return
+        entry["warm_up"] = "warming"
+    started = time.perf_counter()
+    try:
+        for dependency in getattr(entry["module"], "WARM_IMPORTS", ()):
+            importlib.import_module(dependency)
+        hook = getattr(entry["module"], "warm_up", None)
+        if hook is not None:
+            hook()
+        entry.update(warm_up="warm", warm_up_seconds=round(time.perf_counter() - started, 4))
+    except Exception as e:
+        # A failed warm-up only costs latency: the endpoint imports on first use again.
+        entry.update(warm_up="failed", error=str(e))
+
+
+def mark_ready() -> None:
+    """Record how long the process took to start serving."""
+    _ready["startup_seconds"] = _process_age()
+
+
+def report() -> dict:
+    modules = {}
+    for name, entry in _modules.items():
+        warm_imports = getattr(entry["module"], "WARM_IMPORTS", ())
+        modules[name] = {
+            **{key: value for key, value in entry.items() if key != "module"},
+            "dependencies_loaded": all(dependency in sys.modules for dependency in warm_imports),
+        }
+    return {
+        "startup_seconds": _ready["startup_seconds"],
+        "modules": modules,
+        "disabled": list(_disabled),
+        "heavy_dependencies": {name: name in sys.modules for name in HEAVY_DEPENDENCIES},
+        "rss_bytes": rss(),
+        "peak_rss_bytes": peak_rss(),
+    }
+
+
+@router.get("/modules")
+async def get_modules():
+    """Loaded analysis modules, their import and warm-up cost, and process memory."""
+    return {"success": True, "data": report(), "error": None}
+
+
+# Run in a fresh interpreter per measurement: ``import main``, then warm the
+# modules named on the command line.
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+from modules import loader
+imported, import_rss = time.perf_counter() - started, loader.rss()
+started = time.perf_counter()
+loader.warm_up(sys.argv[1:], background=False)
+print(json.dumps({
+    "import_seconds": imported, "import_rss_bytes": import_rss,
+    "warm_seconds": time.perf_counter() - started, "rss_bytes": loader.rss(), "peak_rss_bytes": loader.peak_rss(),
+    "failed": {n: e["error"] for n, e in loader._modules.items() if e["warm_up"] == "failed"},
+}))
+"""
+
+
+def _probe(names: List[str], env: Dict[str, str], repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        done = subprocess.run(
+            [sys.executable, "-c", _PROBE, *names], capture_output=True, text=True, env=env,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        if done.returncode != 0:
+            raise RuntimeError(done.stderr.strip().splitlines()[-1] if done.stderr.strip() else "probe failed")
+        runs.append({**json.loads(done.stdout.strip().splitlines()[-1]), "process_seconds": time.perf_counter() - started})
+    # Median of each figure over the runs.
+    result = {key: statistics.median(run[key] for run in runs) for key in runs[0] if key != "failed"}
+    result["failed"] = runs[-1]["failed"]
+    return result
+
+
+def import_cost_report(disabled: Iterable[str] = (), repeat: int = 3) -> dict:
+    """Cold ``import main`` cost, and the extra cost of warming each module (and all of them)."""
+    disabled = list(disabled)
+    env = {**os.environ, "DISABLED_MODULES": ",".join(disabled), "WARMUP_MODULES": ""}
+    enabled = [name for name in ANALYSIS_MODULES if name not in disabled]
+    rows = {"startup": _probe([], env, repeat)}
+    for name in enabled:
+        rows[name] = _probe([name], env, repeat)
+    rows["all"] = _probe(enabled, env, repeat)
+    return {"python": sys.version.split()[0], "disabled": disabled, "repeat": repeat, "results": rows}
+
+
+def _print_report(report_: dict) -> None:
+    base = report_["results"]["startup"]
+    mb = 2 ** 20
+    print(f"{'':<16} {'process s':>10} {'import s':>9} {'warm s':>8} {'RSS MB':>8} {'+RSS MB':>8}")
+    for name, row in report_["results"].items():
+        extra = round((row["rss_bytes"] - base["rss_bytes"]) / mb, 1) + 0.0 if name != "startup" else 0.0
+        label = "import main" if name == "startup" else f"+ {name}"
+        note = f"  failed: {row['failed']}" if row["failed"] else ""
+        print(
+            f"{label:<16} {row['process_seconds']:>10.3f} {row['import_seconds']:>9.3f} {row['warm_seconds']:>8.3f} "
+            f"{row['rss_bytes'] / mb:>8.1f} {extra:>8.1f}{note}"
+        )
+    if report_["disabled"]:
+        print(f"disabled: {', '.join(report_['disabled'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API startup time and per-module import cost.")
+    parser.add_argument("--disable", default="", help="comma-separated modules to leave out, as DISABLED_MODULES")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement (median)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    result = import_cost_report(parse_names(args.disable), repeat=args.repeat)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_report(result)
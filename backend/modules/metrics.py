@@ -0,0 +1,408 @@
+"""Prometheus metrics, per-stage request timing and slow-request profiling.
+
+``MetricsMiddleware`` records, for every HTTP request, latency, in-flight
+count, request/response body sizes and status by route template.
+``GET /metrics`` serves them with everything else in the Prometheus text
+exposition format; no client library is needed.
+
+Code on the request path times named stages with ``span("fit")`` (or
+``record("queue", seconds)``). Stage timings go into a histogram and into
+the response's ``Server-Timing`` header, so a slow request shows whether
+the time went to reading the body, parsing, waiting for a worker, the fit
+or serialization. Analyses report the shape of their input matrix with
+``record_input`` and failed results with ``record_error``.
+
+With ``configure(slow_seconds=...)`` a sampling profiler snapshots thread
+stacks while requests are in flight and writes the collapsed stacks of any
+request slower than that to ``profile_dir`` (flamegraph.pl / speedscope
+"folded" format).
+"""
+import asyncio
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from fastapi import APIRouter
+from fastapi.responses import Response
+from starlette.routing import Match
+
+router = APIRouter()
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette appends the charset
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = tuple(float(256 * 4 ** k) for k in range(12))  # 256 B .. 1 GiB
+COUNT_BUCKETS = tuple(float(10 ** k) for k in range(9))  # 1 .. 100M
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield from self._samples(key, value)
+
+    def _samples(self, key: Tuple[str, ...], value: Any) -> Iterator[str]:
+        yield f"{self.name}{self._labels(key)} {_number(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key: Tuple[str, ...], value: Any) -> Iterator[str]:
+        counts, total, count = value
+        cumulative = 0
+        for bound, hits in zip(self.buckets, counts):
+            cumulative += hits
+            le = 'le="%s"' % _number(bound)
+            yield f"{self.name}_bucket{self._labels(key, le)} {cumulative}"
+        yield f"{self.name}_sum{self._labels(key)} {_number(total)}"
+        yield f"{self.name}_count{self._labels(key)} {count}"
+
+
+registry: List[_Metric] = []
+_scrape_hooks: List[Callable[[], None]] = []
+
+requests_total = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "endpoint", "status"))
+request_seconds = Histogram("http_request_duration_seconds", "Time from request start to the last body byte.",
+                            ("method", "endpoint"))
+in_flight = Gauge("http_requests_in_flight", "Requests currently being served.", ("endpoint",))
+request_bytes = Histogram("http_request_size_bytes", "Request body size.", ("endpoint",), SIZE_BUCKETS)
+response_bytes = Histogram("http_response_size_bytes", "Response body size.", ("endpoint",), SIZE_BUCKETS)
+stage_seconds = Histogram("request_stage_duration_seconds", "Time spent in named stages of a request.",
+                          ("endpoint", "stage"))
+input_rows = Histogram("analysis_input_rows", "Rows of the input matrix per analysis.", ("endpoint",), COUNT_BUCKETS)
+input_columns = Histogram("analysis_input_columns", "Columns of the input matrix per analysis.", ("endpoint",),
+                          COUNT_BUCKETS)
+analysis_errors = Counter("analysis_errors_total", "Analyses that returned success=false.", ("endpoint",))
+profiles_written = Counter("slow_request_profiles_total", "Profiles written for slow requests.", ("endpoint",))
+
+
+def on_scrape(hook: Callable[[], None]) -> None:
+    """Call ``hook`` before every scrape, e.g. to copy pool or cache counters into gauges."""
+    _scrape_hooks.append(hook)
+
+
+def render() -> str:
+    for hook in _scrape_hooks:
+        hook()
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
+class Trace:
+    """Stage timings (and profiler samples) of one HTTP request."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.samples: StackCounter = StackCounter()
+
+    def server_timing(self) -> str:
+        totals: Dict[str, float] = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return ", ".join(f"{re.sub(r'[^A-Za-z0-9_-]', '_', stage)};dur={seconds * 1000:.2f}"
+                         for stage, seconds in totals.items())
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def _endpoint(trace: Optional[Trace]) -> str:
+    return trace.endpoint if trace is not None else "background"
+
+
+def record(stage: str, seconds: float, trace: Optional[Trace] = None) -> None:
+    """Add a measured stage to the current (or given) request."""
+    trace = trace or _trace.get()
+    stage_seconds.observe(seconds, endpoint=_endpoint(trace), stage=stage)
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the enclosed block as ``stage`` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def timed(chunks: Iterable[bytes], stage: str) -> Iterator[bytes]:
+    """Wrap a lazily encoded response body so its encoding time counts as ``stage``."""
+    trace = _trace.get()
+    iterator = iter(chunks)
+    spent = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                spent += time.perf_counter() - started
+            yield chunk
+    finally:
+        record(stage, spent, trace)
+
+
+def record_input(shape: Tuple[int, ...]) -> None:
+    """Count the rows and columns an analysis is about to process."""
+    endpoint = _endpoint(_trace.get())
+    input_rows.observe(shape[0] if shape else 0, endpoint=endpoint)
+    input_columns.observe(shape[1] if len(shape) > 1 else 1, endpoint=endpoint)
+
+
+def record_error() -> None:
+    analysis_errors.inc(endpoint=_endpoint(_trace.get()))
+
+
+class _Sampler:
+    """Samples every thread's stack while at least one traced request is in flight.
+
+    One daemon thread serves all requests: each sample is credited to every
+    request running at that moment, so concurrent requests share stacks.
+    Threads parked in a wait (idle pool workers, the event loop's selector)
+    are skipped.
+    """
+
+    _IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.active: Set[Trace] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-sampler", daemon=True)
+        self._thread.start()
+
+    def add(self, trace: Trace) -> None:
+        with self._lock:
+            self.active.add(trace)
+            self._wake.set()
+
+    def remove(self, trace: Trace) -> None:
+        with self._lock:
+            self.active.discard(trace)
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            with self._lock:
+                traces = list(self.active)
+                if not traces:
+                    self._wake.clear()
+                    continue
+            stacks = [_collapse(frame) for ident, frame in sys._current_frames().items() if ident != me]
+            stacks = [stack for stack in stacks if stack and not self._idle(stack)]
+            for trace in traces:
+                trace.samples.update(stacks)
+
+    def _idle(self, stack: str) -> bool:
+        leaf = stack.rsplit(";", 1)[-1]
+        filename = leaf.split(":", 1)[0]
+        return filename in self._IDLE_FILES or leaf == "thread.py:_worker"
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+_profiling: Dict[str, Any] = {"slow_seconds": None, "dir": None, "keep": 100, "sampler": None}
+
+
+def configure(slow_seconds: Optional[float] = None, profile_dir: Optional[str] = None,
+              interval: float = 0.01, keep: int = 100) -> None:
+    """Enable slow-request profiles: requests over ``slow_seconds`` dump stacks to ``profile_dir``."""
+    _profiling.update(slow_seconds=slow_seconds, dir=profile_dir, keep=keep)
+    if slow_seconds and profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+        if _profiling["sampler"] is None:
+            _profiling["sampler"] = _Sampler(interval)
+        else:
+            _profiling["sampler"].interval = interval
+
+
+def _write_profile(trace: Trace, seconds: float) -> None:
+    """Write ``trace``'s folded stacks to the profile directory; runs on a worker thread."""
+    directory = _profiling["dir"]
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", trace.endpoint).strip("_") or "root"
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{int(seconds * 1000)}ms.folded")
+    try:
+        with open(path, "w") as f:
+            for stack, count in trace.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        profiles_written.inc(endpoint=trace.endpoint)
+        # Keep only the newest profiles.
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".folded"))
+        for name in names[:max(len(names) - _profiling["keep"], 0)]:
+            os.remove(os.path.join(directory, name))
+    except OSError:
+        pass  # profiling must never fail the request
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request metrics; streamed bodies are timed to their last byte."""
+
+    def __init__(self, app, routes: Sequence = ()):
+        self.app = app
+        self.routes = routes
+
+    def _endpoint(self, scope) -> str:
+        # Same precedence as the router: the first full match wins, a partial
+        # (path-only, e.g. wrong method) match is used only when none exists.
+        partial = None
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint = self._endpoint(scope)
+        method = scope["method"]
+        trace = Trace(endpoint)
+        token = _trace.set(trace)
+        sampler = _profiling["sampler"] if _profiling["slow_seconds"] else None
+        if sampler is not None:
+            sampler.add(trace)
+        in_flight.inc(endpoint=endpoint)
+        state = {"status": 500, "received": 0, "sent": 0}
+
+        async def receive_counted():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                timing = trace.server_timing()
+                if timing:
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", timing.encode())]}
+            elif message["type"] == "http.response.body":
+                state["sent"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            seconds = time.perf_counter() - trace.started
+            in_flight.dec(endpoint=endpoint)
+            requests_total.inc(method=method, endpoint=endpoint, status=state["status"])
+            request_seconds.observe(seconds, method=method, endpoint=endpoint)
+            request_bytes.observe(state["received"], endpoint=endpoint)
+            response_bytes.observe(state["sent"], endpoint=endpoint)
+            _trace.reset(token)
+            if sampler is not None:
+                sampler.remove(trace)
+                if seconds >= _profiling["slow_seconds"] and trace.samples:
+                    # Fire and forget: the file I/O stays off the event loop.
+                    asyncio.get_running_loop().run_in_executor(None, _write_profile, trace, seconds)
@@ -0,0 +1,228 @@
+"""Declarative preprocessing pipelines executed server-side.
+
+``POST /api/pipeline/run`` takes the input matrix, an ordered list of steps
+(impute, outlier filter, scale) and an optional model spec, so cleaned data
+never travels back to the client just to be re-posted for the fit.
+
+Each step's output is memoized under a hash of the input and every step up
+to it. Re-running a pipeline that only changes its last step (or only the
+model) resumes from the cached prefix. Steps work in place on one buffer of
+the request's ``dtype``; the only copies are the initial one and the
+snapshots kept in the stage cache.
+"""
+import hashlib
+import json
+import time
+from typing import Annotated, List, Literal, Optional, Tuple, Union
+
+import numpy as np
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from modules.batch import AnalysisSpec, build_spec, resolve_inputs, run_spec
+from modules.cache import ResultCache
+from modules.datasets import DatasetRef, owned
+from modules.executor import run_in_thread
+from modules.prepared import PreparedMatrix, frozen
+from modules.transport import ResultFormat, array_body, array_openapi, result_format
+
+router = APIRouter()
+
+VERSION = "1.0"
+
+# Rows moved per slice when compacting the buffer after a row filter.
+_COMPACT_ROWS = 65536
+
+
+class ImputeStep(BaseModel):
+    op: Literal["impute"]
+    method: Literal["drop", "mean", "median", "zero"] = "mean"
+
+
+class OutlierStep(BaseModel):
+    op: Literal["outliers"]
+    threshold: float = 3.0  # Standard deviations
+
+
+class ScaleStep(BaseModel):
+    op: Literal["scale"]
+    method: Literal["normalize", "standardize", "minmax"] = "standardize"
+
+
+PipelineStep = Annotated[Union[ImputeStep, OutlierStep, ScaleStep], Field(discriminator="op")]
+
+
+class PipelineRequest(DatasetRef):
+    data: List[List[float]] = None
+    y: List[float] = None  # regression target for inline data
+    target: Optional[str] = None  # dataset column holding y
+    steps: List[PipelineStep] = []
+    model: Optional[AnalysisSpec] = None
+    return_data: bool = False  # include the preprocessed matrix in the response
+
+
+def _held_bytes(values: np.ndarray) -> int:
+    """Bytes an array keeps alive: the whole allocation for a view, not just the view."""
+    return values.base.nbytes if isinstance(values.base, np.ndarray) else values.nbytes
+
+
+def _entry_bytes(entry: Tuple[np.ndarray, np.ndarray]) -> int:
+    return _held_bytes(entry[0]) + _held_bytes(entry[1])
+
+
+stages = ResultCache(max_bytes=512 << 20, ttl=600.0, sizeof=_entry_bytes)
+
+
+def configure(max_bytes: int = 512 << 20, ttl: float = 600.0) -> None:
+    global stages
+    stages = ResultCache(max_bytes=max_bytes, ttl=ttl, sizeof=_entry_bytes)
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "data": None, "error": message})
+
+
+@router.post("/pipeline/run", openapi_extra=array_openapi(PipelineRequest))
+async def run_pipeline(
+    request: PipelineRequest = Depends(array_body(PipelineRequest, "data")),
+    fmt: ResultFormat = Depends(result_format),
+):
+    """Run impute/outlier/scale steps and an optional model in one request."""
+    if request.model is not None:
+        # Reject a bad model spec before any preprocessing runs.
+        has_y = request.y is not None or bool(request.dataset_id and request.target)
+        try:
+            build_spec(request.model, np.empty((0, 0)), np.empty(0) if has_y else None, ("model",))
+        except ValueError as e:
+            return _error(422, str(e))
+    result = await run_in_thread("pipeline", _run_pipeline, request)
+    return fmt.render(result, arrays=["processed_data"])
+
+
+def _run_pipeline(request: PipelineRequest) -> dict:
+    try:
+        X, y = resolve_inputs(request)
+        keys = [_input_key(request, X)]
+        for step in request.steps:
+            keys.append(hashlib.sha256(f"{keys[-1]}\n{step.model_dump_json()}".encode()).hexdigest())
+
+        # Resume after the longest prefix of steps whose output is cached.
+        start, entry = 0, None
+        for index in range(len(request.steps), 0, -1):
+            entry = stages.get(keys[index])
+            if entry is not None:
+                start = index
+                break
+        if not request.steps:
+            buffer, rows = X, None
+        elif entry is None:
+            # Inline JSON rows were already parsed into a fresh array that can be reused.
+            buffer, rows = (X if owned(X, request.data) else np.array(X, order="C")), None
+        elif start < len(request.steps):
+            buffer, rows = np.array(entry[0]), entry[1]
+        else:
+            buffer, rows = entry  # fully cached: used read-only, no copy
+
+        report = [{"op": step.op, "cached": True} for step in request.steps[:start]]
+        for index in range(start, len(request.steps)):
+            step = request.steps[index]
+            started = time.perf_counter()
+            buffer, kept = _apply(step, buffer)
+            if kept is not None:
+                rows = kept if rows is None else rows[kept]
+            final = index == len(request.steps) - 1
+            if final and _held_bytes(buffer) > 2 * buffer.nbytes:
+                buffer = buffer.copy()  # a compacted prefix would pin the whole original buffer
+            # Intermediate snapshots are copies since later steps keep mutating the buffer.
+            snapshot = frozen(buffer if final else buffer.copy())
+            if final:
+                buffer = snapshot
+            stages.put(keys[index + 1], (snapshot, frozen(rows if rows is not None else np.arange(len(X)))))
+            report.append({"op": step.op, "cached": False, "seconds": round(time.perf_counter() - started, 4)})
+        if rows is not None and len(rows) == len(X):
+            rows = None  # an unfiltered cache entry stores the identity index
+
+        data = {
+            "steps": report,
+            "shape": list(buffer.shape),
+            "original_rows": len(X),
+            "rows_removed": len(X) - len(buffer),
+            "processed_data": buffer if request.return_data else None,
+            "model": None
+        }
+        if request.model is not None:
+            target = y if y is None or rows is None else y[rows]
+            analysis, model_request = build_spec(request.model, buffer, target, ("model",))
+            result = run_spec(analysis, model_request, PreparedMatrix(buffer))
+            if not result.get("success"):
+                return result
+            data["model"] = {"analysis": request.model.analysis, **result["data"]}
+
+        return {"success": True, "data": data, "error": None}
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+
+def _input_key(request: PipelineRequest, X: np.ndarray) -> str:
+    digest = hashlib.sha256(f"pipeline@{VERSION}\n".encode())
+    if request.dataset_id:
+        # Dataset ids are content hashes already; the dtype is the resolved working precision.
+        digest.update(json.dumps([request.dataset_id, request.columns, request.target, X.dtype.str]).encode())
+    else:
+        digest.update(f"{X.dtype.str}:{X.shape}\n".encode())
+        digest.update(np.ascontiguousarray(X).data)
+    return digest.hexdigest()
+
+
+def _apply(step: PipelineStep, buffer: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Run one step on ``buffer`` in place; returns the buffer and kept row indices, if rows were dropped."""
+    if step.op == "impute":
+        missing = np.isnan(buffer)
+        if not missing.any():
+            return buffer, None
+        if step.method == "drop":
+            return _compact(buffer, ~missing.any(axis=1))
+        if step.method == "zero":
+            fill = 0.0
+        elif step.method == "mean":
+            fill = np.nanmean(buffer, axis=0)
+        else:
+            fill = np.nanmedian(buffer, axis=0)
+        np.copyto(buffer, np.broadcast_to(fill, buffer.shape), where=missing)
+        return buffer, None
+
+    if step.op == "outliers":
+        mean = buffer.mean(axis=0)
+        std = buffer.std(axis=0)
+        keep = np.ones(len(buffer), dtype=bool)
+        for j in np.flatnonzero(std > 0):  # a constant column has no outliers
+            keep &= np.abs(buffer[:, j] - mean[j]) < step.threshold * std[j]
+        return _compact(buffer, keep) if not keep.all() else (buffer, None)
+
+    if step.method == "standardize":
+        mean = buffer.mean(axis=0)
+        std = buffer.std(axis=0)
+        buffer -= mean
+        buffer /= std + 1e-10
+    elif step.method == "minmax":
+        low = buffer.min(axis=0)
+        span = buffer.max(axis=0) - low
+        buffer -= low
+        buffer /= span + 1e-10
+    else:
+        buffer /= np.linalg.norm(buffer, axis=1, keepdims=True) + 1e-10
+    return buffer, None
+
+
+def _compact(buffer: np.ndarray, keep: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Move the kept rows to the front of ``buffer`` and return that prefix.
+
+    Kept row ``i`` always comes from position ``>= i``, so copying slice by
+    slice in order never overwrites a row that is still to be moved.
+    """
+    index = np.flatnonzero(keep)
+    for start in range(0, len(index), _COMPACT_ROWS):
+        chunk = index[start:start + _COMPACT_ROWS]
+        buffer[start:start + len(chunk)] = buffer[chunk]
+    return buffer[:len(index)], index
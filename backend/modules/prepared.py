@@ -0,0 +1,59 @@
+"""Preprocessed views of one input matrix, computed once and shared.
+
+When several analyses run over the same data (``/api/batch``), each asks a
+``PreparedMatrix`` for the standardized matrix or the polynomial features
+instead of recomputing them. Views are built lazily on first use; analyses
+running on other threads that want the same view wait for that one build.
+"""
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+
+class PreparedMatrix:
+    """A feature matrix plus memoized transforms of it. Views are read-only."""
+
+    def __init__(self, X: np.ndarray):
+        self.X = X
+        self._views: Dict[Any, Any] = {}
+        self._locks: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def view(self, key: Any, build: Callable[[], Any]) -> Any:
+        """Return the view named ``key``, building it with ``build()`` the first time."""
+        with self._lock:
+            if key in self._views:
+                return self._views[key]
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if key not in self._views:
+                self._views[key] = build()
+            return self._views[key]
+
+    def scaled(self) -> Tuple[np.ndarray, "StandardScaler"]:
+        """Standardized copy of ``X`` and the fitted scaler."""
+        def build():
+            from sklearn.preprocessing import StandardScaler
+
+            scaler = StandardScaler()
+            return frozen(scaler.fit_transform(self.X)), scaler
+        return self.view("scaled", build)
+
+    def polynomial(self, degree: int) -> Tuple[np.ndarray, "PolynomialFeatures"]:
+        """Polynomial expansion of ``X`` and the fitted transformer."""
+        def build():
+            from sklearn.preprocessing import PolynomialFeatures
+
+            poly = PolynomialFeatures(degree=degree)
+            return frozen(poly.fit_transform(self.X)), poly
+        return self.view(("polynomial", degree), build)
+
+
+def frozen(values: np.ndarray) -> np.ndarray:
+    """Mark ``values`` read-only so a shared array cannot be modified in place."""
+    values.flags.writeable = False
+    return values
@@ -1,37 +1,209 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
-from qiskit import QuantumCircuit
-from qiskit_aer import AerSimulator
+import hashlib
+import threading
+from collections import deque
+from typing import Literal
 import numpy as np
+from modules.executor import run_in_thread
+from modules.jobs import register_analysis
+from modules.transport import ResultFormat, result_format
 
 router = APIRouter()
 
+WARM_IMPORTS = ("qiskit", "qiskit_aer")
+
+# Quantum bytes keying each SHAKE-256 expansion (256 bits).
+SEED_BYTES = 32
+
 class QuantumRequest(BaseModel):
     num_values: int = 10
     max_value: int = 100
+    # "quantum": every value from measured bits; "expanded": SHAKE-256 output keyed by fresh quantum bytes
+    source: Literal["quantum", "expanded"] = "quantum"
+
+class EntropyPool:
+    """Bytes of measured Hadamard-circuit output, refilled in the background.
+
+    The simulator and the transpiled circuit are built once. Each refill runs
+    one bulk job with per-shot memory, so requests only copy bytes out of the
+    pool instead of paying for circuit construction and a simulator run.
+    """
+
+    def __init__(self, capacity: int = 1 << 20, shots: int = 1 << 16, qubits: int = 8):
+        if qubits not in (8, 16):
+            raise ValueError("QRNG circuits use 8 or 16 qubits")
+        self.capacity = capacity
+        self.shots = shots
+        self.qubits = qubits
+        self.bytes_generated = 0
+        self.bytes_served = 0
+        self._chunks: "deque[np.ndarray]" = deque()
+        self._available = 0
+        self._lock = threading.Lock()
+        self._wanted = threading.Condition(self._lock)
+        self._simulator = None
+        self._circuit = None
+        self._refiller = None
+
+    def _warm(self) -> None:
+        if self._circuit is None:
+            # qiskit is imported here, on first use (see modules.loader).
+            from qiskit import QuantumCircuit, transpile
+            from qiskit_aer import AerSimulator
+
+            qc = QuantumCircuit(self.qubits, self.qubits)
+            qc.h(range(self.qubits))
+            qc.measure(range(self.qubits), range(self.qubits))
+            self._simulator = AerSimulator()
+            self._circuit = transpile(qc, self._simulator)
+
+    def _draw(self, shots: int) -> np.ndarray:
+        """Run ``shots`` measurements and return their bits packed as bytes."""
+        self._warm()
+        result = self._simulator.run(self._circuit, shots=shots, memory=True).result()
+        # Raw per-shot memory is hex; parsing it directly skips building bit strings.
+        memory = result.results[0].data.memory
+        words = np.fromiter((int(word, 16) for word in memory), dtype=f"<u{self.qubits // 8}", count=len(memory))
+        return words.view(np.uint8)
+
+    def _refill_forever(self) -> None:
+        while True:
+            with self._lock:
+                if self._available >= self.capacity:
+                    # Full: sleep until half is drained, so a stream of small takes
+                    # (expansion seeds) does not wake a simulator run each.
+                    while self._available > self.capacity // 2:
+                        self._wanted.wait()
+            try:
+                chunk = self._draw(self.shots)
+            except Exception:
+                # Requests keep drawing inline; the next take() restarts the refiller.
+                with self._lock:
+                    self._refiller = None
+                return
+            with self._lock:
+                self._chunks.append(chunk)
+                self._available += len(chunk)
+                self.bytes_generated += len(chunk)
+
+    def _start(self) -> None:
+        if self._refiller is None:
+            self._refiller = threading.Thread(target=self._refill_forever, name="qrng-refill", daemon=True)
+            self._refiller.start()
+
+    def warm(self) -> None:
+        """Build the simulator and circuit and start filling the pool ahead of the first request."""
+        self._warm()
+        with self._lock:
+            self._start()
+
+    def take(self, size: int) -> np.ndarray:
+        """Remove and return ``size`` random bytes, drawing inline if the pool runs short."""
+        with self._lock:
+            self._start()
+            parts = []
+            needed = size
+            while needed and self._chunks:
+                chunk = self._chunks.popleft()
+                if len(chunk) > needed:
+                    self._chunks.appendleft(chunk[needed:])
+                    chunk = chunk[:needed]
+                parts.append(chunk)
+                needed -= len(chunk)
+            self._available -= size - needed
+            self.bytes_served += size
+            self._wanted.notify()
+        if needed:
+            per_shot = self.qubits // 8
+            extra = self._draw(-(-needed // per_shot))[:needed]
+            with self._lock:
+                self.bytes_generated += len(extra)
+            parts.append(extra)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.uint8)
+
+    def expanded(self, size: int) -> np.ndarray:
+        """``size`` bytes of SHAKE-256 output keyed by ``SEED_BYTES`` fresh bytes from the pool.
+
+        The simulator yields roughly 0.1-0.4 M values/s; hashing a quantum
+        seed per call runs at hundreds of MB/s. Every call takes a new seed,
+        so no two calls share a key.
+        """
+        seed = self.take(SEED_BYTES).tobytes()
+        return np.frombuffer(hashlib.shake_256(seed).digest(size), dtype=np.uint8)
+
+    def integers(self, count: int, upper: int, expanded: bool = False) -> np.ndarray:
+        """``count`` uniform integers in ``[0, upper)`` by rejection sampling.
+
+        Each candidate keeps just enough bits to cover ``upper`` and values
+        at or above it are discarded, so no outcome is favoured the way a
+        modulo reduction would. With ``expanded`` the candidate bytes come
+        from ``expanded`` instead of straight from the pool.
+        """
+        draw = self.expanded if expanded else self.take
+        if upper < 1:
+            raise ValueError("max_value must be at least 1")
+        if upper == 1:
+            return np.zeros(count, dtype=np.int64)
+        bits = int(upper - 1).bit_length()
+        width = next(w for w in (1, 2, 4, 8) if 8 * w >= bits)
+        mask = np.uint64((1 << bits) - 1)
+        accept = upper / float(1 << bits)  # at least 1/2
+        values = []
+        missing = count
+        while missing:
+            batch = int(missing / accept * 1.05) + 16
+            words = draw(batch * width).view(f"<u{width}").astype(np.uint64) & mask
+            kept = words[words < np.uint64(upper)][:missing]
+            values.append(kept)
+            missing -= len(kept)
+        return np.concatenate(values).astype(np.int64)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "available_bytes": self._available,
+                "capacity_bytes": self.capacity,
+                "shots_per_refill": self.shots,
+                "qubits": self.qubits,
+                "bytes_generated": self.bytes_generated,
+                "bytes_served": self.bytes_served,
+            }
+
+pool = EntropyPool()
+
+def configure(pool_bytes: int = 1 << 20, shots: int = 1 << 16, qubits: int = 8) -> None:
+    global pool
+    pool = EntropyPool(capacity=pool_bytes, shots=shots, qubits=qubits)
+
+def warm_up() -> None:
+    pool.warm()
 
 @router.post("/quantum/generate")
-async def generate_quantum_random(request: QuantumRequest) -> dict:
+async def generate_quantum_random(request: QuantumRequest, fmt: ResultFormat = Depends(result_format)) -> dict:
     """Generate quantum random numbers using Qiskit QRNG."""
+    # The pool lives in this process, so generation never goes to a worker process.
+    result = await run_in_thread("quantum", _generate_quantum_random, request)
+    return fmt.render(result, arrays=["values"])
+
+@router.get("/quantum/pool")
+async def get_pool_status():
+    """Return entropy pool fill level and counters."""
+    return {"success": True, "data": pool.stats(), "error": None}
+
+def _generate_quantum_random(request: QuantumRequest) -> dict:
     try:
-        qc = QuantumCircuit(8, 8)
-        qc.h(range(8))
-        qc.measure(range(8), range(8))
-        
-        simulator = AerSimulator()
-        job = simulator.run(qc, shots=request.num_values)
-        result = job.result()
-        counts = result.get_counts()
-        
-        random_values = [
-            int(list(counts.keys())[i % len(counts)], 2) % request.max_value
-            for i in range(request.num_values)
-        ]
-        
+        if request.num_values < 0:
+            raise ValueError("num_values must not be negative")
+        expanded = request.source == "expanded"
+        random_values = pool.integers(request.num_values, request.max_value, expanded=expanded)
+
         return {
             "success": True,
-            "data": {"values": random_values, "method": "qiskit_qrng"},
+            "data": {"values": random_values, "method": "qiskit_qrng_shake256" if expanded else "qiskit_qrng"},
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+register_analysis("quantum", QuantumRequest, _generate_quantum_random)
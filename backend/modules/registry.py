@@ -0,0 +1,277 @@
+"""Registry of fitted models so predictions do not need a refit.
+
+Fits that support it (regression, anomaly detection) store their estimator
+here when the request sets ``persist`` and return a ``model_id``. Models live
+in an LRU memory tier and are written to ``MODEL_DIR`` with joblib by a
+background thread, so a process-pool worker, a restarted server or another
+uvicorn worker can load them back on first use. The directory keeps at most
+``max_files`` models, least recently used dropped first, each for at most
+``ttl`` seconds since it was last written or loaded. Each file has a small
+``<id>.meta.json`` beside it, so metadata lookups never load the estimator.
+
+Model ids are derived from the fit request, so refitting the same request
+always yields the same id. Fits with ``persist`` skip the result cache and run
+on a thread of this process, so the id they return is always registered here.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import joblib
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from modules.cache import make_key
+from modules.executor import run_in_thread
+
+router = APIRouter()
+
+# Predict/score requests up to this many rows, on a model already in memory,
+# run directly on the event loop.
+INLINE_PREDICT_ROWS = 2048
+
+
+class ModelNotFound(KeyError):
+    def __str__(self) -> str:
+        return f"Model '{self.args[0]}' not found"
+
+
+def _remove(*paths: str) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ModelRegistry:
+    """LRU memory tier of fitted estimators backed by a bounded directory of joblib files."""
+
+    def __init__(self, root: Optional[str], max_models: int = 64, max_files: int = 256, ttl: Optional[float] = None):
+        self.root = root
+        self.max_models = max_models
+        self.max_files = max_files
+        self.ttl = ttl
+        self._models: "OrderedDict[str, Tuple[Any, dict]]" = OrderedDict()
+        self._pending: Dict[str, Tuple[Any, dict]] = {}  # queued for the writer thread
+        self._lock = threading.Lock()
+        self._writer: Optional[ThreadPoolExecutor] = None
+        if root:
+            os.makedirs(root, exist_ok=True)
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-writer")
+            self.prune()
+
+    def _path(self, model_id: str) -> str:
+        if not model_id.isalnum():
+            raise ModelNotFound(model_id)
+        return os.path.join(self.root, f"{model_id}.joblib")
+
+    def _meta_path(self, model_id: str) -> str:
+        return os.path.join(self.root, f"{model_id}.meta.json")
+
+    def put(self, model_id: str, model: Any, meta: dict) -> None:
+        """Keep ``model`` in memory now; the file is written off the request path."""
+        meta = {"model_id": model_id, "created_at": time.time(), **meta}
+        if self.root:
+            self._path(model_id)  # reject a malformed id before queueing anything
+        self._remember(model_id, model, meta)
+        if self._writer is None:
+            return
+        with self._lock:
+            if model_id in self._pending:
+                return
+            self._pending[model_id] = (model, meta)
+        self._writer.submit(self._write, model_id, model, meta)
+
+    def _write(self, model_id: str, model: Any, meta: dict) -> None:
+        path = self._path(model_id)
+        try:
+            if os.path.exists(path):
+                os.utime(path)  # refit of a stored model: counts as a use
+            else:
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}"
+                joblib.dump({"model": model, "meta": meta}, tmp)
+                os.replace(tmp, path)
+                meta_tmp = f"{self._meta_path(model_id)}.{os.getpid()}.{threading.get_ident()}"
+                with open(meta_tmp, "w") as f:
+                    json.dump(meta, f, default=str)
+                os.replace(meta_tmp, self._meta_path(model_id))
+        except OSError:
+            pass  # disk full or directory gone: the model is still served from memory
+        with self._lock:
+            deleted = self._pending.pop(model_id, None) is None
+        if deleted:
+            _remove(path, self._meta_path(model_id))  # deleted while it was being written
+        self.prune()
+
+    def loaded(self, model_id: str) -> bool:
+        """Whether ``model_id`` is in memory, so ``get`` will not touch the disk."""
+        with self._lock:
+            return model_id in self._models or model_id in self._pending
+
+    def get(self, model_id: str) -> Tuple[Any, dict]:
+        with self._lock:
+            entry = self._models.get(model_id)
+            if entry is not None:
+                self._models.move_to_end(model_id)
+                return entry
+            entry = self._pending.get(model_id)
+        if entry is not None:
+            self._remember(model_id, *entry)
+            return entry
+        if not self.root or not os.path.exists(self._path(model_id)):
+            raise ModelNotFound(model_id)
+        stored = joblib.load(self._path(model_id))
+        os.utime(self._path(model_id))  # last use, for LRU and ttl pruning
+        self._remember(model_id, stored["model"], stored["meta"])
+        return stored["model"], stored["meta"]
+
+    def meta(self, model_id: str) -> Optional[dict]:
+        """Metadata of ``model_id`` without loading it; ``None`` if only the model file has it."""
+        with self._lock:
+            entry = self._models.get(model_id) or self._pending.get(model_id)
+        if entry is not None:
+            return entry[1]
+        if not self.root or not os.path.exists(self._path(model_id)):
+            raise ModelNotFound(model_id)
+        try:
+            with open(self._meta_path(model_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # written before metadata files existed, or being replaced
+
+    def prune(self) -> None:
+        """Delete model files unused for ``ttl`` seconds, then the least recently used over ``max_files``."""
+        now = time.time()
+        files = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                used = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith(".joblib"):
+                files.append((used, path))
+            elif (".joblib." in name or ".meta.json." in name) and now - used > 3600:
+                files.append((0.0, path))  # temp file of a write that never finished
+        files.sort()
+        expired = [path for used, path in files if self.ttl and now - used > self.ttl]
+        kept = len(files) - len(expired)
+        surplus = [path for _, path in files if path not in expired][:max(0, kept - self.max_files)]
+        for path in expired + surplus:
+            if path.endswith(".joblib"):
+                _remove(path, path[:-len(".joblib")] + ".meta.json")
+            else:
+                _remove(path)
+
+    def close(self) -> None:
+        """Finish queued writes."""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+
+    def delete(self, model_id: str) -> None:
+        with self._lock:
+            found = self._models.pop(model_id, None) is not None
+            found = self._pending.pop(model_id, None) is not None or found
+        if self.root and os.path.exists(self._path(model_id)):
+            _remove(self._path(model_id), self._meta_path(model_id))
+            found = True
+        if not found:
+            raise ModelNotFound(model_id)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            metas: Dict[str, dict] = {model_id: meta for model_id, (_, meta) in self._models.items()}
+        if self.root:
+            for name in os.listdir(self.root):
+                model_id, ext = os.path.splitext(name)
+                if ext == ".joblib" and model_id not in metas:
+                    metas[model_id] = {"model_id": model_id, "loaded": False}
+        return list(metas.values())
+
+    def _remember(self, model_id: str, model: Any, meta: dict) -> None:
+        with self._lock:
+            self._models[model_id] = (model, meta)
+            self._models.move_to_end(model_id)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+
+
+models = ModelRegistry(os.path.join(os.path.dirname(os.path.dirname(__file__)), "modelstore"))
+
+
+def configure(root: Optional[str], max_models: int = 64, max_files: int = 256, ttl: Optional[float] = None) -> None:
+    """Replace the registry; the old one finishes its queued writes first."""
+    global models
+    models.close()
+    models = ModelRegistry(root, max_models=max_models, max_files=max_files, ttl=ttl)
+
+
+def register_model(kind: str, model: Any, request: BaseModel, version: str, **meta: Any) -> Optional[str]:
+    """Store a fitted estimator under an id derived from its fit request.
+
+    Only when the request opts in with ``persist``; otherwise nothing is kept
+    and the id is ``None``.
+    """
+    if not getattr(request, "persist", False):
+        return None
+    model_id = make_key(f"model.{kind}", version, request)[:32]
+    models.put(model_id, model, {"kind": kind, **meta})
+    return model_id
+
+
+def get_model(model_id: str, kind: str) -> Tuple[Any, dict]:
+    model, meta = models.get(model_id)
+    if meta.get("kind") != kind:
+        raise ModelNotFound(model_id)
+    return model, meta
+
+
+async def run_prediction(endpoint: str, fn: Callable[[Any], dict], request: BaseModel, rows: Optional[int]) -> dict:
+    """Run a predict/score handler inline when small and its model is in memory, else on a local thread.
+
+    Stored models live in this process, so predictions never go to a process
+    pool; small batches skip the pool hand-off entirely. A model that would be
+    loaded from disk always goes to a thread, so ``joblib.load`` never blocks
+    the event loop.
+    """
+    if rows is not None and rows <= INLINE_PREDICT_ROWS and models.loaded(request.model_id):
+        return fn(request)
+    return await run_in_thread(endpoint, fn, request)
+
+
+def _error(status_code: int, message: str) -> JSONResponse:
+    return JSONResponse(status_code=status_code, content={"success": False, "data": None, "error": message})
+
+
+@router.get("/models")
+async def list_models():
+    """List registered models (in memory and on disk)."""
+    return {"success": True, "data": {"models": models.list()}, "error": None}
+
+
+@router.get("/models/{model_id}")
+async def get_model_info(model_id: str):
+    """Return the metadata of a registered model."""
+    try:
+        meta = models.meta(model_id)
+        if meta is None:
+            _, meta = await run_in_thread("models", models.get, model_id)
+    except ModelNotFound as e:
+        return _error(404, str(e))
+    return {"success": True, "data": meta, "error": None}
+
+
+@router.delete("/models/{model_id}")
+async def delete_model(model_id: str):
+    """Remove a model from memory and disk."""
+    try:
+        models.delete(model_id)
+    except ModelNotFound as e:
+        return _error(404, str(e))
+    return {"success": True, "data": {"model_id": model_id}, "error": None}
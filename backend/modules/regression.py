@@ -1,58 +1,131 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from sklearn.linear_model import LinearRegression, Ridge, Lasso
-from sklearn.preprocessing import PolynomialFeatures
-from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+import os
+from fastapi import APIRouter, Depends
 import numpy as np
-from typing import List, Literal
+from pydantic import model_validator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterator, List, Literal, Optional, Tuple
+from modules import datasets, metrics
+from modules.datasets import DatasetRef, resolve_matrix, working_dtype
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.jobs import register_analysis, report_progress
+from modules.prepared import PreparedMatrix
+from modules.registry import get_model, register_model, run_prediction
+from modules.transport import ResultFormat, array_body, array_openapi, result_format
+
+if TYPE_CHECKING:
+    from sklearn.linear_model import LinearRegression
 
 router = APIRouter()
 
-class RegressionRequest(BaseModel):
-    X: List[List[float]]
-    y: List[float]
+VERSION = "1.0"
+WARM_IMPORTS = ("sklearn.linear_model", "sklearn.pipeline", "sklearn.preprocessing", "sklearn.metrics", "scipy.linalg")
+
+# Largest sufficient statistics (all folds) the normal-equation solver will hold.
+NORMAL_EQUATIONS_MAX_BYTES = 1 << 30
+# Chunks with fewer nonzeros than this are expanded and multiplied as sparse matrices.
+SPARSE_DENSITY = 0.1
+
+class RegressionRequest(DatasetRef):
+    X: List[List[float]] = None
+    y: List[float] = None
+    target: Optional[str] = None  # dataset column holding y
     algorithm: Literal["linear", "polynomial", "ridge", "lasso"] = "linear"
     degree: int = 2  # For polynomial
     alpha: float = 1.0  # For ridge/lasso
+    solver: Literal["auto", "svd", "cholesky", "lsqr", "sparse_cg", "sag", "saga"] = "auto"  # For ridge
     predict_X: List[List[float]] = None
+    persist: bool = False  # keep the fitted model for /regression/predict and return its model_id
 
-@router.post("/regression/analyze")
-async def perform_regression(request: RegressionRequest) -> dict:
+class ScalableRegressionRequest(DatasetRef):
+    X: List[List[float]] = None
+    y: List[float] = None
+    target: Optional[str] = None  # dataset column holding y
+    algorithm: Literal["linear", "polynomial", "ridge", "lasso"] = "linear"
+    degree: int = 2  # For polynomial
+    interaction_only: bool = False  # For polynomial: products of distinct features only
+    ridge: float = 0.0  # For polynomial: L2 penalty on the expanded features
+    alpha: float = 1.0  # For ridge/lasso
+    alphas: Optional[List[float]] = None  # regularization path; the best alpha is picked by cv
+    cv: int = 0  # folds (0: none; 5 when alphas are given)
+    solver: Literal["auto", "normal_equations", "sgd"] = "auto"
+    sparse: Literal["auto", "on", "off"] = "auto"
+    chunk_rows: int = 65536
+    epochs: int = 5  # For sgd: passes over the data
+    n_jobs: Optional[int] = None  # threads for chunks and folds (-1: all cores)
+    predict_X: List[List[float]] = None
+    persist: bool = False  # keep the fitted model for /regression/predict and return its model_id
+
+    @model_validator(mode="after")
+    def _alphas_need_a_penalty(self) -> "ScalableRegressionRequest":
+        if self.alphas is not None and self.algorithm in ("linear", "polynomial"):
+            raise ValueError(f"alphas is only used by ridge and lasso, not '{self.algorithm}' (polynomial takes ridge)")
+        return self
+
+class RegressionPredictRequest(DatasetRef):
+    model_id: str
+    X: List[List[float]] = None
+
+@router.post("/regression/analyze", openapi_extra=array_openapi(RegressionRequest))
+async def perform_regression(
+    request: RegressionRequest = Depends(array_body(RegressionRequest, "X", target="y")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
     """Perform regression analysis with various algorithms."""
+    result = await run_cached("regression", _perform_regression, request, VERSION, cache)
+    return fmt.render(result, arrays=["fitted_values"])
+
+def _perform_regression(request: RegressionRequest, prepared: Optional[PreparedMatrix] = None) -> dict:
+    from sklearn.linear_model import LinearRegression, Ridge, Lasso
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import PolynomialFeatures
+    from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+
     try:
-        X = np.array(request.X)
-        y = np.array(request.y)
+        X, y = _resolve_xy(request)
         
-        if request.algorithm == "polynomial":
-            poly = PolynomialFeatures(degree=request.degree)
-            X_poly = poly.fit_transform(X)
-            model = LinearRegression()
-            model.fit(X_poly, y)
-            y_pred = model.predict(X_poly)
+        with metrics.span("fit"):
+            if request.algorithm == "polynomial":
+                if prepared is not None:
+                    X_poly, poly = prepared.polynomial(request.degree)
+                else:
+                    poly = PolynomialFeatures(degree=request.degree)
+                    X_poly = poly.fit_transform(X)
+                model = LinearRegression()
+                model.fit(X_poly, y)
+                y_pred = model.predict(X_poly)
+                fitted = Pipeline([("poly", poly), ("model", model)])
             
-            if request.predict_X:
-                X_new_poly = poly.transform(np.array(request.predict_X))
-                predictions = model.predict(X_new_poly).tolist()
-            else:
-                predictions = None
+                if request.predict_X:
+                    X_new_poly = poly.transform(np.asarray(request.predict_X, dtype=X.dtype))
+                    predictions = model.predict(X_new_poly)
+                else:
+                    predictions = None
                 
-        elif request.algorithm == "ridge":
-            model = Ridge(alpha=request.alpha)
-            model.fit(X, y)
-            y_pred = model.predict(X)
-            predictions = model.predict(np.array(request.predict_X)).tolist() if request.predict_X else None
+            elif request.algorithm == "ridge":
+                model = Ridge(alpha=request.alpha, solver=request.solver)
+                model.fit(X, y)
+                y_pred = model.predict(X)
+                predictions = model.predict(np.asarray(request.predict_X, dtype=X.dtype)) if request.predict_X else None
             
-        elif request.algorithm == "lasso":
-            model = Lasso(alpha=request.alpha)
-            model.fit(X, y)
-            y_pred = model.predict(X)
-            predictions = model.predict(np.array(request.predict_X)).tolist() if request.predict_X else None
+            elif request.algorithm == "lasso":
+                model = Lasso(alpha=request.alpha)
+                model.fit(X, y)
+                y_pred = model.predict(X)
+                predictions = model.predict(np.asarray(request.predict_X, dtype=X.dtype)) if request.predict_X else None
             
-        else:  # linear
-            model = LinearRegression()
-            model.fit(X, y)
-            y_pred = model.predict(X)
-            predictions = model.predict(np.array(request.predict_X)).tolist() if request.predict_X else None
+            else:  # linear
+                model = LinearRegression()
+                model.fit(X, y)
+                y_pred = model.predict(X)
+                predictions = model.predict(np.asarray(request.predict_X, dtype=X.dtype)) if request.predict_X else None
+        
+        if request.algorithm != "polynomial":
+            fitted = model
+        model_id = register_model(
+            "regression", fitted, request.model_copy(update={"predict_X": None}), VERSION,
+            algorithm=request.algorithm, n_features=int(X.shape[1])
+        )
         
         # Calculate metrics
         r2 = float(r2_score(y, y_pred))
@@ -69,11 +142,446 @@ async def perform_regression(request: RegressionRequest) -> dict:
                 "mse": mse,
                 "rmse": rmse,
                 "mae": mae,
-                "fitted_values": y_pred.tolist(),
+                "fitted_values": y_pred,
                 "predictions": predictions,
-                "algorithm": request.algorithm
+                "algorithm": request.algorithm,
+                "model_id": model_id
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+@router.post("/regression/predict", openapi_extra=array_openapi(RegressionPredictRequest))
+async def predict_regression(
+    request: RegressionPredictRequest = Depends(array_body(RegressionPredictRequest, "X")),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Predict with a model returned by /regression/analyze, without refitting."""
+    rows = len(request.X) if request.X is not None else None
+    result = await run_prediction("regression", _predict_regression, request, rows)
+    return fmt.render(result, arrays=["predictions"])
+
+def _predict_regression(request: RegressionPredictRequest) -> dict:
+    try:
+        model, meta = get_model(request.model_id, "regression")
+        predictions = model.predict(resolve_matrix(request.X, request))
+        return {
+            "success": True,
+            "data": {"predictions": predictions, "model_id": request.model_id, "algorithm": meta["algorithm"]},
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+@router.post("/regression/scalable", openapi_extra=array_openapi(ScalableRegressionRequest))
+async def perform_scalable_regression(
+    request: ScalableRegressionRequest = Depends(array_body(ScalableRegressionRequest, "X", target="y")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Fit a linear model chunk by chunk, for tables too large for one array.
+
+    The normal-equation solver accumulates XᵀX and Xᵀy (per cv fold) in one
+    pass; ``sgd`` streams chunks through SGDRegressor instead. Regularization
+    paths and cross-validation are solved from the accumulated statistics,
+    without another pass over the data.
+    """
+    result = await run_cached("regression", _perform_scalable_regression, request, VERSION, cache)
+    return fmt.render(result, arrays=["predictions"])
+
+class _Moments:
+    """Per-fold sums for the normal equations of ``[1, z - shift]`` against ``y - y_shift``.
+
+    ``G[f]`` is ZᵀZ of the rows in fold ``f`` with a leading intercept
+    column, ``b[f]`` is Zᵀy and ``yy[f]`` is yᵀy; the training set of fold
+    ``f`` is the total minus fold ``f``.
+    """
+
+    def __init__(self, folds: int, width: int):
+        self.G = np.zeros((folds, width + 1, width + 1))
+        self.b = np.zeros((folds, width + 1))
+        self.yy = np.zeros(folds)
+
+    def add(self, other: "_Moments") -> None:
+        self.G += other.G
+        self.b += other.b
+        self.yy += other.yy
+
+    def total(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        return self.G.sum(axis=0), self.b.sum(axis=0), float(self.yy.sum())
+
+def _perform_scalable_regression(request: ScalableRegressionRequest) -> dict:
+    from sklearn.pipeline import Pipeline
+
+    try:
+        if request.chunk_rows < 1:
+            raise ValueError("chunk_rows must be positive")
+        linear = request.algorithm in ("linear", "polynomial")
+        alphas = [request.ridge if request.algorithm == "polynomial" else 0.0] if linear else \
+            list(request.alphas or [request.alpha])
+        if min(alphas) < 0:
+            raise ValueError("alphas must not be negative")
+        folds = request.cv if request.cv > 1 else (5 if len(alphas) > 1 else 1)
+        workers = (os.cpu_count() or 1) if request.n_jobs == -1 else max(request.n_jobs or 1, 1)
+
+        chunks = _xy_chunks(request)
+        first = next(chunks, None)
+        if first is None or len(first[0]) == 0:
+            raise ValueError("No rows to fit")
+        X0, y0 = first
+        sparse = request.sparse == "on" or (
+            request.sparse == "auto" and np.count_nonzero(X0) < SPARSE_DENSITY * X0.size
+        )
+        expand = _expander(request, X0.shape[1], sparse)
+        width = expand(X0[:1]).shape[1]
+
+        solver = request.solver
+        needed = (folds + 1) * (width + 1) ** 2 * 8
+        if solver == "auto":
+            solver = "normal_equations" if needed <= NORMAL_EQUATIONS_MAX_BYTES else "sgd"
+        if solver == "normal_equations" and needed > NORMAL_EQUATIONS_MAX_BYTES:
+            raise ValueError(f"{width} features x {folds} folds need {needed >> 20} MiB of normal equations; use solver='sgd'")
+        if solver == "sgd" and (len(alphas) > 1 or folds > 1):
+            raise ValueError("Regularization paths and cv use the normal-equation solver")
+
+        def rechained() -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+            yield first
+            yield from chunks
+
+        if solver == "sgd":
+            coef, intercept, scores = _fit_sgd(request, _xy_chunks(request), expand, width, alphas[0])
+            path = None
+        else:
+            coef, intercept, scores, path = _fit_normal_equations(
+                request, rechained(), expand, width, sparse, alphas, folds, workers
+            )
+        metrics.record_input((scores["n_samples"], X0.shape[1]))
+
+        model = _linear_model(coef, intercept)
+        if request.algorithm == "polynomial":
+            fitted = Pipeline([("poly", expand.poly), ("model", model)])
+        else:
+            fitted = model
+        model_id = register_model(
+            "regression", fitted, request.model_copy(update={"predict_X": None}), VERSION,
+            algorithm=request.algorithm, n_features=int(X0.shape[1])
+        )
+        predictions = fitted.predict(np.asarray(request.predict_X, dtype=working_dtype(request))) if request.predict_X else None
+
+        return {
+            "success": True,
+            "data": {
+                "coefficients": coef,
+                "intercept": float(intercept),
+                **scores,
+                **(path or {}),
+                "predictions": predictions,
+                "algorithm": request.algorithm,
+                "solver": solver,
+                "sparse": sparse,
+                "n_features": width,
+                "model_id": model_id
+            },
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+def _xy_chunks(request: ScalableRegressionRequest) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """``(X, y)`` blocks of ``chunk_rows`` rows, read from the dataset memmap or sliced from inline arrays."""
+    if not request.dataset_id:
+        X, y = resolve_matrix(request.X, request), np.asarray(request.y, dtype=working_dtype(request))
+        if len(X) != len(y):
+            raise ValueError(f"X has {len(X)} rows but y has {len(y)}")
+        for start in range(0, len(X), request.chunk_rows):
+            yield X[start:start + request.chunk_rows], y[start:start + request.chunk_rows]
+        return
+    if not request.target:
+        raise ValueError("Regression on a dataset needs a target column")
+    columns = request.columns
+    if columns is None:
+        columns = [c for c in datasets.store.meta(request.dataset_id)["numeric_columns"] if c != request.target]
+    for chunk in datasets.store.chunks(request.dataset_id, [*columns, request.target], request.chunk_rows):
+        yield chunk[:, :-1], chunk[:, -1]
+
+def _expander(request: ScalableRegressionRequest, n_features: int, sparse: bool) -> Callable:
+    """Chunk -> model features (polynomial expansion and/or CSR), with the fitted transformer as ``.poly``."""
+    import scipy.sparse as sp
+    from sklearn.preprocessing import PolynomialFeatures
+
+    poly = None
+    if request.algorithm == "polynomial":
+        poly = PolynomialFeatures(degree=request.degree, interaction_only=request.interaction_only, include_bias=False)
+        poly.fit(np.zeros((1, n_features)))
+
+    def expand(X: np.ndarray):
+        # float64 per chunk whatever the working dtype: the Gram sums accumulate over every row.
+        Z = sp.csr_matrix(X, dtype=float) if sparse else np.asarray(X, dtype=float)
+        return poly.transform(Z) if poly is not None else Z
+
+    expand.poly = poly
+    return expand
+
+def _row_count(request: ScalableRegressionRequest) -> int:
+    if request.dataset_id:
+        return datasets.store.meta(request.dataset_id)["rows"]
+    return len(request.X)
+
+def _fold_of(start: int, rows: int, folds: int) -> np.ndarray:
+    """Fold of each row, from a multiplicative hash of its global index (independent of chunking)."""
+    index = np.arange(start, start + rows, dtype=np.uint64)
+    return ((index * np.uint64(2654435761)) % np.uint64(1 << 32) % np.uint64(folds)).astype(np.intp)
+
+def _chunk_moments(Z, y: np.ndarray, fold: np.ndarray, folds: int, shift: np.ndarray, y_shift: float) -> _Moments:
+    import scipy.sparse as sp
+
+    moments = _Moments(folds, Z.shape[1])
+    y = y - y_shift
+    for f in range(folds):
+        rows = fold == f if folds > 1 else slice(None)
+        Zf, yf = Z[rows], y[rows]
+        if not sp.issparse(Zf):
+            Zf = Zf - shift
+        n = Zf.shape[0]
+        total = np.asarray(Zf.sum(axis=0)).ravel()
+        moments.G[f, 0, 0] = n
+        moments.G[f, 0, 1:] = moments.G[f, 1:, 0] = total
+        gram = Zf.T @ Zf
+        moments.G[f, 1:, 1:] = gram.toarray() if sp.issparse(gram) else gram
+        moments.b[f, 0] = yf.sum()
+        moments.b[f, 1:] = Zf.T @ yf
+        moments.yy[f] = yf @ yf
+    return moments
+
+def _fit_normal_equations(request, chunks, expand, width: int, sparse: bool, alphas: List[float], folds: int, workers: int):
+    moments = _Moments(folds, width)
+    state = {"start": 0}
+    rows = max(_row_count(request), 1)
+
+    def work(item):
+        X, y, start = item
+        Z = expand(X)
+        return _chunk_moments(Z, y, _fold_of(start, len(y), folds), folds, shift, y_shift)
+
+    def numbered():
+        for X, y in chunks:
+            yield X, y, state["start"]
+            state["start"] += len(y)
+
+    items = numbered()
+    first = next(items)
+    # Shift by the first chunk's means so the sums of squares do not cancel;
+    # sparse chunks stay unshifted to keep their zeros.
+    shift = np.zeros(width) if sparse else np.asarray(expand(first[0]).mean(axis=0)).ravel()
+    y_shift = float(first[1].mean())
+    moments.add(work(first))
+    if workers == 1:
+        for item in items:
+            moments.add(work(item))
+            report_progress(state["start"] / rows)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                batch = [item for _, item in zip(range(workers), items)]
+                if not batch:
+                    break
+                for part in pool.map(work, batch):
+                    moments.add(part)
+                report_progress(state["start"] / rows)
+
+    G, b, yy = moments.total()
+    if G[0, 0] < 2:
+        raise ValueError("Need at least 2 rows")
+    order = np.argsort(alphas)[::-1]  # strongest penalty first, for lasso warm starts
+    ranked = [alphas[i] for i in order]
+    lasso = request.algorithm == "lasso"
+
+    def solve(G, b) -> np.ndarray:
+        """Intercept and coefficients (shifted coordinates) for every alpha, in ``ranked`` order."""
+        n = G[0, 0]
+        mean = G[0, 1:] / n
+        cov = G[1:, 1:] - n * np.outer(mean, mean)
+        cross = b[1:] - mean * b[0]
+        # Solve in unit-variance coordinates (Jacobi scaling): polynomial terms
+        # differ by orders of magnitude and the raw system is badly conditioned.
+        scale = np.sqrt(np.maximum(np.diag(cov), 0.0))
+        scale[scale == 0] = 1.0
+        cov, cross = cov / np.outer(scale, scale), cross / scale
+        if lasso:
+            W = _lasso_path(cov / n, cross / n, ranked, 1 / scale)
+        else:
+            W = _ridge_path(cov, cross, ranked, 1 / scale ** 2)
+        W /= scale
+        intercepts = (b[0] - W @ G[0, 1:]) / n
+        return np.column_stack([intercepts, W])
+
+    def sse(theta: np.ndarray, G: np.ndarray, b: np.ndarray, yy: float) -> np.ndarray:
+        return yy - 2 * theta @ b + np.einsum("ai,ij,aj->a", theta, G, theta)
+
+    cv_mse = None
+    best = 0
+    if folds > 1:
+        def fold_error(f: int) -> np.ndarray:
+            theta = solve(G - moments.G[f], b - moments.b[f])
+            return sse(theta, moments.G[f], moments.b[f], moments.yy[f])
+
+        with ThreadPoolExecutor(max_workers=min(workers, folds)) as pool:
+            errors = np.sum(list(pool.map(fold_error, range(folds))), axis=0)
+        cv_mse = errors / G[0, 0]
+        best = int(np.argmin(cv_mse))
+
+    thetas = solve(G, b)
+    theta = thetas[best]
+    n = G[0, 0]
+    residual = max(float(sse(theta[None], G, b, yy)[0]), 0.0)
+    total = yy - b[0] ** 2 / n
+    coef = theta[1:]
+    intercept = theta[0] + y_shift - coef @ shift
+    scores = {
+        "r2_score": 1 - residual / total if total > 0 else 0.0,
+        "mse": residual / n,
+        "rmse": float(np.sqrt(residual / n)),
+        "mae": None,  # not recoverable from the sufficient statistics
+        "n_samples": int(n),
+    }
+    path = None
+    if len(alphas) > 1:
+        unrank = np.argsort(order)
+        path = {
+            "alpha": ranked[best],
+            "alphas": alphas,
+            "path_coefficients": thetas[unrank, 1:],
+            "cv_mse": cv_mse[unrank],
+            "cv_folds": folds,
+        }
+    elif folds > 1:
+        path = {"alpha": alphas[0], "cv_mse": cv_mse, "cv_folds": folds}
+    return coef, intercept, scores, path
+
+def _ridge_path(cov: np.ndarray, cross: np.ndarray, alphas: List[float], weights: np.ndarray) -> np.ndarray:
+    """Solutions of ``(cov + alpha * diag(weights)) w = cross`` for every alpha.
+
+    Cholesky per alpha; a singular system (collinear features without a
+    penalty) falls back to the minimum-norm least-squares solution.
+    """
+    from scipy.linalg import LinAlgError, cho_factor, cho_solve
+
+    path = np.empty((len(alphas), len(cross)))
+    for i, alpha in enumerate(alphas):
+        system = cov + np.diag(alpha * weights)
+        try:
+            path[i] = cho_solve(cho_factor(system), cross)
+        except LinAlgError:
+            path[i] = np.linalg.lstsq(system, cross, rcond=None)[0]
+    return path
+
+def _lasso_path(cov: np.ndarray, cross: np.ndarray, alphas: List[float], weights: np.ndarray,
+                max_iter: int = 1000, tol: float = 1e-6) -> np.ndarray:
+    """Lasso coefficients by coordinate descent on the covariance, warm-started along ``alphas``.
+
+    Minimizes ``wᵀ cov w / 2 - crossᵀ w + alpha Σ weights_j |w_j|``, the Gram
+    form of the ``1 / (2n)``-scaled objective sklearn's Lasso uses (with
+    per-coordinate weights undoing the feature scaling).
+    """
+    w = np.zeros(len(cross))
+    gradient = cross.copy()  # cross - cov @ w
+    diag = np.diag(cov)
+    active = np.flatnonzero(diag > 0)
+    path = np.empty((len(alphas), len(cross)))
+    for i, alpha in enumerate(alphas):
+        for _ in range(max_iter):
+            largest = 0.0
+            for j in active:
+                old = w[j]
+                z = gradient[j] + diag[j] * old
+                new = np.sign(z) * max(abs(z) - alpha * weights[j], 0.0) / diag[j]
+                if new != old:
+                    gradient -= cov[:, j] * (new - old)
+                    w[j] = new
+                    largest = max(largest, abs(new - old))
+            if largest <= tol * max(np.abs(w).max(), 1.0):
+                break
+        path[i] = w
+    return path
+
+def _fit_sgd(request, chunks, expand, width: int, alpha: float):
+    """Two passes for feature/target scaling statistics and scoring, ``epochs`` passes of partial_fit."""
+    import scipy.sparse as sp
+    from sklearn.linear_model import SGDRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler(with_mean=True)
+    y_sum = y_sq = n = 0.0
+    for X, y in chunks:
+        Z = expand(X)
+        scaler.partial_fit(Z.toarray() if sp.issparse(Z) else Z)
+        y_sum += y.sum()
+        y_sq += y @ y
+        n += len(y)
+    y_mean = y_sum / n
+    y_scale = np.sqrt(max(y_sq / n - y_mean ** 2, 0.0)) or 1.0
+    penalty = {"ridge": "l2", "lasso": "l1"}.get(request.algorithm)
+    model = SGDRegressor(
+        penalty=penalty, alpha=alpha / n if request.algorithm == "ridge" else (alpha or 1e-4),
+        random_state=42
+    )
+    rng = np.random.default_rng(42)
+    epochs = max(request.epochs, 1)
+    for epoch in range(epochs):
+        for X, y in _xy_chunks(request):
+            Z = expand(X)
+            Z = scaler.transform(Z.toarray() if sp.issparse(Z) else Z)
+            order = rng.permutation(len(y))  # partial_fit does not shuffle within a chunk
+            model.partial_fit(Z[order], (y[order] - y_mean) / y_scale)
+        report_progress((epoch + 1) / epochs)
+
+    # Back to raw feature and target units: one linear model for /regression/predict.
+    scale = np.where(scaler.scale_ > 0, scaler.scale_, 1.0)
+    coef = model.coef_ * y_scale / scale
+    intercept = y_mean + y_scale * model.intercept_[0] - coef @ scaler.mean_
+    residual = absolute = 0.0
+    for X, y in _xy_chunks(request):
+        error = y - (expand(X) @ coef + intercept)
+        residual += error @ error
+        absolute += np.abs(error).sum()
+    total = y_sq - n * y_mean ** 2
+    scores = {
+        "r2_score": 1 - residual / total if total > 0 else 0.0,
+        "mse": residual / n,
+        "rmse": float(np.sqrt(residual / n)),
+        "mae": absolute / n,
+        "n_samples": int(n),
+    }
+    return coef, intercept, scores
+
+def _linear_model(coef: np.ndarray, intercept: float) -> "LinearRegression":
+    """A fitted ``LinearRegression`` carrying coefficients solved elsewhere."""
+    from sklearn.linear_model import LinearRegression
+
+    model = LinearRegression()
+    model.coef_ = np.asarray(coef, dtype=float)
+    model.intercept_ = float(intercept)
+    model.n_features_in_ = len(model.coef_)
+    return model
+
+def _resolve_xy(request: RegressionRequest):
+    """Inline X/y, or the feature and ``target`` columns of a stored dataset."""
+    if not request.dataset_id:
+        return resolve_matrix(request.X, request), np.asarray(request.y, dtype=working_dtype(request))
+    if not request.target:
+        raise ValueError("Regression on a dataset needs a target column")
+    columns = request.columns
+    if columns is None:
+        columns = [c for c in datasets.store.meta(request.dataset_id)["numeric_columns"] if c != request.target]
+    X = resolve_matrix(None, request, columns)
+    y = resolve_matrix(None, request, [request.target])[:, 0]
+    return X, y
+
+register_analysis(
+    "regression", RegressionRequest, _perform_regression, matrix="X", prepared=True, version=VERSION
+)
+register_analysis(
+    "regression_scalable", ScalableRegressionRequest, _perform_scalable_regression, endpoint="regression", matrix="X",
+    version=VERSION,
+)
@@ -0,0 +1,150 @@
+"""Stateful sessions for incremental (streaming) analyses.
+
+A session holds a model that is updated batch by batch with ``partial_fit``
+or a bounded window, so continuous feeds never refit on their full history.
+Sessions live in this process, expire after a period of inactivity, and
+their count is capped. Each has a lock so concurrent batches for one session
+are applied one at a time.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+
+class SessionError(Exception):
+    """Session lookup/creation failure; ``status_code`` is used for the response."""
+
+    status_code = 400
+
+
+class SessionNotFound(SessionError):
+    status_code = 404
+
+    def __init__(self, session_id: str):
+        super().__init__(f"Session '{session_id}' not found or expired")
+
+
+class SessionLimitReached(SessionError):
+    status_code = 429
+
+    def __init__(self, limit: int):
+        super().__init__(f"Session limit of {limit} reached, delete an idle session first")
+
+
+class Session:
+    """One streaming model plus its bookkeeping."""
+
+    def __init__(self, kind: str, state: Any, config: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = state
+        self.config = config
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.batches = 0
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def touch(self, rows: int) -> None:
+        self.last_used = time.time()
+        self.batches += 1
+        self.samples += rows
+
+    def summary(self) -> dict:
+        return {
+            "session_id": self.id,
+            "kind": self.kind,
+            "config": self.config,
+            "batches": self.batches,
+            "samples_seen": self.samples,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+        }
+
+
+class SessionStore:
+    """In-process session table with idle TTL and a size cap."""
+
+    def __init__(self, ttl: float = 3600.0, max_sessions: int = 256):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, kind: str, state: Any, config: Dict[str, Any]) -> Session:
+        with self._lock:
+            self._evict()
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitReached(self.max_sessions)
+            session = Session(kind, state, config)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id: str, kind: Optional[str] = None) -> Session:
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(session_id)
+            if session is None or (kind is not None and session.kind != kind):
+                raise SessionNotFound(session_id)
+            session.last_used = time.time()
+            return session
+
+    def delete(self, session_id: str, kind: Optional[str] = None) -> Session:
+        session = self.get(session_id, kind)
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        return session
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            self._evict()
+            return [session.summary() for session in self._sessions.values()]
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl
+        for session_id in [s.id for s in self._sessions.values() if s.last_used < cutoff]:
+            del self._sessions[session_id]
+
+
+store = SessionStore()
+
+
+def configure(ttl: float = 3600.0, max_sessions: int = 256) -> None:
+    global store
+    store = SessionStore(ttl=ttl, max_sessions=max_sessions)
+
+
+def error_response(error: SessionError) -> JSONResponse:
+    return JSONResponse(status_code=error.status_code, content={"success": False, "data": None, "error": str(error)})
+
+
+@router.get("/sessions")
+async def list_sessions():
+    """List live streaming sessions of every kind."""
+    return {"success": True, "data": {"sessions": store.list()}, "error": None}
+
+
+@router.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Return the configuration and counters of a streaming session."""
+    try:
+        return {"success": True, "data": store.get(session_id).summary(), "error": None}
+    except SessionError as e:
+        return error_response(e)
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Close a streaming session and free its model."""
+    try:
+        store.delete(session_id)
+    except SessionError as e:
+        return error_response(e)
+    return {"success": True, "data": {"session_id": session_id}, "error": None}
@@ -1,29 +1,62 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from sklearn.linear_model import LinearRegression
+from fastapi import APIRouter, Depends
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
 import numpy as np
-from typing import List
-from scipy import stats
+from typing import Dict, List, Literal, Optional, Tuple
+from modules import datasets
+from modules.datasets import DatasetRef, resolve_column, resolve_matrix
+from modules.cache import CachePolicy, cache_policy, run_cached
+from modules.jobs import register_analysis, report_progress
+from modules.transport import ResultFormat, array_body, array_openapi, result_format
 
 router = APIRouter()
 
-class TimeSeriesRequest(BaseModel):
-    data: List[float]
+VERSION = "1.0"
+
+# Smoothing weights tried per series when the request leaves them unset.
+ALPHA_GRID = (0.1, 0.3, 0.5, 0.7, 0.9)
+BETA_GRID = (0.01, 0.1, 0.3)
+GAMMA_GRID = (0.05, 0.2, 0.5)
+
+class TimeSeriesRequest(DatasetRef):
+    data: List[float] = None
+    column: Optional[str] = None  # dataset column holding the series
     forecast_steps: int = 10
     seasonal_period: int = None
+    window: Optional[int] = None  # moving average window (default min(7, n // 4))
 
-@router.post("/timeseries/analyze")
-async def analyze_timeseries(request: TimeSeriesRequest) -> dict:
+class TimeSeriesBatchRequest(DatasetRef):
+    data: List[List[float]] = None  # one series per row; dataset columns are series
+    forecast_steps: int = 10
+    seasonal_period: Optional[int] = None
+    window: Optional[int] = None  # rolling window (default min(7, n // 4))
+    model: Literal["auto", "linear", "ses", "holt", "holt_winters"] = "auto"
+    alpha: Optional[float] = None  # level smoothing; fitted per series when unset
+    beta: Optional[float] = None  # trend smoothing
+    gamma: Optional[float] = None  # seasonal smoothing
+    return_components: bool = False  # include trend and rolling series (series x time)
+    block_size: int = 1024  # series per worker task
+    n_jobs: Optional[int] = None  # threads working on blocks (-1: all cores)
+
+@router.post("/timeseries/analyze", openapi_extra=array_openapi(TimeSeriesRequest))
+async def analyze_timeseries(
+    request: TimeSeriesRequest = Depends(array_body(TimeSeriesRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
     """Analyze time series data with trend, seasonality, and forecasting."""
+    result = await run_cached("timeseries", _analyze_timeseries, request, VERSION, cache)
+    return fmt.render(result, arrays=["original", "trend", "detrended", "moving_average"])
+
+def _analyze_timeseries(request: TimeSeriesRequest) -> dict:
     try:
-        data = np.array(request.data)
+        data = resolve_column(request.data, request, request.column)
         n = len(data)
         
-        # Trend analysis using linear regression
-        X = np.arange(n).reshape(-1, 1)
-        model = LinearRegression()
-        model.fit(X, data)
-        trend = model.predict(X)
+        # Trend analysis using closed-form least squares
+        slope, intercept = (float(v[0]) for v in _linear_trend(data[None, :]))
+        trend = intercept + slope * np.arange(n, dtype=data.dtype)
         
         # Detrend the data
         detrended = data - trend
@@ -34,16 +67,12 @@ async def analyze_timeseries(request: TimeSeriesRequest) -> dict:
         
         # Detect seasonality (simple autocorrelation)
         if request.seasonal_period and request.seasonal_period < n:
-            seasonal_component = []
-            for i in range(request.seasonal_period):
-                seasonal_vals = data[i::request.seasonal_period]
-                seasonal_component.append(float(np.mean(seasonal_vals)))
+            seasonal_component = _seasonal_profile(data[None, :], request.seasonal_period)[0].tolist()
         else:
             seasonal_component = None
         
         # Simple forecast (linear extrapolation)
-        X_future = np.arange(n, n + request.forecast_steps).reshape(-1, 1)
-        forecast = model.predict(X_future)
+        forecast = intercept + slope * np.arange(n, n + request.forecast_steps, dtype=data.dtype)
         
         # Calculate confidence intervals (simple approach)
         residuals = data - trend
@@ -52,32 +81,271 @@ async def analyze_timeseries(request: TimeSeriesRequest) -> dict:
         confidence_lower = forecast - 1.96 * std_residuals
         
         # Moving average
-        window = min(7, n // 4)
+        window = min(request.window or 7, n // 4 if request.window is None else n)
         if window > 0:
-            moving_avg = np.convolve(data, np.ones(window)/window, mode='valid')
-            moving_avg = np.pad(moving_avg, (window-1, 0), mode='edge').tolist()
+            moving_avg = np.convolve(data, np.ones(window, dtype=data.dtype)/window, mode='valid')
+            moving_avg = np.pad(moving_avg, (window-1, 0), mode='edge')
         else:
-            moving_avg = data.tolist()
+            moving_avg = data
         
         return {
             "success": True,
             "data": {
-                "original": data.tolist(),
-                "trend": trend.tolist(),
-                "detrended": detrended.tolist(),
+                "original": data,
+                "trend": trend,
+                "detrended": detrended,
                 "moving_average": moving_avg,
-                "forecast": forecast.tolist(),
-                "confidence_upper": confidence_upper.tolist(),
-                "confidence_lower": confidence_lower.tolist(),
+                "forecast": forecast,
+                "confidence_upper": confidence_upper,
+                "confidence_lower": confidence_lower,
                 "seasonal_component": seasonal_component,
                 "statistics": {
                     "mean": mean_val,
                     "std": std_val,
-                    "trend_slope": float(model.coef_[0]),
-                    "trend_intercept": float(model.intercept_)
+                    "trend_slope": slope,
+                    "trend_intercept": intercept
                 }
             },
             "error": None
         }
     except Exception as e:
         return {"success": False, "data": None, "error": str(e)}
+
+BATCH_ARRAYS = [
+    "slope", "intercept", "mean", "std", "rolling_mean_last", "rolling_std_last", "seasonal_profile",
+    "forecast", "confidence_lower", "confidence_upper", "residual_std", "alpha", "beta", "gamma",
+    "trend", "rolling_mean", "rolling_std"
+]
+
+@router.post("/timeseries/batch", openapi_extra=array_openapi(TimeSeriesBatchRequest))
+async def analyze_timeseries_batch(
+    request: TimeSeriesBatchRequest = Depends(array_body(TimeSeriesBatchRequest, "data")),
+    cache: CachePolicy = Depends(cache_policy),
+    fmt: ResultFormat = Depends(result_format),
+) -> dict:
+    """Trend, seasonality, rolling statistics and forecasts for many equal-length series at once.
+
+    Every output is indexed by series first (``forecast`` is series x steps).
+    """
+    result = await run_cached("timeseries", _analyze_timeseries_batch, request, VERSION, cache)
+    return fmt.render(result, arrays=BATCH_ARRAYS)
+
+def _analyze_timeseries_batch(request: TimeSeriesBatchRequest) -> dict:
+    try:
+        names = None
+        if request.dataset_id:
+            names = request.columns or datasets.store.meta(request.dataset_id)["numeric_columns"]
+            Y = np.ascontiguousarray(resolve_matrix(None, request, names).T)
+        else:
+            Y = resolve_matrix(request.data, request)
+        if Y.ndim != 2 or Y.shape[1] < 3:
+            raise ValueError("Provide a 2D array of series with at least 3 points each")
+        if not np.isfinite(Y).all():
+            raise ValueError("Series must not contain NaN or infinite values")
+        m, n = Y.shape
+        period = request.seasonal_period
+        if period is not None and not 1 < period < n:
+            raise ValueError(f"seasonal_period must be between 2 and the series length ({n})")
+        model = request.model
+        if model == "auto":
+            model = "holt_winters" if period and n >= 2 * period else "holt"
+        if model == "holt_winters" and not (period and n >= 2 * period):
+            raise ValueError("holt_winters needs a seasonal_period and at least two full seasons")
+        window = min(request.window or 7, n // 4 if request.window is None else n)
+        if request.forecast_steps < 1 or window < 1:
+            raise ValueError("forecast_steps and window must be positive")
+
+        blocks = [slice(start, start + max(request.block_size, 1)) for start in range(0, m, max(request.block_size, 1))]
+        workers = (os.cpu_count() or 1) if request.n_jobs == -1 else max(request.n_jobs or 1, 1)
+        solve = lambda block: _series_block(Y[block], request, model, window)
+
+        def collect(solved) -> list:
+            parts = []
+            for part in solved:
+                parts.append(part)
+                report_progress(len(parts) / len(blocks))
+            return parts
+
+        if workers == 1 or len(blocks) == 1:
+            parts = collect(map(solve, blocks))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                parts = collect(pool.map(solve, blocks))
+        # Blocks return the same keys; stitch each output back together along the series axis,
+        # in the precision of the input.
+        out = {key: None if parts[0][key] is None else
+               np.concatenate([part[key] for part in parts]).astype(Y.dtype, copy=False)
+               for key in parts[0]}
+
+        return {
+            "success": True,
+            "data": {
+                "series": names,
+                "n_series": m,
+                "length": n,
+                "model": model,
+                "window": window,
+                **out
+            },
+            "error": None
+        }
+    except Exception as e:
+        return {"success": False, "data": None, "error": str(e)}
+
+def _series_block(Y: np.ndarray, request: TimeSeriesBatchRequest, model: str, window: int) -> Dict[str, Optional[np.ndarray]]:
+    """All outputs for one block of series (rows of ``Y``)."""
+    m, n = Y.shape
+    period = request.seasonal_period
+    steps = request.forecast_steps
+    slope, intercept = _linear_trend(Y)
+    t = np.arange(n, dtype=Y.dtype)
+    tail = Y[:, -window:]
+    out = {
+        "slope": slope,
+        "intercept": intercept,
+        "mean": Y.mean(axis=1),
+        "std": Y.std(axis=1),
+        "rolling_mean_last": tail.mean(axis=1),
+        "rolling_std_last": tail.std(axis=1),
+        "seasonal_profile": None,
+        "alpha": None, "beta": None, "gamma": None,
+    }
+
+    if period:
+        # Additive seasonal indices of the detrended series.
+        detrended = Y - intercept[:, None] - slope[:, None] * t
+        profile = _seasonal_profile(detrended, period)
+        out["seasonal_profile"] = profile - profile.mean(axis=1, keepdims=True)
+
+    if model == "linear":
+        fitted = intercept[:, None] + slope[:, None] * t
+        future = intercept[:, None] + slope[:, None] * np.arange(n, n + steps)
+        if period:
+            fitted += out["seasonal_profile"][:, t % period]
+            future += out["seasonal_profile"][:, np.arange(n, n + steps) % period]
+        sigma = (Y - fitted).std(axis=1)
+        spread = np.broadcast_to(1.96 * sigma[:, None], future.shape)
+    else:
+        smoothed = _exponential_smoothing(
+            Y, period if model == "holt_winters" else None, model != "ses", steps,
+            request.alpha, request.beta, request.gamma
+        )
+        future, sigma, spread = smoothed["forecast"], smoothed["sigma"], smoothed["spread"]
+        out["alpha"], out["beta"], out["gamma"] = smoothed["alpha"], smoothed["beta"], smoothed["gamma"]
+    out.update(forecast=future, confidence_lower=future - spread, confidence_upper=future + spread, residual_std=sigma)
+
+    if request.return_components:
+        out["trend"] = intercept[:, None] + slope[:, None] * t
+        out["rolling_mean"], out["rolling_std"] = _rolling_stats(Y, window)
+    else:
+        out["trend"] = out["rolling_mean"] = out["rolling_std"] = None
+    return out
+
+
+def _linear_trend(Y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Least-squares slope and intercept of every row of ``Y`` against time, in closed form."""
+    n = Y.shape[1]
+    if n < 2:
+        # A single point has no trend: flat line through it
+        return np.zeros(Y.shape[0], dtype=Y.dtype), Y.mean(axis=1)
+    centered = (np.arange(n) - (n - 1) / 2).astype(Y.dtype)
+    slope = Y @ centered / (centered @ centered)
+    return slope, Y.mean(axis=1) - slope * (n - 1) / 2
+
+
+def _seasonal_profile(Y: np.ndarray, period: int) -> np.ndarray:
+    """Mean of ``Y[:, i::period]`` for each phase ``i``, as a (series, period) array."""
+    m, n = Y.shape
+    cycles, rest = divmod(n, period)
+    sums = Y[:, :cycles * period].reshape(m, cycles, period).sum(axis=1)
+    sums[:, :rest] += Y[:, cycles * period:]
+    counts = np.full(period, cycles)
+    counts[:rest] += 1
+    return sums / counts
+
+
+def _rolling_stats(Y: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Trailing rolling mean and std over ``window`` points, edge-padded to the series length."""
+    mu = Y.mean(axis=1, keepdims=True)
+    centered = Y - mu  # keeps the running sums of squares well conditioned
+    zero = np.zeros((len(Y), 1))
+    # The running sums are differenced, so they stay float64 even for float32 series.
+    s1 = np.concatenate([zero, np.cumsum(centered, axis=1, dtype=np.float64)], axis=1)
+    s2 = np.concatenate([zero, np.cumsum(centered * centered, axis=1, dtype=np.float64)], axis=1)
+    mean = (s1[:, window:] - s1[:, :-window]) / window
+    var = (s2[:, window:] - s2[:, :-window]) / window - mean * mean
+    std = np.sqrt(np.maximum(var, 0.0))
+    pad = (0, 0), (window - 1, 0)
+    mean, std = (mean + mu).astype(Y.dtype, copy=False), std.astype(Y.dtype, copy=False)
+    return np.pad(mean, pad, mode="edge"), np.pad(std, pad, mode="edge")
+
+def _exponential_smoothing(
+    Y: np.ndarray, period: Optional[int], trend: bool, steps: int,
+    alpha: Optional[float], beta: Optional[float], gamma: Optional[float]
+) -> Dict[str, Optional[np.ndarray]]:
+    """Additive exponential smoothing (simple, Holt or Holt-Winters) for every row of ``Y``.
+
+    The recursions run once over time for all series and every candidate
+    weight combination at the same time; each series then keeps the
+    combination with the smallest one-step-ahead squared error. Intervals use
+    the additive ETS forecast variance, which widens with the horizon.
+    """
+    m, n = Y.shape
+    grid = np.array(list(product(
+        ALPHA_GRID if alpha is None else (alpha,),
+        (BETA_GRID if beta is None else (beta,)) if trend else (0.0,),
+        (GAMMA_GRID if gamma is None else (gamma,)) if period else (0.0,),
+    )))
+    a, b, g = (grid[:, k, None] for k in range(3))  # (combos, 1) against (combos, series)
+
+    if period:
+        first = Y[:, :period].mean(axis=1)
+        level = np.broadcast_to(first, (len(grid), m)).copy()
+        slope = np.broadcast_to((Y[:, period:2 * period].mean(axis=1) - first) / period, (len(grid), m)).copy()
+        season = np.broadcast_to(Y[:, :period] - first[:, None], (len(grid), m, period)).copy()
+        start = period
+    else:
+        level = np.broadcast_to(Y[:, 0], (len(grid), m)).copy()
+        slope = np.broadcast_to(Y[:, 1] - Y[:, 0], (len(grid), m)).copy() if trend else np.zeros((len(grid), m))
+        season = None
+        start = 1
+    sse = np.zeros((len(grid), m))
+    for t in range(start, n):
+        error = Y[:, t] - level - slope
+        if period:
+            error -= season[:, :, t % period]
+            season[:, :, t % period] += g * error
+        sse += error * error
+        level += slope + a * error
+        if trend:
+            slope += a * b * error
+
+    best = np.argmin(sse, axis=0)
+    pick = lambda values: values[best, np.arange(m)]
+    level, slope, sse = pick(level), pick(slope), pick(sse)
+    a, b, g = grid[best, 0], grid[best, 1], grid[best, 2]
+    horizon = np.arange(1, steps + 1)
+    forecast = level[:, None] + slope[:, None] * horizon
+    if period:
+        forecast += season[best, np.arange(m)][:, (n - 1 + horizon) % period]
+    sigma = np.sqrt(sse / max(n - start, 1))
+    # Var(h) = sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha * (1 + j * beta) + gamma * [j % period == 0].
+    j = np.arange(1, steps)
+    c = a[:, None] * (1 + j * b[:, None])
+    if period:
+        c = c + g[:, None] * (j % period == 0)
+    variance = 1 + np.concatenate([np.zeros((m, 1)), np.cumsum(c * c, axis=1)], axis=1)
+    return {
+        "forecast": forecast,
+        "sigma": sigma,
+        "spread": 1.96 * sigma[:, None] * np.sqrt(variance),
+        "alpha": a,
+        "beta": b if trend else None,
+        "gamma": g if period else None,
+    }
+
+register_analysis("timeseries", TimeSeriesRequest, _analyze_timeseries, version=VERSION)
+register_analysis(
+    "timeseries_batch", TimeSeriesBatchRequest, _analyze_timeseries_batch, endpoint="timeseries", matrix="data",
+    version=VERSION,
+)
@@ -0,0 +1,414 @@
+"""Content negotiation between JSON and binary columnar payloads.
+
+Besides the usual JSON body, array endpoints accept:
+
+* ``application/vnd.apache.arrow.stream`` - an Arrow IPC stream. A single
+  fixed-size-list column is decoded zero-copy as an ``(n, p)`` matrix; plain
+  numeric columns are stacked into one.
+* ``application/octet-stream`` - raw little-endian float64 with an
+  ``X-Array-Shape: n,p`` header, decoded zero-copy with ``np.frombuffer``
+  (float32 with ``X-Array-Dtype: float32``).
+
+Scalar parameters (``algorithm``, ``n_clusters``, ...) travel in the query
+string for binary bodies. The ``Accept`` header selects the response format
+the same way; the non-array part of the result rides along as JSON in the
+Arrow schema metadata or the ``X-Result-Metadata`` header. float32 inputs
+and results (``dtype=float32`` requests) stay float32 in every format: Arrow
+float columns, raw bodies tagged ``X-Array-Dtype: float32``, and JSON numbers
+printed at float32 precision.
+
+JSON results are encoded straight from the NumPy buffers (with ``orjson``
+when it is installed) instead of going through ``.tolist()``. Large ones are
+streamed a chunk of rows at a time, and ``application/x-ndjson`` sends the
+scalar part first and then the arrays as chunk lines. ``?fields=a,b`` limits
+any format to the named ``data`` fields.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Type, Union, get_args, get_origin
+
+import numpy as np
+from fastapi import Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+from modules import metrics
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is slower but equivalent
+    orjson = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+RAW_FLOAT64 = "application/octet-stream"
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+
+# Rows encoded per chunk when streaming an array.
+STREAM_CHUNK_ROWS = 8192
+# JSON results whose arrays hold at least this many values are streamed.
+STREAM_MIN_VALUES = 1 << 16
+
+
+class TransportError(Exception):
+    """A binary payload that cannot be decoded or encoded (served as 415/406)."""
+
+    def __init__(self, message: str, status_code: int = 415):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Records:
+    """Columnar rows that serialize to JSON as a list of per-row dicts.
+
+    Lets handlers keep per-row output as NumPy columns so binary responses
+    never build Python objects, while JSON clients see the usual format.
+    """
+
+    def __init__(self, **columns: np.ndarray):
+        self.columns = columns
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()), ()))
+
+    def to_list(self) -> List[dict]:
+        names = list(self.columns)
+        # float32 columns stay NumPy scalars so the encoder prints their short float32 form.
+        columns = (col if col.dtype == np.float32 else col.tolist() for col in self.columns.values())
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+    def slice(self, start: int, stop: int) -> "Records":
+        return Records(**{name: col[start:stop] for name, col in self.columns.items()})
+
+
+def to_jsonable(value: Any) -> Any:
+    """Recursively turn NumPy arrays/scalars and ``Records`` into plain Python."""
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Records):
+        return value.to_list()
+    return value
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (np.ndarray, np.generic, Records)):
+        return to_jsonable(value)
+    return jsonable_encoder(value)
+
+
+def encode_json(value: Any) -> bytes:
+    """Serialize ``value`` to JSON bytes, reading NumPy arrays without ``.tolist()`` when possible."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default).encode()
+
+
+def _array_chunks(value: Any) -> Iterator[bytes]:
+    """The elements of an array or ``Records``, encoded without the enclosing brackets."""
+    for start in range(0, len(value), STREAM_CHUNK_ROWS):
+        chunk = value[start:start + STREAM_CHUNK_ROWS] if isinstance(value, np.ndarray) else \
+            value.slice(start, start + STREAM_CHUNK_ROWS).to_list()
+        yield encode_json(chunk)[1:-1]
+
+
+def _streamable(value: Any) -> bool:
+    return isinstance(value, Records) or (isinstance(value, np.ndarray) and value.ndim > 0)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+    except ImportError:
+        raise TransportError("Arrow IPC requires the optional 'pyarrow' package")
+    return pyarrow
+
+
+def _media_type(value: Optional[str]) -> str:
+    return (value or JSON).split(";")[0].strip().lower()
+
+
+def _floats(values: np.ndarray) -> np.ndarray:
+    """float32 stays float32; anything else becomes float64."""
+    return values if values.dtype == np.float32 else values.astype("<f8", copy=False)
+
+
+def decode_matrix(body: bytes, content_type: str, shape: Optional[str] = None, dtype: Optional[str] = None) -> np.ndarray:
+    """Decode a binary request body into a float64 (or float32) array without copying when possible."""
+    if content_type == RAW_FLOAT64:
+        if (dtype or "float64") not in ("float64", "float32"):
+            raise TransportError(f"X-Array-Dtype must be float64 or float32, got '{dtype}'")
+        values = np.frombuffer(body, dtype="<f4" if dtype == "float32" else "<f8")
+        if not shape:
+            return values
+        dims = tuple(int(dim) for dim in shape.split(","))
+        if int(np.prod(dims)) != values.size:
+            raise TransportError(f"X-Array-Shape {dims} does not match {values.size} {values.dtype.name} values")
+        return values.reshape(dims)
+
+    pa = _pyarrow()
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    if table.num_columns == 1 and pa.types.is_fixed_size_list(table.schema.field(0).type):
+        column = table.column(0).combine_chunks()
+        width = column.type.list_size
+        values = column.flatten().to_numpy(zero_copy_only=False)
+        return _floats(values).reshape(-1, width)
+    columns = [table.column(i).to_numpy() for i in range(table.num_columns)]
+    if len(columns) == 1:
+        return _floats(columns[0])
+    return _floats(np.column_stack(columns))
+
+
+def _is_list_field(annotation: Any) -> bool:
+    if get_origin(annotation) in (list, List):
+        return True
+    return get_origin(annotation) is Union and any(_is_list_field(arg) for arg in get_args(annotation))
+
+
+def _query_params(model: Type[BaseModel], request: Request) -> Dict[str, Any]:
+    params = {}
+    for name, field in model.model_fields.items():
+        values = request.query_params.getlist(name)
+        if not values:
+            continue
+        if len(values) == 1 and values[0][:1] in ("[", "{"):
+            try:
+                params[name] = json.loads(values[0])
+            except ValueError:
+                params[name] = values[0]  # left for pydantic to reject
+        elif _is_list_field(field.annotation):
+            params[name] = values
+        else:
+            params[name] = values[-1]
+    return params
+
+
+def array_body(model: Type[BaseModel], field: str, target: Optional[str] = None):
+    """Dependency that builds ``model`` from a JSON, Arrow or raw float64 body.
+
+    Binary bodies fill ``field`` with the decoded array. When ``target`` is
+    given the last column (raw) or the column named ``target`` (Arrow) is
+    split off into that field, e.g. ``y`` for regression.
+    """
+
+    async def dependency(http_request: Request) -> BaseModel:
+        content_type = _media_type(http_request.headers.get("content-type"))
+        with metrics.span("receive"):
+            body = await http_request.body()
+        with metrics.span("parse"):
+            try:
+                if content_type not in (ARROW_STREAM, RAW_FLOAT64):
+                    return model.model_validate_json(body)
+                placeholders = {field: [], **({target: []} if target else {})}
+                request = model.model_validate({**_query_params(model, http_request), **placeholders})
+            except ValidationError as e:
+                raise RequestValidationError(e.errors())
+
+            try:
+                if target and content_type == ARROW_STREAM:
+                    arrays = _split_arrow_target(body, field, target)
+                else:
+                    matrix = decode_matrix(body, content_type, http_request.headers.get("x-array-shape"),
+                                           http_request.headers.get("x-array-dtype"))
+                    arrays = {field: matrix[:, :-1], target: matrix[:, -1]} if target else {field: matrix}
+            except TransportError:
+                raise
+            except Exception as e:
+                raise TransportError(f"Could not decode {content_type} body: {e}")
+            return request.model_copy(update=arrays)
+
+    return dependency
+
+
+def _split_arrow_target(body: bytes, field: str, target: str) -> Dict[str, np.ndarray]:
+    pa = _pyarrow()
+    table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    if target not in table.column_names:
+        raise TransportError(f"Arrow body must contain a '{target}' column")
+    y = _floats(table.column(target).to_numpy())
+    rest = table.drop([target])
+    features = [rest.column(i).to_numpy() for i in range(rest.num_columns)]
+    return {field: _floats(np.column_stack(features)), target: y}
+
+
+def array_openapi(model: Type[BaseModel]) -> dict:
+    """OpenAPI ``requestBody`` for routes that read their body through ``array_body``."""
+    binary = {"schema": {"type": "string", "format": "binary"}}
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {JSON: {"schema": model.model_json_schema()}, ARROW_STREAM: binary, RAW_FLOAT64: binary},
+        }
+    }
+
+
+class ResultFormat:
+    """Response format negotiated from the ``Accept`` header, plus field selection.
+
+    ``fields`` limits the response to those ``data`` fields. ``stream`` forces
+    (True) or disables (False) chunked JSON; by default JSON is streamed once
+    its arrays reach ``STREAM_MIN_VALUES`` values.
+    """
+
+    def __init__(self, media_type: str, response: Optional[Response] = None,
+                 fields: Optional[Sequence[str]] = None, stream: Optional[bool] = None):
+        self.media_type = media_type
+        self.response = response
+        self.fields = fields
+        self.stream = stream
+
+    def render(self, result: dict, arrays: Sequence[str] = (), exclude: Sequence[str] = ()) -> Any:
+        """Encode ``result``; ``arrays`` name the ``data`` fields sent as binary columns.
+
+        ``exclude`` drops fields from the binary metadata that merely restate
+        the arrays (for example the pair list of a correlation matrix).
+        """
+        if not result.get("success"):
+            metrics.record_error()
+            return to_jsonable(result)
+        if self.media_type in (JSON, NDJSON):
+            return self.json(result)
+        with metrics.span("serialize"):
+            result = self._select(result)
+            data = result["data"]
+            meta = {"success": True, "error": None, "data": {
+                key: value for key, value in data.items() if key not in arrays and key not in exclude
+            }}
+            columns = _columns({name: data[name] for name in arrays if data.get(name) is not None})
+            if self.media_type == ARROW_STREAM:
+                return self._arrow(columns, meta)
+            return self._raw(columns, meta)
+
+    def json(self, result: dict) -> Response:
+        """Encode ``result`` as JSON (or NDJSON when negotiated), streaming large arrays."""
+        if not result.get("success"):
+            metrics.record_error()
+            return to_jsonable(result)
+        result = self._select(result)
+        data = result["data"]
+        streamed = [key for key, value in (data or {}).items() if _streamable(value)]
+        if self.media_type == NDJSON:
+            return self._response(metrics.timed(self._ndjson(result, streamed), "serialize"), {}, NDJSON)
+        values = sum(np.size(data[key]) if isinstance(data[key], np.ndarray) else
+                     len(data[key]) * len(data[key].columns) for key in streamed)
+        if self.stream is False or (not self.stream and values < STREAM_MIN_VALUES):
+            with metrics.span("serialize"):
+                body = encode_json(result)
+            return self._response(body, {}, JSON)
+        return self._response(metrics.timed(self._json_chunks(result, streamed), "serialize"), {}, JSON)
+
+    def _select(self, result: dict) -> dict:
+        if self.fields is None or not isinstance(result.get("data"), dict):
+            return result
+        data = {key: value for key, value in result["data"].items() if key in self.fields}
+        return {**result, "data": data}
+
+    @staticmethod
+    def _json_chunks(result: dict, streamed: Sequence[str]) -> Iterator[bytes]:
+        """The same document ``encode_json(result)`` produces, one array chunk at a time."""
+        head = {key: value for key, value in result.items() if key != "data"}
+        yield encode_json(head)[:-1] + b',"data":{' if head else b'{"data":{'
+        for position, (key, value) in enumerate(result["data"].items()):
+            yield (b"," if position else b"") + encode_json(key) + b":"
+            if key not in streamed:
+                yield encode_json(value)
+                continue
+            yield b"["
+            first = True
+            for chunk in _array_chunks(value):
+                if chunk:
+                    yield chunk if first else b"," + chunk
+                    first = False
+            yield b"]"
+        yield b"}}"
+
+    @staticmethod
+    def _ndjson(result: dict, streamed: Sequence[str]) -> Iterator[bytes]:
+        """A header line with the scalar fields, then ``{"field", "offset", "values"}`` chunk lines."""
+        data = result["data"]
+        header = {**result, "data": {key: value for key, value in data.items() if key not in streamed},
+                  "arrays": {key: len(data[key]) for key in streamed}}
+        yield encode_json(header) + b"\n"
+        for key in streamed:
+            for index, chunk in enumerate(_array_chunks(data[key])):
+                prefix = encode_json({"field": key, "offset": index * STREAM_CHUNK_ROWS})[:-1]
+                yield prefix + b',"values":[' + chunk + b"]}\n"
+
+    def _arrow(self, columns: Dict[str, np.ndarray], meta: dict) -> Response:
+        pa = _pyarrow()
+        fields = {}
+        for name, values in columns.items():
+            if values.ndim == 2:
+                flat = pa.array(np.ascontiguousarray(values).ravel())
+                fields[name] = pa.FixedSizeListArray.from_arrays(flat, values.shape[1])
+            else:
+                fields[name] = pa.array(values)
+        table = pa.table(fields).replace_schema_metadata({"result": json.dumps(to_jsonable(meta))})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return self._response(sink.getvalue().to_pybytes(), {}, ARROW_STREAM)
+
+    def _raw(self, columns: Dict[str, np.ndarray], meta: dict) -> Response:
+        names = list(columns)
+        if not names:
+            matrix = np.empty(0)
+        elif len(names) == 1:
+            matrix = columns[names[0]]
+        else:
+            matrix = np.column_stack([columns[name] for name in names])
+        single = bool(names) and all(columns[name].dtype == np.float32 for name in names)
+        matrix = np.ascontiguousarray(matrix, dtype="<f4" if single else "<f8")
+        headers = {
+            "X-Array-Shape": ",".join(str(dim) for dim in matrix.shape),
+            "X-Array-Dtype": matrix.dtype.name,
+            "X-Array-Columns": ",".join(names),
+            "X-Result-Metadata": json.dumps(to_jsonable(meta)),
+        }
+        return self._response(matrix.tobytes(), headers, RAW_FLOAT64)
+
+    def _response(self, body: Union[bytes, Iterator[bytes]], headers: Dict[str, str], media_type: str) -> Response:
+        if isinstance(body, bytes):
+            response = Response(content=body, media_type=media_type, headers=headers)
+        else:
+            response = StreamingResponse(body, media_type=media_type, headers=headers)
+        if self.response is not None:
+            for key, value in self.response.headers.items():
+                if key.lower() not in ("content-length", "content-type"):
+                    response.headers[key] = value
+        return response
+
+
+def _columns(arrays: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    columns = {}
+    for name, value in arrays.items():
+        if isinstance(value, Records):
+            columns.update({f"{name}.{key}": np.asarray(col) for key, col in value.columns.items()})
+        else:
+            columns[name] = np.asarray(value)
+    lengths = {len(col) for col in columns.values()}
+    if len(lengths) > 1:
+        raise TransportError(f"Binary output columns differ in length: {sorted(lengths)}", status_code=406)
+    return columns
+
+
+def result_format(
+    response: Response,
+    accept: Optional[str] = Header(None),
+    fields: Optional[str] = Query(None, description="Comma-separated data fields to return"),
+    stream: Optional[bool] = Query(None, description="Force (true) or disable (false) chunked JSON"),
+) -> ResultFormat:
+    """FastAPI dependency picking JSON, NDJSON, Arrow IPC or raw float64 from ``Accept``."""
+    selected = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+    for option in (accept or JSON).split(","):
+        media_type = _media_type(option)
+        if media_type in (JSON, NDJSON, ARROW_STREAM, RAW_FLOAT64):
+            return ResultFormat(media_type, response, selected, stream)
+    return ResultFormat(JSON, response, selected, stream)
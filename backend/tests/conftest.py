@@ -0,0 +1,33 @@
+"""Shared fixtures: one app instance backed by temporary stores."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # main.py configures every module from the environment at import time.
+    root = tmp_path_factory.mktemp("stores")
+    os.environ["DATASET_DIR"] = str(root / "datasets")
+    os.environ["MODEL_DIR"] = ""  # models stay in memory
+    os.environ["PROFILE_DIR"] = str(root / "profiles")
+    import main
+
+    return main.app
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def matrix():
+    return np.random.default_rng(0).normal(size=(200, 4))
@@ -0,0 +1,46 @@
+import json
+
+from modules import cache, executor
+
+
+def _lines(response):
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda line: line["index"])
+
+
+def test_specs_share_the_result_cache_with_single_endpoints(client, matrix):
+    client.delete("/api/cache")
+    single = client.post("/api/clustering/analyze", json={"data": matrix.tolist(), "n_clusters": 3}).json()
+    hits = cache.results.stats()["hits"]
+
+    response = client.post("/api/batch", json={"data": matrix.tolist(), "specs": [
+        {"analysis": "clustering", "params": {"n_clusters": 3}, "id": "k3"},
+        {"analysis": "clustering", "params": {"n_clusters": 4}, "id": "k4"},
+    ]})
+    lines = _lines(response)
+
+    assert [line["id"] for line in lines] == ["k3", "k4"]
+    assert all(line["success"] for line in lines)
+    assert lines[0]["data"]["labels"] == single["data"]["labels"]
+    assert cache.results.stats()["hits"] == hits + 1
+    assert client.post("/api/clustering/analyze", json={"data": matrix.tolist(), "n_clusters": 4}).headers["X-Cache"] == "HIT"
+
+
+def test_bad_specs_are_rejected_before_streaming(client, matrix):
+    response = client.post("/api/batch", json={"data": matrix.tolist(), "specs": [{"analysis": "nope"}]})
+    assert response.status_code == 422
+    assert "unsupported analysis 'nope'" in response.json()["error"]
+    assert client.post("/api/batch", json={"data": matrix.tolist(), "specs": []}).status_code == 422
+
+
+def test_full_batch_queue_is_rejected_with_429(client, matrix):
+    limiter = executor.get_limiter("batch")
+    capacity = limiter.concurrency + limiter.queue_depth
+    for _ in range(capacity):
+        limiter.admit()
+    try:
+        response = client.post("/api/batch", json={"data": matrix.tolist(), "specs": [{"analysis": "correlation"}]})
+    finally:
+        for _ in range(capacity):
+            limiter.release()
+    assert response.status_code == 429
+    assert limiter.pending == 0
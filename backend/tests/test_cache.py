@@ -0,0 +1,67 @@
+import asyncio
+
+import numpy as np
+
+from modules import cache
+from modules.correlation import CorrelationRequest, _analyze_correlation
+
+
+def test_key_covers_parameters_and_array_bytes(matrix):
+    base = CorrelationRequest(data=[]).model_copy(update={"data": matrix})
+    key = cache.make_key("correlation", "1", base)
+
+    assert cache.make_key("correlation", "1", base.model_copy(update={"data": matrix.copy()})) == key
+    assert cache.make_key("correlation", "2", base) != key
+    assert cache.make_key("correlation", "1", base.model_copy(update={"method": "spearman"})) != key
+    changed = matrix.copy()
+    changed[0, 0] += 1e-12
+    assert cache.make_key("correlation", "1", base.model_copy(update={"data": changed})) != key
+    assert cache.make_key("correlation", "1", base.model_copy(update={"data": matrix.astype(np.float32)})) != key
+
+
+def test_hit_miss_and_bypass(client, matrix):
+    client.delete("/api/cache")
+    body = {"data": matrix.tolist()}
+    url = "/api/correlation/analyze"
+
+    first = client.post(url, json=body)
+    second = client.post(url, json=body)
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+
+    assert client.post(url, json=body, headers={"X-Cache-Bypass": "1"}).headers["X-Cache"] == "BYPASS"
+    assert client.post(url, json=body, headers={"Cache-Control": "no-cache"}).headers["X-Cache"] == "BYPASS"
+    assert client.post(url, json={**body, "method": "spearman"}).headers["X-Cache"] == "MISS"
+    assert client.get("/api/cache/stats").json()["data"]["hits"] >= 1
+
+
+def test_hits_are_detached_from_the_entry(client, matrix):
+    client.delete("/api/cache")
+    request = CorrelationRequest(data=[]).model_copy(update={"data": matrix})
+
+    async def lookup():
+        return await cache.run_cached("correlation", _analyze_correlation, request, "test")
+
+    first = asyncio.run(lookup())
+    first["data"]["method"] = "edited"
+    second = asyncio.run(lookup())
+
+    assert second["data"]["method"] == "pearson"
+    assert second is not first
+    matrix_out = second["data"]["correlation_matrix"]
+    assert not matrix_out.flags.writeable
+    entry = cache.results.stats()
+    assert 0 < entry["bytes"] < 4 * matrix_out.nbytes + 4096
+
+
+def test_estimate_size_counts_array_buffers():
+    values = np.zeros((1000, 10))
+    assert cache.estimate_size({"data": {"values": values}}) >= values.nbytes
+    assert cache.estimate_size([1.0] * 100) > 100 * 8
+
+
+def test_json_lists_and_arrays_share_a_key(matrix):
+    listed = CorrelationRequest(data=matrix.tolist())
+    binary = CorrelationRequest(data=[]).model_copy(update={"data": matrix})
+    assert cache.make_key("correlation", "1", listed) == cache.make_key("correlation", "1", binary)
@@ -0,0 +1,54 @@
+import numpy as np
+
+from modules.chunked import ColumnStats, RowReservoir
+
+
+def _with_gaps(matrix):
+    values = matrix * [1, 1e3, 1e-3, 1] + [0, 1e6, 0, -5]  # offsets and scales Welford must survive
+    values[::7, 0] = np.nan
+    values[:, 3] = np.nan  # an all-missing column
+    return values
+
+
+def test_column_stats_match_numpy(matrix):
+    values = _with_gaps(matrix)
+    stats = ColumnStats(values.shape[1])
+    for start, stop in [(0, 1), (1, 50), (50, 50), (50, 133), (133, 200)]:  # uneven, one empty
+        stats.update(values[start:stop])
+    mean, std, low, high = stats.summary()
+
+    assert stats.rows == len(values)
+    np.testing.assert_array_equal(stats.missing, np.isnan(values).sum(axis=0))
+    np.testing.assert_allclose(mean[:3], np.nanmean(values[:, :3], axis=0), rtol=1e-12)
+    np.testing.assert_allclose(std[:3], np.nanstd(values[:, :3], axis=0), rtol=1e-10)
+    np.testing.assert_array_equal(low[:3], np.nanmin(values[:, :3], axis=0))
+    np.testing.assert_array_equal(high[:3], np.nanmax(values[:, :3], axis=0))
+    assert np.isnan([mean[3], std[3], low[3], high[3]]).all()
+    assert np.isnan(stats.summary(propagate_nan=True)[0][0])
+
+
+def test_with_fill_matches_imputed_data(matrix):
+    values = _with_gaps(matrix)[:, :3]
+    stats = ColumnStats(3)
+    stats.update(values)
+    fill = np.nanmean(values, axis=0)
+    mean, std, _, _ = stats.with_fill(fill).summary()
+
+    imputed = np.where(np.isnan(values), fill, values)
+    np.testing.assert_allclose(mean, imputed.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(std, imputed.std(axis=0), rtol=1e-10)
+
+
+def test_reservoir_is_exact_until_full_and_grows_lazily(matrix):
+    reservoir = RowReservoir(4, size=1000)
+    reservoir.update(matrix[:30])
+    reservoir.update(matrix[30:])
+
+    assert reservoir.exact
+    assert len(reservoir.rows) < 1000
+    np.testing.assert_array_equal(reservoir.quantile(0.5), np.median(matrix, axis=0))
+
+    small = RowReservoir(4, size=50)
+    small.update(matrix)
+    assert not small.exact
+    assert small.rows.shape == (50, 4)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from modules import clustering
+
+
+@pytest.fixture
+def blobs():
+    rng = np.random.default_rng(3)
+    return np.vstack([rng.normal(center, 0.3, size=(100, 2)) for center in ([0, 0], [5, 5], [0, 5])])
+
+
+def _no_probe(*args, **kwargs):
+    pytest.fail("DBSCAN neighbour probe ran for a fit that does not use it")
+
+
+def test_plain_dbscan_fit_skips_the_neighbour_probe(client, blobs, monkeypatch):
+    monkeypatch.setattr(clustering, "_neighbors_per_row", _no_probe)
+    for large_data in ("auto", "off"):
+        response = client.post("/api/clustering/analyze", headers={"X-Cache-Bypass": "1"}, json={
+            "data": blobs.tolist(), "algorithm": "dbscan", "eps": 0.5, "large_data": large_data,
+        })
+        data = response.json()["data"]
+        assert data["plan"]["strategy"] == "dbscan"
+        assert data["plan"]["estimated_memory_bytes"] is None
+        assert len(set(data["labels"]) - {-1}) == 3
+
+
+def test_estimate_probes_dbscan_density(client, blobs):
+    response = client.post("/api/clustering/estimate", json={"data": blobs.tolist(), "algorithm": "dbscan"})
+    plan = response.json()["data"]
+    assert plan["estimated_memory_bytes"] > blobs.nbytes
+    assert plan["estimated_seconds"] >= 0
+
+
+@pytest.mark.parametrize("algorithm, options, strategy", [
+    ("kmeans", {"large_data": "off"}, "kmeans"),
+    ("kmeans", {"large_data": "on"}, "minibatch_kmeans"),
+    ("hierarchical", {"large_data": "off"}, "agglomerative"),
+    ("hierarchical", {"large_data": "on", "hierarchical_method": "birch"}, "birch"),
+    ("hierarchical", {"large_data": "on"}, "connectivity_agglomerative"),
+    ("hierarchical", {"large_data": "on", "max_fit_rows": 120}, "connectivity_agglomerative"),
+])
+def test_every_strategy_recovers_the_blobs(client, blobs, algorithm, options, strategy):
+    response = client.post("/api/clustering/analyze", headers={"X-Cache-Bypass": "1"}, json={
+        "data": blobs.tolist(), "algorithm": algorithm, "n_clusters": 3, **options,
+    })
+    data = response.json()["data"]
+    assert data["plan"]["strategy"] == strategy
+    labels = np.asarray(data["labels"])
+    assert len(labels) == len(blobs)
+    # Each blob lands in a cluster of its own.
+    assert [len(set(labels[i:i + 100])) for i in range(0, 300, 100)] == [1, 1, 1]
+    assert len(set(labels)) == 3
+    assert sorted(stat["size"] for stat in data["cluster_stats"]) == [100, 100, 100]
+    if strategy.endswith("kmeans"):
+        centers = sorted(map(tuple, np.round(data["centers"])))
+        assert centers == [(0, 0), (0, 5), (5, 5)]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+BYPASS = {"X-Cache-Bypass": "1"}
+
+
+@pytest.fixture
+def wide():
+    rng = np.random.default_rng(4)
+    return rng.normal(size=(60, 40))
+
+
+def _strongest(X, k):
+    corr = np.corrcoef(X, rowvar=False)
+    i, j = np.triu_indices(X.shape[1], k=1)
+    order = np.argsort(-np.abs(corr[i, j]), kind="stable")[:k]
+    return [(f"Feature_{a}", f"Feature_{b}", corr[a, b]) for a, b in zip(i[order], j[order])]
+
+
+@pytest.mark.parametrize("block_size", [1024, 7])
+def test_top_k_matches_the_full_matrix(client, wide, block_size):
+    data = client.post("/api/correlation/analyze", headers=BYPASS, json={
+        "data": wide.tolist(), "pairs": "top_k", "top_k": 15, "return_matrix": False, "block_size": block_size,
+    }).json()["data"]
+    assert data["pairs"] == "top_k"
+    assert data["correlation_matrix"] is None
+    top = [(r["feature1"], r["feature2"], r["correlation"]) for r in data["top_correlations"]]
+    expected = _strongest(wide, 15)
+    assert [pair[:2] for pair in top] == [pair[:2] for pair in expected]
+    assert [pair[2] for pair in top] == pytest.approx([pair[2] for pair in expected])
+
+
+def test_threshold_keeps_only_strong_pairs(client, wide):
+    data = client.post("/api/correlation/analyze", headers=BYPASS, json={
+        "data": wide.tolist(), "pairs": "threshold", "threshold": 0.3, "block_size": 16,
+    }).json()["data"]
+    corr = np.asarray(data["correlation_matrix"])
+    i, j = np.triu_indices(len(corr), k=1)
+    assert len(data["correlations"]) == int(np.sum(np.abs(corr[i, j]) >= 0.3))
+    strengths = [r["abs_correlation"] for r in data["correlations"]]
+    assert strengths == sorted(strengths, reverse=True) and min(strengths) >= 0.3
+
+
+def test_auto_lists_every_pair_for_narrow_tables(client, matrix):
+    data = client.post("/api/correlation/analyze", headers=BYPASS, json={"data": matrix.tolist()}).json()["data"]
+    assert data["pairs"] == "all"
+    assert len(data["top_correlations"]) == 6
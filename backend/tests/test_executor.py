@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from functools import partial
+
+import pytest
+
+from modules import executor
+
+
+def test_full_queue_is_rejected_with_429(client, matrix):
+    limiter = executor.get_limiter("correlation")
+    capacity = limiter.concurrency + limiter.queue_depth
+    body = {"data": matrix.tolist()}
+    headers = {"X-Cache-Bypass": "1"}  # a cache hit would never reach the limiter
+    for _ in range(capacity):
+        limiter.admit()
+    try:
+        response = client.post("/api/correlation/analyze", json=body, headers=headers)
+    finally:
+        for _ in range(capacity):
+            limiter.release()
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.json() == {"success": False, "data": None,
+                               "error": "Too many pending 'correlation' requests, retry later"}
+    assert client.post("/api/correlation/analyze", json=body, headers=headers).status_code == 200
+    assert limiter.pending == 0
+
+
+def test_cancelled_call_keeps_its_slot_until_the_work_finishes():
+    async def scenario():
+        limiter = executor.EndpointLimiter("test", concurrency=1, queue_depth=0)
+        finish = threading.Event()
+        limiter.admit()
+        caller = asyncio.ensure_future(limiter.call(partial(asyncio.to_thread, finish.wait)))
+        await asyncio.sleep(0.05)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+
+        # The thread is still running, so the endpoint is still full.
+        assert limiter.running == 1
+        with pytest.raises(executor.QueueFullError):
+            limiter.admit()
+
+        finish.set()
+        for _ in range(100):
+            if not limiter.running:
+                break
+            await asyncio.sleep(0.01)
+        assert (limiter.running, limiter.pending) == (0, 0)
+        limiter.admit()
+        limiter.release()
+
+    asyncio.run(scenario())
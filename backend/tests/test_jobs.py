@@ -0,0 +1,50 @@
+import time
+
+from modules import jobs
+
+
+def _wait(client, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/api/jobs/{job_id}").json()["data"]
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_job_returns_the_endpoint_response(client, matrix):
+    body = {"data": matrix.tolist(), "method": "spearman"}
+    submitted = client.post("/api/jobs/correlation", json=body).json()["data"]
+    assert submitted["analysis"] == "correlation"
+
+    job = _wait(client, submitted["job_id"])
+    assert job["status"] == "completed"
+    assert job["progress"] == 1.0
+    result = client.get(f"/api/jobs/{job['job_id']}/result").json()
+    direct = client.post("/api/correlation/analyze", headers={"X-Cache-Bypass": "1"}, json=body).json()
+    assert result["success"]
+    assert result["data"]["top_correlations"] == direct["data"]["top_correlations"]
+    assert job["job_id"] in [j["job_id"] for j in client.get("/api/jobs").json()["data"]["jobs"]]
+
+
+def test_unknown_analysis_and_job_are_404(client):
+    assert client.post("/api/jobs/nope", json={}).status_code == 404
+    for method, path in (("get", "/api/jobs/missing"), ("get", "/api/jobs/missing/result"),
+                         ("delete", "/api/jobs/missing")):
+        assert getattr(client, method)(path).status_code == 404
+
+
+def test_invalid_job_body_is_422(client):
+    assert client.post("/api/jobs/correlation", json={"pairs": "some"}).status_code == 422
+
+
+def test_large_results_spill_to_disk(tmp_path):
+    store = jobs.JobStore(spill_dir=str(tmp_path), spill_threshold=16)
+    job = jobs.Job("correlation")
+    store.add(job)
+    result = {"success": True, "data": {"values": list(range(100))}, "error": None}
+    store.store_result(job, result)
+    assert job.summary()["result_spilled"]
+    assert store.load_result(job) == result
+    store.remove(job.id)
+    assert not list(tmp_path.iterdir())
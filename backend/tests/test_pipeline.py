@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def _upload(client, matrix):
+    header = "a,b,c,d\n"
+    rows = "\n".join(",".join(repr(v) for v in row) for row in matrix)
+    response = client.post("/api/data/upload", files={"file": ("pipeline.csv", header + rows, "text/csv")})
+    return response.json()["data"]["dataset_id"]
+
+
+def _run(client, body):
+    response = client.post("/api/pipeline/run", json={
+        **body,
+        "steps": [{"op": "impute"}, {"op": "scale", "method": "minmax"}],
+        "return_data": True,
+    })
+    data = response.json()["data"]
+    return [step["cached"] for step in data["steps"]], np.array(data["processed_data"])
+
+
+def test_stage_cache_is_keyed_on_dtype(client, matrix):
+    dataset_id = _upload(client, matrix)
+    body = {"dataset_id": dataset_id}
+
+    assert _run(client, {**body, "dtype": "float64"})[0] == [False, False]
+    assert _run(client, {**body, "dtype": "float64"})[0] == [True, True]
+    cached, single = _run(client, {**body, "dtype": "float32"})
+    assert cached == [False, False]  # never the float64 stages
+    assert _run(client, {**body, "dtype": "float32"})[0] == [True, True]
+    np.testing.assert_allclose(single, _run(client, {**body, "dtype": "float64"})[1], atol=1e-6)
+
+
+def test_inline_stage_cache_resumes_from_the_prefix(client, matrix):
+    body = {"data": (matrix + 7).tolist()}
+
+    assert _run(client, body)[0] == [False, False]
+    response = client.post("/api/pipeline/run", json={
+        **body, "steps": [{"op": "impute"}, {"op": "scale", "method": "standardize"}],
+    })
+    assert [step["cached"] for step in response.json()["data"]["steps"]] == [True, False]
+    assert _run(client, {**body, "dtype": "float32"})[0] == [False, False]
+
+
+def test_filtered_stage_does_not_pin_the_full_buffer(client):
+    from modules import pipeline
+
+    values = np.random.default_rng(2).normal(size=(2000, 4))
+    values[100:, 0] = np.nan  # drop 95% of the rows
+    pipeline.stages.clear()
+    response = client.post('/api/pipeline/run?steps=[{"op":"impute","method":"drop"}]', content=values.tobytes(),
+                           headers={"Content-Type": "application/octet-stream", "X-Array-Shape": "2000,4"})
+
+    assert response.json()["data"]["shape"] == [100, 4]
+    assert pipeline.stages.stats()["bytes"] <= 100 * 4 * 8 + 100 * 8
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from modules import quantum
+
+
+class SeededPool(quantum.EntropyPool):
+    """Pool whose draws come from a seeded generator instead of the simulator."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = np.random.default_rng(0)
+
+    def _draw(self, shots):
+        return self.rng.integers(0, 256, size=shots, dtype=np.uint8)
+
+
+@pytest.fixture
+def pool():
+    return SeededPool(capacity=4096, shots=64)
+
+
+@pytest.mark.parametrize("upper", [1, 2, 7, 100, 256, 1000, 70000])
+def test_integers_stay_in_range(pool, upper):
+    values = pool.integers(5000, upper)
+    assert len(values) == 5000
+    assert values.min() >= 0 and values.max() < upper
+    assert values.max() >= (upper - 1) * 0.9
+
+
+def test_rejection_sampling_is_unbiased(pool):
+    # 0..2 out of a byte masked to 2 bits: a modulo would favour 0.
+    counts = np.bincount(pool.integers(30000, 3), minlength=3)
+    assert counts.min() / counts.max() > 0.95
+
+
+def test_expanded_source_takes_one_seed_per_call(pool):
+    values = pool.integers(10000, 100, expanded=True)
+    assert values.max() < 100
+    assert pool.bytes_served <= 2 * quantum.SEED_BYTES
+    assert not np.array_equal(pool.expanded(64), pool.expanded(64))
+
+
+def test_generate_and_pool_endpoints(client):
+    response = client.post("/api/quantum/generate", json={"num_values": 50, "max_value": 10, "source": "expanded"})
+    data = response.json()["data"]
+    assert data["method"] == "qiskit_qrng_shake256"
+    assert len(data["values"]) == 50 and max(data["values"]) < 10
+
+    stats = client.get("/api/quantum/pool").json()["data"]
+    assert stats["bytes_served"] >= quantum.SEED_BYTES
@@ -0,0 +1,62 @@
+import joblib
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from modules import registry
+
+
+@pytest.fixture
+def problem(matrix):
+    return matrix[:, :3], matrix[:, 3] + 2 * matrix[:, 0]
+
+
+@pytest.fixture
+def stored(tmp_path):
+    models = registry.ModelRegistry(str(tmp_path), max_files=2)
+    models.put("abc123", LinearRegression().fit([[0.0], [1.0]], [0.0, 1.0]), {"kind": "regression"})
+    models.close()  # wait for the background write
+    return tmp_path
+
+
+def test_persisted_fit_is_registered_even_when_cached(client, problem):
+    X, y = problem
+    body = {"X": X.tolist(), "y": y.tolist(), "persist": True}
+    first = client.post("/api/regression/analyze", json=body)
+    model_id = first.json()["data"]["model_id"]
+    registry.models.delete(model_id)
+
+    second = client.post("/api/regression/analyze", json=body)
+    assert second.headers["X-Cache"] == "BYPASS"
+    assert second.json()["data"]["model_id"] == model_id
+    predicted = client.post("/api/regression/predict", json={"model_id": model_id, "X": X[:5].tolist()})
+    assert predicted.status_code == 200 and predicted.json()["success"]
+
+
+def test_fit_without_persist_keeps_nothing(client, problem):
+    X, y = problem
+    response = client.post("/api/regression/analyze", json={"X": X.tolist(), "y": y.tolist()})
+    assert response.json()["data"]["model_id"] is None
+
+
+def test_info_reads_metadata_without_loading(client, stored, monkeypatch):
+    monkeypatch.setattr(registry, "models", registry.ModelRegistry(str(stored)))
+    monkeypatch.setattr(joblib, "load", lambda *args: pytest.fail("estimator loaded for metadata"))
+
+    response = client.get("/api/models/abc123")
+    assert response.status_code == 200
+    assert response.json()["data"]["kind"] == "regression"
+    assert client.get("/api/models/missing1").status_code == 404
+
+
+def test_disk_tier_is_bounded_and_delete_removes_metadata(stored):
+    models = registry.ModelRegistry(str(stored), max_files=2)
+    assert models.get("abc123")[1]["kind"] == "regression"
+    for model_id in ("def456", "ghi789"):
+        models.put(model_id, LinearRegression(), {"kind": "regression"})
+    models.close()
+    assert len(list(stored.glob("*.joblib"))) == 2
+
+    models.delete("ghi789")
+    assert not (stored / "ghi789.joblib").exists()
+    assert not (stored / "ghi789.meta.json").exists()
+    assert len(list(stored.glob("*.meta.json"))) == 1
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import Lasso, Ridge
+
+
+@pytest.fixture
+def problem():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(500, 5)) * [1, 10, 0.1, 1, 3] + [0, 50, 0, -2, 0]
+    y = X @ [1.5, -0.2, 8.0, 0.0, 0.7] + 3 + rng.normal(scale=0.5, size=500)
+    return X, y
+
+
+def _fit(client, X, y, **params):
+    response = client.post("/api/regression/scalable", json={
+        "X": X.tolist(), "y": y.tolist(), "solver": "normal_equations", "chunk_rows": 64, **params,
+    })
+    data = response.json()["data"]
+    return np.array(data["coefficients"]), data["intercept"]
+
+
+def test_ridge_matches_sklearn(client, problem):
+    X, y = problem
+    coef, intercept = _fit(client, X, y, algorithm="ridge", alpha=10.0)
+    reference = Ridge(alpha=10.0).fit(X, y)
+
+    np.testing.assert_allclose(coef, reference.coef_, rtol=1e-8, atol=1e-10)
+    assert intercept == pytest.approx(reference.intercept_, rel=1e-8)
+
+
+def test_lasso_matches_sklearn(client, problem):
+    X, y = problem
+    coef, intercept = _fit(client, X, y, algorithm="lasso", alpha=0.1)
+    reference = Lasso(alpha=0.1, tol=1e-10, max_iter=100_000).fit(X, y)
+
+    np.testing.assert_allclose(coef, reference.coef_, atol=1e-5)
+    assert intercept == pytest.approx(reference.intercept_, abs=1e-4)
+    assert coef[3] == 0.0  # the irrelevant feature is dropped
+
+
+def test_linear_matches_sklearn(client, problem):
+    X, y = problem
+    coef, intercept = _fit(client, X, y)
+    reference = Ridge(alpha=0.0).fit(X, y)
+
+    np.testing.assert_allclose(coef, reference.coef_, rtol=1e-8)
+    assert intercept == pytest.approx(reference.intercept_, rel=1e-8)
+
+
+@pytest.mark.parametrize("algorithm", ["linear", "polynomial"])
+def test_alphas_without_a_penalty_are_rejected(client, problem, algorithm):
+    X, y = problem
+    response = client.post("/api/regression/scalable", json={
+        "X": X.tolist(), "y": y.tolist(), "algorithm": algorithm, "alphas": [0.1, 1.0],
+    })
+    assert response.status_code == 422
+    assert "alphas is only used by ridge and lasso" in response.text
+
+
+def test_all_cores_path_matches_serial(client, problem):
+    X, y = problem
+    params = {"algorithm": "ridge", "alphas": [0.1, 1.0, 10.0], "cv": 3}
+    serial = _fit(client, X, y, n_jobs=1, **params)
+    parallel = _fit(client, X, y, n_jobs=-1, **params)
+    np.testing.assert_allclose(parallel[0], serial[0], rtol=1e-10)
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def test_clustering_session_folds_batches(client):
+    rng = np.random.default_rng(1)
+    created = client.post("/api/clustering/sessions", json={"n_clusters": 2}).json()["data"]
+    session_id = created["session_id"]
+    for _ in range(3):
+        batch = np.vstack([rng.normal(0, 0.2, size=(20, 2)), rng.normal(4, 0.2, size=(20, 2))])
+        response = client.post(f"/api/clustering/sessions/{session_id}", json={"data": batch.tolist()})
+        labels = np.asarray(response.json()["data"]["labels"])
+        assert len(set(labels[:20])) == len(set(labels[20:])) == 1
+        assert labels[0] != labels[-1]
+
+    summary = client.get(f"/api/sessions/{session_id}").json()["data"]
+    assert (summary["kind"], summary["batches"], summary["samples_seen"]) == ("clustering", 3, 120)
+    assert client.delete(f"/api/sessions/{session_id}").status_code == 200
+    assert client.get(f"/api/sessions/{session_id}").status_code == 404
+
+
+def test_anomaly_session_warms_up_then_scores(client, matrix):
+    session_id = client.post("/api/anomaly/sessions", json={
+        "window_size": 150, "min_samples": 100, "n_estimators": 20,
+    }).json()["data"]["session_id"]
+
+    first = client.post(f"/api/anomaly/sessions/{session_id}", json={"data": matrix[:50].tolist()}).json()["data"]
+    assert first["warming_up"] and first["anomalies"] is None
+    second = client.post(f"/api/anomaly/sessions/{session_id}", json={"data": matrix[50:].tolist()}).json()["data"]
+    assert second["refitted"] and not second["warming_up"]
+    assert [row["index"] for row in second["anomalies"]] == list(range(50, 200))
+    client.delete(f"/api/sessions/{session_id}")
+
+
+def test_session_kind_must_match(client):
+    session_id = client.post("/api/anomaly/sessions", json={}).json()["data"]["session_id"]
+    response = client.post(f"/api/clustering/sessions/{session_id}", json={"data": [[0.0, 1.0]]})
+    assert response.status_code == 404
+    client.delete(f"/api/sessions/{session_id}")
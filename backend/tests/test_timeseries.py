@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+BYPASS = {"X-Cache-Bypass": "1"}
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(2)
+    t = np.arange(48)
+    slopes = rng.uniform(-1, 1, size=(30, 1))
+    return 5 + slopes * t + 2 * np.sin(2 * np.pi * t / 12) + rng.normal(0, 0.1, size=(30, 48))
+
+
+def test_batch_linear_model_matches_single_series(client, series):
+    body = {"data": series.tolist(), "model": "linear", "forecast_steps": 5, "block_size": 7, "n_jobs": -1}
+    batch = client.post("/api/timeseries/batch", headers=BYPASS, json=body).json()["data"]
+    assert (batch["n_series"], batch["length"], batch["model"]) == (30, 48, "linear")
+    assert np.asarray(batch["forecast"]).shape == (30, 5)
+
+    for row in (0, 13, 29):
+        single = client.post("/api/timeseries/analyze", headers=BYPASS, json={
+            "data": series[row].tolist(), "forecast_steps": 5,
+        }).json()["data"]
+        assert batch["slope"][row] == pytest.approx(single["statistics"]["trend_slope"])
+        assert batch["intercept"][row] == pytest.approx(single["statistics"]["trend_intercept"])
+        assert batch["forecast"][row] == pytest.approx(single["forecast"])
+
+
+def test_batch_blocks_do_not_change_the_result(client, series):
+    body = {"data": series.tolist(), "seasonal_period": 12, "return_components": True}
+    whole = client.post("/api/timeseries/batch", headers=BYPASS, json=body).json()["data"]
+    blocked = client.post("/api/timeseries/batch", headers=BYPASS, json={**body, "block_size": 4, "n_jobs": 3}).json()["data"]
+    assert whole["model"] == "holt_winters"
+    assert np.asarray(whole["seasonal_profile"]).shape == (30, 12)
+    assert np.asarray(whole["trend"]).shape == series.shape
+    for key in ("forecast", "alpha", "seasonal_profile", "rolling_std"):
+        np.testing.assert_allclose(blocked[key], whole[key])
+
+
+def test_batch_rejects_short_series(client):
+    result = client.post("/api/timeseries/batch", headers=BYPASS, json={"data": [[1.0, 2.0], [3.0, 4.0]]}).json()
+    assert not result["success"]
+    assert "at least 3 points" in result["error"]
+
+
+def test_single_point_series_has_a_flat_trend(client):
+    data = client.post("/api/timeseries/analyze", headers=BYPASS, json={"data": [3.5], "forecast_steps": 2}).json()["data"]
+    assert data["statistics"]["trend_slope"] == 0.0
+    assert data["forecast"] == [3.5, 3.5]
@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+
+from modules import transport
+
+URL = "/api/pipeline/run?return_data=true"
+
+
+def test_raw_round_trip(client, matrix):
+    response = client.post(URL, content=matrix.tobytes(), headers={
+        "Content-Type": transport.RAW_FLOAT64,
+        "X-Array-Shape": "200,4",
+        "Accept": transport.RAW_FLOAT64,
+    })
+
+    assert response.status_code == 200
+    assert response.headers["X-Array-Shape"] == "200,4"
+    assert response.headers["X-Array-Dtype"] == "float64"
+    assert json.loads(response.headers["X-Result-Metadata"])["data"]["shape"] == [200, 4]
+    decoded = transport.decode_matrix(response.content, transport.RAW_FLOAT64, response.headers["X-Array-Shape"])
+    np.testing.assert_array_equal(decoded, matrix)
+
+
+def test_raw_float32_stays_float32(client, matrix):
+    values = matrix.astype(np.float32)
+    response = client.post(URL + "&dtype=float32", content=values.tobytes(), headers={
+        "Content-Type": transport.RAW_FLOAT64,
+        "X-Array-Shape": "200,4",
+        "X-Array-Dtype": "float32",
+        "Accept": transport.RAW_FLOAT64,
+    })
+
+    assert response.headers["X-Array-Dtype"] == "float32"
+    decoded = transport.decode_matrix(response.content, transport.RAW_FLOAT64, "200,4", "float32")
+    np.testing.assert_array_equal(decoded, values)
+
+
+def test_raw_shape_mismatch_is_415(client, matrix):
+    response = client.post(URL, content=matrix.tobytes(), headers={
+        "Content-Type": transport.RAW_FLOAT64, "X-Array-Shape": "3,4",
+    })
+
+    assert response.status_code == 415
+    assert response.json()["success"] is False
+
+
+def test_arrow_round_trip(client, matrix):
+    pa = pytest.importorskip("pyarrow")
+    column = pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), matrix.shape[1])
+    table = pa.table({"X": column})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    response = client.post(URL, content=sink.getvalue().to_pybytes(), headers={
+        "Content-Type": transport.ARROW_STREAM,
+        "Accept": transport.ARROW_STREAM,
+    })
+
+    assert response.status_code == 200
+    result = pa.ipc.open_stream(pa.py_buffer(response.content)).read_all()
+    assert json.loads(result.schema.metadata[b"result"])["data"]["rows_removed"] == 0
+    np.testing.assert_array_equal(transport.decode_matrix(response.content, transport.ARROW_STREAM), matrix)